@@ -18,3 +18,106 @@ AUTO_IMPORT_ENABLED = os.getenv("AUTO_IMPORT_ENABLED", "true").lower() == "true"
 
 # Quota disque : bloquer uploads/téléchargements au-delà de ce % d'utilisation (0 = désactivé)
 MAX_DISK_USAGE_PCT = int(os.getenv("MAX_DISK_USAGE_PCT", "90"))
+
+# Déduplication par contenu : off / hardlink / reflink / auto (reflink si possible, sinon hardlink)
+DEDUP_MODE = os.getenv("DEDUP_MODE", "off").lower()
+
+# Vérification planifiée des mises à jour amont (heures, 0 = désactivée)
+UPDATE_CHECK_INTERVAL_HOURS = int(os.getenv("UPDATE_CHECK_INTERVAL_HOURS", "0"))
+UPDATE_CHECK_CONCURRENCY = int(os.getenv("UPDATE_CHECK_CONCURRENCY", "8"))
+
+# Cache DNS du garde-fou SSRF (secondes)
+DNS_CACHE_TTL = int(os.getenv("DNS_CACHE_TTL", "300"))
+DNS_CACHE_MAX_ENTRIES = int(os.getenv("DNS_CACHE_MAX_ENTRIES", "1024"))
+
+# Scrubber d'intégrité : re-vérification tous les N jours (0 = désactivé), budget I/O, pause sous charge
+SCRUB_INTERVAL_DAYS = int(os.getenv("SCRUB_INTERVAL_DAYS", "0"))
+SCRUB_BYTES_PER_SEC = int(os.getenv("SCRUB_BYTES_PER_SEC", str(20 * 1024 * 1024)))
+SCRUB_MAX_ACTIVE_STREAMS = int(os.getenv("SCRUB_MAX_ACTIVE_STREAMS", "2"))
+
+# Manifeste de hachés par bloc (arbre de Merkle) calculé à l'ingestion
+MANIFEST_BLOCK_SIZE = int(os.getenv("MANIFEST_BLOCK_SIZE", str(4 * 1024 * 1024)))
+
+# Stockage froid (zstd seekable) : niveau de compression et taille des trames
+COLD_STORAGE_LEVEL = int(os.getenv("COLD_STORAGE_LEVEL", "9"))
+COLD_STORAGE_FRAME_SIZE = int(os.getenv("COLD_STORAGE_FRAME_SIZE", str(4 * 1024 * 1024)))
+
+# Racines de stockage supplémentaires (séparées par des virgules) et politique de placement
+ISO_STORAGE_EXTRA_PATHS = [p.strip() for p in os.getenv("ISO_STORAGE_EXTRA_PATHS", "").split(",") if p.strip()]
+STORAGE_ROOTS = [ISO_STORAGE_PATH] + [p for p in ISO_STORAGE_EXTRA_PATHS if p != ISO_STORAGE_PATH]
+STORAGE_PLACEMENT = os.getenv("STORAGE_PLACEMENT", "most_free").lower()  # most_free / round_robin / category
+# Épinglage par catégorie pour STORAGE_PLACEMENT=category, ex. "windows=/mnt/disk2,linux=/mnt/disk3"
+STORAGE_CATEGORY_ROOTS = {
+    k.strip(): v.strip() for k, v in (
+        item.split("=", 1) for item in os.getenv("STORAGE_CATEGORY_ROOTS", "").split(",") if "=" in item
+    )
+}
+# Rééquilibrage en arrière-plan entre racines (minutes, 0 = désactivé)
+STORAGE_REBALANCE_INTERVAL_MINUTES = int(os.getenv("STORAGE_REBALANCE_INTERVAL_MINUTES", "0"))
+STORAGE_REBALANCE_THRESHOLD_PCT = int(os.getenv("STORAGE_REBALANCE_THRESHOLD_PCT", "10"))
+
+# Politique d'I/O (posix_fadvise) : readahead pour le service, lecture « sans trace » pour hachage/scrub
+IO_FADVISE_ENABLED = os.getenv("IO_FADVISE_ENABLED", "true").lower() == "true"
+IO_STREAM_READ_SIZE = int(os.getenv("IO_STREAM_READ_SIZE", str(1024 * 1024)))
+IO_STREAM_READAHEAD = int(os.getenv("IO_STREAM_READAHEAD", str(8 * 1024 * 1024)))
+IO_SCAN_READ_SIZE = int(os.getenv("IO_SCAN_READ_SIZE", str(4 * 1024 * 1024)))
+IO_DROP_BEHIND_BYTES = int(os.getenv("IO_DROP_BEHIND_BYTES", str(32 * 1024 * 1024)))
+IO_HOT_WINDOW_SECONDS = int(os.getenv("IO_HOT_WINDOW_SECONDS", "3600"))  # image servie récemment : pas de DONTNEED
+
+# Cache mémoire LRU des petites images très demandées (/files) ; 0 = désactivé
+FILE_CACHE_MAX_BYTES = int(os.getenv("FILE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+FILE_CACHE_MAX_FILE_BYTES = int(os.getenv("FILE_CACHE_MAX_FILE_BYTES", str(64 * 1024 * 1024)))
+FILE_CACHE_ADMIT_AFTER = int(os.getenv("FILE_CACHE_ADMIT_AFTER", "2"))  # mis en cache à la N-ième demande
+
+# Admission des flux /files : limites globale et par client (0 = illimité), pool d'I/O dédié
+FILES_MAX_STREAMS = int(os.getenv("FILES_MAX_STREAMS", "64"))
+FILES_MAX_STREAMS_PER_CLIENT = int(os.getenv("FILES_MAX_STREAMS_PER_CLIENT", "8"))
+FILES_RETRY_AFTER = int(os.getenv("FILES_RETRY_AFTER", "5"))  # secondes, en-tête Retry-After des 503
+FILE_IO_WORKERS = int(os.getenv("FILE_IO_WORKERS", "16"))
+
+# Statistiques d'accès /files : compteurs en mémoire, écrits en base par lots (secondes)
+ACCESS_LOG_FLUSH_INTERVAL = int(os.getenv("ACCESS_LOG_FLUSH_INTERVAL", "30"))
+
+# SQLite : WAL + écrivain unique qui regroupe les petites mises à jour (progression, statuts)
+DB_WRITE_BATCH_MS = int(os.getenv("DB_WRITE_BATCH_MS", "100"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "10000"))
+# Maintenance automatique (PRAGMA optimize, vacuum incrémental, checkpoint WAL) toutes les N heures (0 = désactivée)
+DB_MAINTENANCE_INTERVAL_HOURS = int(os.getenv("DB_MAINTENANCE_INTERVAL_HOURS", "24"))
+
+# Plusieurs workers uvicorn : les tâches de fond singleton ne tournent que dans le worker
+# qui tient ce verrou fcntl ; les autres retentent toutes les LEADER_RETRY_SECONDS
+LEADER_LOCK_PATH = os.getenv("LEADER_LOCK_PATH", DB_PATH + ".leader")
+LEADER_RETRY_SECONDS = int(os.getenv("LEADER_RETRY_SECONDS", "5"))
+# Flux /files actifs de chaque worker (fichier verrouillé par fcntl) : limites appliquées tous workers confondus
+FILES_STREAMS_STATE_PATH = os.getenv("FILES_STREAMS_STATE_PATH", LEADER_LOCK_PATH + ".streams")
+# Réservations d'espace de chaque worker : le quota MAX_DISK_USAGE_PCT compte celles de tous les workers
+STORAGE_RESERVATIONS_STATE_PATH = os.getenv("STORAGE_RESERVATIONS_STATE_PATH", LEADER_LOCK_PATH + ".reservations")
+
+# Miroirs : sonde (petite requête Range) avant chaque téléchargement, bascule en cours de transfert
+MIRROR_PROBE_BYTES = int(os.getenv("MIRROR_PROBE_BYTES", "65536"))
+MIRROR_PROBE_TIMEOUT = float(os.getenv("MIRROR_PROBE_TIMEOUT", "5"))
+# Un miroir muet pendant ce délai (secondes) est considéré comme bloqué : on passe au suivant
+DOWNLOAD_READ_TIMEOUT = float(os.getenv("DOWNLOAD_READ_TIMEOUT", "60"))
+
+# Moteur de téléchargement : chien de garde de débit, nouvelles tentatives, tampon d'écriture
+DOWNLOAD_MIN_SPEED = int(os.getenv("DOWNLOAD_MIN_SPEED", "16384"))  # octets/s
+DOWNLOAD_STALL_WINDOW = float(os.getenv("DOWNLOAD_STALL_WINDOW", "30"))
+DOWNLOAD_MAX_RETRIES = int(os.getenv("DOWNLOAD_MAX_RETRIES", "5"))
+DOWNLOAD_RETRY_BASE_DELAY = float(os.getenv("DOWNLOAD_RETRY_BASE_DELAY", "2"))
+DOWNLOAD_RETRY_MAX_DELAY = float(os.getenv("DOWNLOAD_RETRY_MAX_DELAY", "60"))
+# Les écritures regroupent environ ce délai (secondes) de débit observé
+DOWNLOAD_WRITE_INTERVAL = float(os.getenv("DOWNLOAD_WRITE_INTERVAL", "0.25"))
+
+# Import côté serveur (POST /api/bulk/import/path) : répertoires sources autorisés
+# (séparés par des virgules, ex. un ancien partage NFS monté) et copies simultanées
+IMPORT_SOURCE_PATHS = [p.strip() for p in os.getenv("IMPORT_SOURCE_PATHS", "").split(",") if p.strip()]
+IMPORT_COPY_CONCURRENCY = int(os.getenv("IMPORT_COPY_CONCURRENCY", "2"))
+
+# Cache mémoire du catalogue (lectures /api/isos, /api/browse), invalidé par le journal catalog_changes
+CATALOG_CACHE_ENABLED = os.getenv("CATALOG_CACHE_ENABLED", "true").lower() == "true"
+CATALOG_CACHE_QUERIES = int(os.getenv("CATALOG_CACHE_QUERIES", "256"))  # listes filtrées mémorisées
+CATALOG_CHANGES_KEEP = int(os.getenv("CATALOG_CHANGES_KEEP", "10000"))  # au-delà : rechargement complet
+# Réponses JSON du catalogue compressées (br si brotli est installé, sinon gzip) au-delà de
+# cette taille en octets ; 0 = jamais
+CATALOG_COMPRESS_MIN_BYTES = int(os.getenv("CATALOG_COMPRESS_MIN_BYTES", "16384"))
+CATALOG_COMPRESS_LEVEL = int(os.getenv("CATALOG_COMPRESS_LEVEL", "5"))
@@ -1,16 +1,34 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import declarative_base, sessionmaker
-from app.config import DB_PATH, ISO_STORAGE_PATH
+from app.config import DB_BUSY_TIMEOUT_MS, DB_PATH, STORAGE_ROOTS
 
-os.makedirs(ISO_STORAGE_PATH, exist_ok=True)
+for _root in STORAGE_ROOTS:
+    os.makedirs(_root, exist_ok=True)
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
 engine = create_engine(
     f"sqlite:///{DB_PATH}",
-    connect_args={"check_same_thread": False},
+    connect_args={"check_same_thread": False, "timeout": DB_BUSY_TIMEOUT_MS / 1000},
 )
 
+
+@event.listens_for(engine, "connect")
+def _sqlite_pragmas(dbapi_conn, _record):
+    """
+    WAL : les lecteurs ne bloquent plus l'écrivain (et inversement).
+    auto_vacuum=INCREMENTAL ne s'applique sans VACUUM qu'à une base encore vide ; une base
+    existante est convertie à la demande (db_maintenance.convert_auto_vacuum).
+    """
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")  # durable au checkpoint, suffisant en WAL
+    cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-16000")  # ~16 Mo
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -38,6 +56,19 @@ def _migrate():
         ("upstream_sha256", "TEXT"),
         ("update_available", "INTEGER"),
         ("last_update_check", "DATETIME"),
+        ("last_verified_at", "DATETIME"),
+        ("merkle_root", "TEXT"),
+        ("manifest_block_size", "INTEGER"),
+        ("storage_mode", "TEXT DEFAULT 'raw'"),
+        ("stored_bytes", "INTEGER"),
+        ("mirror_urls", "TEXT"),
+        ("active_mirror", "TEXT"),
+        ("source_codec", "TEXT"),
+        ("source_sha256", "TEXT"),
+        ("source_size_bytes", "INTEGER"),
+    ]
+    new_indexes = [
+        ("ix_isos_sha256", "isos", "sha256"),
     ]
     with engine.connect() as conn:
         result = conn.execute(__import__("sqlalchemy").text("PRAGMA table_info(isos)"))
@@ -48,3 +79,61 @@ def _migrate():
                     f"ALTER TABLE isos ADD COLUMN {col} {col_type}"
                 ))
                 conn.commit()
+        for name, table, col in new_indexes:
+            conn.execute(__import__("sqlalchemy").text(
+                f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({col})"
+            ))
+        conn.commit()
+        # Journal des modifications du catalogue, pour l'invalidation fine de catalog_cache
+        for event_name, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            conn.execute(__import__("sqlalchemy").text(
+                f"CREATE TRIGGER IF NOT EXISTS trg_isos_{event_name.lower()}_changes AFTER {event_name} ON isos "
+                f"BEGIN INSERT INTO catalog_changes (iso_id) VALUES ({row}.id); END"
+            ))
+        conn.commit()
+        # Index des tags (iso_tags), rempli depuis isos.tags à la création des triggers
+        text = __import__("sqlalchemy").text
+        had_triggers = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_isos_insert_tags'"
+        )).first()
+        insert_tags = (
+            "INSERT OR IGNORE INTO iso_tags (tag, iso_id) SELECT trim(j.value), {id} "
+            "FROM json_each({tags}) j WHERE j.type IN ('text', 'integer', 'real') AND trim(j.value) != ''"
+        )
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS trg_isos_insert_tags AFTER INSERT ON isos WHEN NEW.tags IS NOT NULL "
+            f"BEGIN {insert_tags.format(id='NEW.id', tags=_tags_json('NEW.tags'))}; END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS trg_isos_update_tags AFTER UPDATE OF tags ON isos "
+            "WHEN NEW.tags IS NOT OLD.tags BEGIN DELETE FROM iso_tags WHERE iso_id = OLD.id; "
+            f"{insert_tags.format(id='NEW.id', tags=_tags_json('NEW.tags'))}; END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS trg_isos_delete_tags AFTER DELETE ON isos "
+            "BEGIN DELETE FROM iso_tags WHERE iso_id = OLD.id; END"
+        ))
+        if not had_triggers:
+            conn.execute(text("DELETE FROM iso_tags"))
+            conn.execute(text(
+                "INSERT OR IGNORE INTO iso_tags (tag, iso_id) SELECT trim(j.value), isos.id "
+                f"FROM isos, json_each({_tags_json('isos.tags')}) j "
+                "WHERE j.type IN ('text', 'integer', 'real') AND trim(j.value) != ''"
+            ))
+        conn.commit()
+
+
+def _tags_json(column: str) -> str:
+    """
+    Expression SQL : isos.tags en tableau JSON pour json_each. Tableau JSON tel quel,
+    sinon liste séparée par des virgules (ou des retours à la ligne) convertie ;
+    NULL (aucun tag) si la conversion n'est pas du JSON valide.
+    """
+    csv = (
+        f"'[\"' || replace(replace(replace(replace(replace(replace({column}, '\\', '\\\\'), "
+        f"'\"', '\\\"'), char(9), ' '), char(10), ','), char(13), ','), ',', '\",\"') || '\"]'"
+    )
+    return (
+        f"CASE WHEN json_valid({column}) AND json_type({column}) = 'array' THEN {column} "
+        f"WHEN json_valid({csv}) THEN {csv} END"
+    )
@@ -10,10 +10,17 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from app.auth import BasicAuthMiddleware
-from app.config import ISO_STORAGE_PATH, BASE_URL, AUTH_USERNAME, AUTH_PASSWORD
+from app.config import STORAGE_ROOTS, BASE_URL, AUTH_USERNAME, AUTH_PASSWORD
 from app.database import init_db
-from app.routes import isos, downloads, maintenance
+from app.routes import isos, downloads, maintenance, bulk, files
+from app.services import db_writer
+from app.services.access_log import access_log_loop
+from app.services.db_maintenance import db_maintenance_loop
 from app.services.file_watcher import file_watcher_loop
+from app.services.leader import run_as_leader, startup_lock
+from app.services.scrub_service import scrub_loop
+from app.services.storage_service import adopt_legacy_cold, rebalance_loop
+from app.services.update_check_service import update_check_loop
 
 
 def _file_hash(path: str) -> str:
@@ -30,16 +37,34 @@ def _file_hash(path: str) -> str:
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    os.makedirs(ISO_STORAGE_PATH, exist_ok=True)
-    init_db()
-    # Lancer le watcher en tâche de fond
-    task = asyncio.create_task(file_watcher_loop())
+    for root in STORAGE_ROOTS:
+        os.makedirs(root, exist_ok=True)
+    with startup_lock():
+        init_db()
+        adopt_legacy_cold()
+    # Tâches de fond singleton (watcher, vérification planifiée des mises à jour, scrubber,
+    # rééquilibrage, maintenance SQLite) : dans un seul worker, le leader.
+    # Les statistiques d'accès restent par worker (chacun écrit ses propres compteurs).
+    tasks = [
+        asyncio.create_task(run_as_leader([
+            file_watcher_loop,
+            update_check_loop,
+            scrub_loop,
+            rebalance_loop,
+            db_maintenance_loop,
+        ])),
+        asyncio.create_task(access_log_loop()),
+    ]
     yield
-    task.cancel()
-    try:
-        await task
-    except asyncio.CancelledError:
-        pass
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    # Après l'arrêt des tâches : écrire ce qu'elles ont encore mis en file
+    db_writer.stop()
 
 
 app = FastAPI(title="IsoStack", lifespan=lifespan)
@@ -55,6 +80,8 @@ app.add_middleware(
 app.include_router(isos.router)
 app.include_router(downloads.router)
 app.include_router(maintenance.router)
+app.include_router(bulk.router)
+app.include_router(files.router)
 
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
@@ -73,67 +100,3 @@ async def index(request: Request):
         "css_ver": _CSS_VER,
         "js_ver": _JS_VER,
     })
-
-
-@app.get("/files/{filename}")
-async def serve_file(filename: str, request: Request):
-    safe_name = os.path.basename(filename)
-    file_path = os.path.realpath(os.path.join(ISO_STORAGE_PATH, safe_name))
-    storage_root = os.path.realpath(ISO_STORAGE_PATH)
-    if not file_path.startswith(storage_root + os.sep) and file_path != storage_root:
-        from fastapi.responses import JSONResponse
-        return JSONResponse(status_code=400, content={"detail": "Invalid filename"})
-    if not os.path.exists(file_path):
-        from fastapi.responses import JSONResponse
-        return JSONResponse(status_code=404, content={"detail": "File not found"})
-
-    file_size = os.path.getsize(file_path)
-    range_header = request.headers.get("Range")
-
-    if range_header:
-        try:
-            range_val = range_header.strip().replace("bytes=", "")
-            start_str, end_str = range_val.split("-")
-            start = int(start_str) if start_str else 0
-            end = int(end_str) if end_str else file_size - 1
-            end = min(end, file_size - 1)
-            chunk_size = end - start + 1
-
-            def iter_file():
-                with open(file_path, "rb") as f:
-                    f.seek(start)
-                    remaining = chunk_size
-                    while remaining > 0:
-                        read_size = min(1024 * 1024, remaining)
-                        data = f.read(read_size)
-                        if not data:
-                            break
-                        yield data
-                        remaining -= len(data)
-
-            headers = {
-                "Content-Range": f"bytes {start}-{end}/{file_size}",
-                "Accept-Ranges": "bytes",
-                "Content-Length": str(chunk_size),
-                "Content-Type": "application/octet-stream",
-            }
-            from fastapi.responses import StreamingResponse
-            return StreamingResponse(iter_file(), status_code=206, headers=headers)
-        except Exception:
-            pass
-
-    def iter_full():
-        with open(file_path, "rb") as f:
-            while chunk := f.read(1024 * 1024):
-                yield chunk
-
-    from fastapi.responses import StreamingResponse
-    return StreamingResponse(
-        iter_full(),
-        media_type="application/octet-stream",
-        headers={
-            "Content-Length": str(file_size),
-            "Accept-Ranges": "bytes",
-            "Content-Disposition": f'attachment; filename="{safe_name}"',
-        },
-    )
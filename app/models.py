@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Boolean, Column, DateTime, Integer, Text
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, LargeBinary, Text
 from app.database import Base
 
 
@@ -16,17 +16,17 @@ class ISO(Base):
     version = Column(Text)
     architecture = Column(Text)
     size_bytes = Column(Integer, default=0)
-    sha256 = Column(Text)
+    sha256 = Column(Text, index=True)
     sha512 = Column(Text)
     md5 = Column(Text)
     expected_checksum = Column(Text)
     checksum_type = Column(Text)
     checksum_verified = Column(Boolean)
     description = Column(Text)
-    tags = Column(Text)  # JSON array stored as string
+    tags = Column(Text)  # JSON array stored as string (ou liste séparée par des virgules) ; indexé dans iso_tags
     source_url = Column(Text)
     add_method = Column(Text)  # "url" or "upload"
-    status = Column(Text, default="available")  # available / downloading / uploading / verifying / error
+    status = Column(Text, default="available")  # available / downloading / uploading / verifying / error / missing / corrupt
     download_progress = Column(Integer, default=0)
     error_message = Column(Text)
     file_path = Column(Text)
@@ -35,5 +35,101 @@ class ISO(Base):
     upstream_sha256 = Column(Text)
     update_available = Column(Boolean)
     last_update_check = Column(DateTime)
+    last_verified_at = Column(DateTime)
+    merkle_root = Column(Text)
+    manifest_block_size = Column(Integer)
+    storage_mode = Column(Text, default="raw")  # raw / compressing / zstd / thawing
+    stored_bytes = Column(Integer)  # taille sur disque en stockage froid
+    mirror_urls = Column(Text)  # JSON array : miroirs de source_url, par ordre de préférence
+    active_mirror = Column(Text)  # miroir retenu pour le dernier téléchargement
+    source_codec = Column(Text)  # gzip / xz / zstd : livrée compressée, décompressée à l'ingestion
+    source_sha256 = Column(Text)  # SHA256 du fichier compressé d'origine (vérifications de mise à jour)
+    source_size_bytes = Column(Integer)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ChecksumFile(Base):
+    """Fichier de checksums amont (SHA256SUMS…) mis en cache, avec validateurs HTTP."""
+    __tablename__ = "checksum_files"
+
+    url = Column(Text, primary_key=True)
+    etag = Column(Text)
+    last_modified = Column(Text)
+    digests = Column(Text)  # JSON {filename: sha256}
+    fetched_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Job(Base):
+    """Opération groupée exécutée en arrière-plan (bulk update/delete/import/verify)."""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(Text, nullable=False)
+    status = Column(Text, default="queued")  # queued / running / done / error
+    total = Column(Integer, default=0)
+    done = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    result = Column(Text)  # JSON
+    error_message = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ISOManifest(Base):
+    """Hachés par bloc d'une image (feuilles de l'arbre de Merkle dont la racine est ISO.merkle_root)."""
+    __tablename__ = "iso_manifests"
+
+    iso_id = Column(Integer, primary_key=True)
+    block_size = Column(Integer, nullable=False)
+    leaves = Column(LargeBinary, nullable=False)  # block_count × 32 octets
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ISOAccessStats(Base):
+    """Compteurs d'accès /files d'une image, alimentés par lots depuis access_log."""
+    __tablename__ = "iso_access_stats"
+
+    iso_id = Column(Integer, primary_key=True)
+    requests = Column(Integer, default=0)
+    bytes_served = Column(Integer, default=0)
+    full_downloads = Column(Integer, default=0)  # téléchargements complets du fichier entier
+    last_access_at = Column(DateTime)
+
+
+class MirrorStats(Base):
+    """Latence et débit observés par miroir (hôte), pour classer les miroirs des prochains téléchargements."""
+    __tablename__ = "mirror_stats"
+
+    host = Column(Text, primary_key=True)
+    latency_ms = Column(Integer)      # moyenne glissante (EWMA) des sondes
+    throughput_bps = Column(Integer)  # moyenne glissante (EWMA) des transferts
+    successes = Column(Integer, default=0)
+    failures = Column(Integer, default=0)
+    last_used_at = Column(DateTime)
+
+
+class CatalogChange(Base):
+    """
+    Journal des lignes d'isos modifiées, alimenté par des triggers SQLite (database._migrate) :
+    le cache du catalogue (catalog_cache) ne recharge que ces lignes, quel que soit le processus
+    ou le chemin d'écriture. Élagué par la maintenance SQLite.
+    """
+    __tablename__ = "catalog_changes"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq = Column(Integer, primary_key=True)
+    iso_id = Column(Integer, nullable=False)
+
+
+class ISOTag(Base):
+    """
+    Index normalisé de isos.tags (un tag par ligne, espaces retirés, casse ignorée),
+    tenu à jour par des triggers SQLite (database._migrate) pour tous les chemins d'écriture.
+    Filtre exact par tag et nuage de tags sans parcourir isos.
+    """
+    __tablename__ = "iso_tags"
+    __table_args__ = (Index("ix_iso_tags_iso_id", "iso_id"), {"sqlite_with_rowid": False})
+
+    tag = Column(Text(collation="NOCASE"), primary_key=True)
+    iso_id = Column(Integer, primary_key=True)
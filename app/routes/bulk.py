@@ -0,0 +1,244 @@
+"""
+Opérations groupées : une requête, une transaction, un job suivi via /api/jobs/{id}.
+Les modifications, suppressions et imports sont appliqués dans une seule transaction ;
+les calculs de hash (import, vérification) sont ensuite traités en file, un fichier à la fois.
+L'export / import NDJSON du catalogue (catalog_io) travaille en flux, par lots de transactions.
+L'import par chemin (path_import) copie depuis des répertoires locaux autorisés.
+"""
+from datetime import datetime
+from typing import List, Literal
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, get_db
+from app.models import ISO, Job
+from app.schemas import BulkIds, BulkImport, BulkUpdate, JobResponse, PathImport
+from app.services.catalog_io import import_ndjson, iter_catalog_ndjson, iter_lines
+from app.services.db_writer import flushed
+from app.services.iso_service import hash_imported, new_import_entry, remove_file, verify_file
+from app.services.job_service import create_job, update_job
+from app.services.access_log import delete_access_stats
+from app.services.manifest_service import delete_manifest
+from app.services.path_import import list_sources, new_copy_entry, resolve_source, run_path_import, source_dirs
+
+router = APIRouter(prefix="/api", tags=["bulk"])
+
+
+def _run_update(job_id: int, ids: List[int], changes: dict):
+    db = SessionLocal()
+    try:
+        update_job(job_id, status="running")
+        found = [row.id for row in db.query(ISO.id).filter(ISO.id.in_(ids)).all()]
+        if found and changes:
+            changes["updated_at"] = datetime.utcnow()
+            db.query(ISO).filter(ISO.id.in_(found)).update(changes, synchronize_session=False)
+        db.commit()
+        missing = sorted(set(ids) - set(found))
+        update_job(job_id, done=len(found), failed=len(missing), status="done",
+                   result={"updated": found, "not_found": missing})
+    except Exception as e:
+        db.rollback()
+        update_job(job_id, status="error", error_message=str(e))
+    finally:
+        db.close()
+
+
+def _run_delete(job_id: int, ids: List[int]):
+    db = SessionLocal()
+    try:
+        update_job(job_id, status="running")
+        targets = [(row.id, row.filename, row.storage_mode)
+                   for row in db.query(ISO.id, ISO.filename, ISO.storage_mode).filter(ISO.id.in_(ids)).all()]
+        delete_manifest(db, [t[0] for t in targets])
+        delete_access_stats(db, [t[0] for t in targets])
+        db.query(ISO).filter(ISO.id.in_([t[0] for t in targets])).delete(synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        update_job(job_id, status="error", error_message=str(e))
+        return
+    finally:
+        db.close()
+
+    # Fichiers supprimés après le commit : un rollback ne peut pas perdre de données
+    reclaimed = 0
+    for _, filename, storage_mode in targets:
+        try:
+            reclaimed += remove_file(filename, storage_mode)
+        except OSError:
+            pass
+    deleted = [t[0] for t in targets]
+    missing = sorted(set(ids) - set(deleted))
+    update_job(job_id, done=len(deleted), failed=len(missing), status="done",
+               result={"deleted": deleted, "not_found": missing, "reclaimed_bytes": reclaimed})
+
+
+async def _run_import(job_id: int, files: List[dict]):
+    db = SessionLocal()
+    rejected, seen, isos = [], set(), []
+    try:
+        update_job(job_id, status="running")
+        for item in files:
+            try:
+                if item["filename"] in seen:
+                    raise HTTPException(status_code=409, detail="File already tracked")
+                isos.append(new_import_entry(db, item["filename"], item))
+                seen.add(item["filename"])
+            except HTTPException as e:
+                rejected.append({"filename": item["filename"], "detail": e.detail})
+        db.commit()
+        iso_ids = [iso.id for iso in isos]
+    except Exception as e:
+        db.rollback()
+        update_job(job_id, status="error", error_message=str(e))
+        return
+    finally:
+        db.close()
+
+    update_job(job_id, failed=len(rejected), result={"imported": iso_ids, "rejected": rejected})
+    await _hash_queue(job_id, iso_ids)
+
+
+async def _hash_queue(job_id: int, iso_ids: List[int]):
+    """Calcule les SHA256 des entrées importées, un fichier à la fois, puis termine le job."""
+    for iso_id in iso_ids:
+        ok = await hash_imported(iso_id)
+        update_job(job_id, done=1 if ok else 0, failed=0 if ok else 1)
+    update_job(job_id, status="done")
+
+
+async def _run_verify(job_id: int, ids: List[int]):
+    update_job(job_id, status="running")
+    failures = []
+    for iso_id in ids:
+        db = SessionLocal()
+        try:
+            iso = db.query(ISO).filter(ISO.id == iso_id).first()
+            if not iso:
+                raise HTTPException(status_code=404, detail="ISO not found")
+            verified = await verify_file(db, iso)
+            if verified is False:
+                failures.append({"id": iso_id, "detail": "Checksum mismatch"})
+            update_job(job_id, done=1)
+        except Exception as e:
+            failures.append({"id": iso_id, "detail": getattr(e, "detail", str(e))})
+            update_job(job_id, failed=1)
+        finally:
+            db.close()
+    update_job(job_id, status="done", result={"failures": failures})
+
+
+@router.post("/bulk/update", response_model=JobResponse)
+def bulk_update(payload: BulkUpdate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Applique les mêmes modifications de métadonnées à plusieurs ISOs."""
+    job = create_job(db, "update", len(payload.ids))
+    background_tasks.add_task(_run_update, job.id, payload.ids, payload.changes.model_dump(exclude_unset=True))
+    return job
+
+
+@router.post("/bulk/delete", response_model=JobResponse)
+def bulk_delete(payload: BulkIds, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    job = create_job(db, "delete", len(payload.ids))
+    background_tasks.add_task(_run_delete, job.id, payload.ids)
+    return job
+
+
+@router.post("/bulk/import", response_model=JobResponse)
+def bulk_import(payload: BulkImport, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Importe plusieurs fichiers du stockage ; SHA256 calculés ensuite en file."""
+    job = create_job(db, "import", len(payload.files))
+    background_tasks.add_task(_run_import, job.id, [f.model_dump() for f in payload.files])
+    return job
+
+
+@router.get("/bulk/import/sources")
+def list_import_sources():
+    """Fichiers importables des répertoires IMPORT_SOURCE_PATHS."""
+    from app.routes.isos import ALLOWED_EXTENSIONS
+    return {"sources": source_dirs(), "files": list_sources(ALLOWED_EXTENSIONS)}
+
+
+@router.post("/bulk/import/path", response_model=JobResponse)
+def bulk_import_path(payload: PathImport, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """
+    Copie des fichiers depuis les répertoires IMPORT_SOURCE_PATHS (reflink / copy_file_range),
+    hachés pendant la copie ; entrées créées dans une transaction, copies en arrière-plan.
+    """
+    if not source_dirs():
+        raise HTTPException(status_code=400, detail="IMPORT_SOURCE_PATHS is not configured")
+    job = create_job(db, "import_path", len(payload.files))
+    rejected, entries, taken = [], [], set()
+    try:
+        for item in payload.files:
+            try:
+                source = resolve_source(item.path)
+                iso, reservation = new_copy_entry(db, source, item.model_dump(), taken)
+                entries.append((iso, source, reservation))
+            except HTTPException as e:
+                rejected.append({"path": item.path, "detail": e.detail})
+        db.commit()
+    except Exception:
+        db.rollback()
+        for _, _, reservation in entries:
+            reservation.release()
+        raise
+    copies = [(iso.id, source, iso.file_path, reservation) for iso, source, reservation in entries]
+    update_job(job.id, failed=len(rejected))
+    background_tasks.add_task(run_path_import, job.id, copies,
+                              {"imported": [c[0] for c in copies], "rejected": rejected})
+    return job
+
+
+@router.get("/bulk/export")
+def export_catalog(manifests: bool = True):
+    """Catalogue complet en NDJSON (une ISO par ligne), généré en flux à mémoire constante."""
+    return StreamingResponse(
+        iter_catalog_ndjson(manifests),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="isostack-catalog.ndjson"'},
+    )
+
+
+@router.post("/bulk/import/ndjson", response_model=JobResponse)
+async def bulk_import_ndjson(request: Request, background_tasks: BackgroundTasks,
+                             match: Literal["mtime", "size"] = "mtime", db: Session = Depends(get_db)):
+    """
+    Importe un export NDJSON (corps lu en flux, lots de IMPORT_BATCH par transaction).
+    Les SHA256 exportés sont repris quand le fichier stocké a la même identité ;
+    les autres fichiers sont hachés ensuite, en file.
+    """
+    job = create_job(db, "import", 0)
+    update_job(job.id, status="running")
+    try:
+        summary = await import_ndjson(iter_lines(request.stream()), job.id, match)
+    except Exception as e:
+        update_job(job.id, status="error", error_message=getattr(e, "detail", str(e)))
+        raise
+    to_hash = summary.pop("to_hash")
+    update_job(job.id, result={**summary, "queued_hashing": len(to_hash)})
+    background_tasks.add_task(_hash_queue, job.id, to_hash)
+    await flushed()
+    db.refresh(job)
+    return job
+
+
+@router.post("/bulk/verify", response_model=JobResponse)
+def bulk_verify(payload: BulkIds, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    job = create_job(db, "verify", len(payload.ids))
+    background_tasks.add_task(_run_verify, job.id, payload.ids)
+    return job
+
+
+@router.get("/jobs", response_model=List[JobResponse])
+def list_jobs(limit: int = 20, db: Session = Depends(get_db)):
+    return db.query(Job).order_by(Job.id.desc()).limit(limit).all()
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.query(Job).filter(Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
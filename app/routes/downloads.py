@@ -4,7 +4,8 @@ from sqlalchemy.orm import Session
 
 from app.database import get_db
 from app.models import ISO
-from app.schemas import ISOProgressResponse
+from app.schemas import ISOProgressResponse, MirrorStatsResponse
+from app.services.mirror_service import list_mirror_stats
 
 router = APIRouter(prefix="/api/downloads", tags=["downloads"])
 
@@ -15,3 +16,9 @@ def get_active_downloads(db: Session = Depends(get_db)):
         ISO.status.in_(["downloading", "uploading", "verifying"])
     ).all()
     return active
+
+
+@router.get("/mirrors", response_model=List[MirrorStatsResponse])
+def get_mirror_stats(db: Session = Depends(get_db)):
+    """Latence et débit observés par hôte miroir (moyennes glissantes)."""
+    return list_mirror_stats(db)
@@ -0,0 +1,139 @@
+"""
+Service direct des fichiers (/files/{filename}) avec support des requêtes Range.
+Les images en stockage froid (.<nom>.cold.zst seekable) sont décompressées à la volée ;
+le générateur synchrone (io_policy.iter_stream, avec readahead) s'exécute dans le
+pool d'I/O dédié (serving.file_io_pool), hors de la boucle d'événements et du threadpool
+des routes de l'API. Les petites images très demandées sont servies depuis le cache
+mémoire (file_cache). Chaque flux doit être admis (serving.admit) : 503 + Retry-After sinon.
+"""
+import asyncio
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from app.config import FILES_RETRY_AFTER
+from app.services.access_log import record_bytes, record_request
+from app.services.cold_storage import SeekableZstdFile, cold_path
+from app.services.file_cache import file_cache
+from app.services.io_policy import iter_stream
+from app.services.serving import StreamTicket, admit, mark_served, run_io, tracked
+from app.services.storage_service import path_for, root_of
+
+router = APIRouter(tags=["files"])
+
+
+class _AdmittedStreamingResponse(StreamingResponse):
+    """Libère la place du flux même si le corps n'a jamais été itéré (déconnexion précoce)."""
+
+    def __init__(self, *args, ticket: StreamTicket, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # release() publie l'état partagé (flock) : hors de la boucle d'événements
+            try:
+                await run_io(self.ticket.release)
+            except asyncio.CancelledError:
+                self.ticket.release()
+                raise
+
+
+def _parse_range(range_header: str, file_size: int):
+    range_val = range_header.strip().replace("bytes=", "")
+    start_str, end_str = range_val.split("-")
+    if not start_str:
+        # bytes=-N : les N derniers octets
+        start = max(0, file_size - int(end_str))
+        end = file_size - 1
+    else:
+        start = int(start_str)
+        end = int(end_str) if end_str else file_size - 1
+    end = min(end, file_size - 1)
+    if start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
+def _image_size(file_path: str) -> Optional[int]:
+    """Taille servie (décompressée pour une image froide) ; None si absente ou illisible. Bloquant."""
+    if os.path.exists(file_path):
+        return os.path.getsize(file_path)
+    if os.path.exists(cold_path(file_path)):
+        try:
+            with SeekableZstdFile(cold_path(file_path)) as f:
+                return f.size
+        except (OSError, ValueError):
+            return None
+    return None
+
+
+@router.get("/files/{filename}")
+async def serve_file(filename: str, request: Request):
+    safe_name = os.path.basename(filename)
+    file_path = os.path.realpath(path_for(safe_name))
+    if not safe_name or root_of(file_path) is None:
+        return JSONResponse(status_code=400, content={"detail": "Invalid filename"})
+
+    file_size = await run_io(_image_size, file_path)
+    if file_size is None:
+        return JSONResponse(status_code=404, content={"detail": "File not found"})
+
+    record_request(safe_name)
+    cached = None
+    if file_cache.enabled and file_size <= file_cache.max_file_bytes:
+        cached = await run_io(file_cache.get, file_path, file_size)
+        if cached is not None:
+            mark_served(file_path)
+
+    ticket = None
+    if cached is None:
+        ticket = await run_io(admit, request.client.host if request.client else "unknown")
+        if ticket is None:
+            return JSONResponse(
+                status_code=503,
+                content={"detail": "Too many concurrent file streams"},
+                headers={"Retry-After": str(FILES_RETRY_AFTER)},
+            )
+
+    range_header = request.headers.get("Range")
+
+    if range_header:
+        try:
+            start, end = _parse_range(range_header, file_size)
+            chunk_size = end - start + 1
+            headers = {
+                "Content-Range": f"bytes {start}-{end}/{file_size}",
+                "Accept-Ranges": "bytes",
+                "Content-Length": str(chunk_size),
+                "Content-Type": "application/octet-stream",
+            }
+            full_size = file_size if chunk_size == file_size else None
+            if cached is not None:
+                record_bytes(safe_name, chunk_size, full_download=full_size is not None)
+                return Response(cached[start:end + 1], status_code=206, headers=headers)
+            return _AdmittedStreamingResponse(
+                tracked(iter_stream(file_path, start, chunk_size), file_path, safe_name, full_size),
+                status_code=206, headers=headers, ticket=ticket,
+            )
+        except Exception:
+            pass
+
+    headers = {
+        "Content-Length": str(file_size),
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{safe_name}"',
+    }
+    if cached is not None:
+        record_bytes(safe_name, file_size, full_download=True)
+        return Response(cached, media_type="application/octet-stream", headers=headers)
+    return _AdmittedStreamingResponse(
+        tracked(iter_stream(file_path, 0, file_size), file_path, safe_name, file_size),
+        media_type="application/octet-stream",
+        headers=headers,
+        ticket=ticket,
+    )
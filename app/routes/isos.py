@@ -1,20 +1,43 @@
+import asyncio
+import json
 import os
 import math
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
-from fastapi import APIRouter, BackgroundTasks, Depends, File, Form, HTTPException, UploadFile
-from sqlalchemy import or_
+from fastapi import APIRouter, BackgroundTasks, Depends, File, Form, HTTPException, Request, UploadFile
+from sqlalchemy import func, or_
 from sqlalchemy.orm import Session
 
-import shutil
-from app.config import ISO_STORAGE_PATH, BASE_URL, MAX_DISK_USAGE_PCT
+from app.config import BASE_URL, MAX_DISK_USAGE_PCT, DEDUP_MODE, STORAGE_ROOTS
 from app.database import get_db
 from app.models import ISO
-from app.schemas import ISOCreate, ISOListResponse, ISOProgressResponse, ISOResponse, ISOUpdate, StatsResponse
+from app.schemas import (
+    AccessStatsResponse, BlockVerifyRequest, DeltaUpdateRequest, HandshakeResponse, ISOCreate, ISOHandshake, ISOListResponse, ISOProgressResponse, ISOResponse, ISOUpdate,
+    JobResponse, ManifestBlock, ManifestResponse, StatsResponse, TagCountResponse,
+)
+from app.services.io_policy import WriteBehind
+from app.services.access_log import SORT_KEYS, delete_access_stats, top_images
+from app.services.job_service import create_job, update_job
+from app.services.json_response import json_response
+from app.services.catalog_cache import catalog_cache
+from app.services.dedup_service import dedup_iso, find_blob, link_blob
+from app.services.decompress_ingest import DecompressingSink, codec_for, decompressed_name, estimated_size
+from app.services.delta_update import run_delta_update
+from app.services.dns_service import validate_url
 from app.services.download_service import download_iso
-from app.services.hash_service import compute_sha256, verify_checksum
-from app.services.update_check_service import check_for_update
+from app.services.cold_storage import cold_path, compress_to_cold, decompress_from_cold, image_exists, image_size
+from app.services.iso_service import hash_imported, new_import_entry, remove_file, storage_file, verify_file
+from app.services.manifest_service import (
+    delete_manifest, hash_and_index, load_manifest, merkle_levels, merkle_proof, split_leaves, store_manifest,
+    verify_range,
+)
+from app.services.storage_service import (
+    InsufficientStorage, Reservation, choose_root, filename_taken, iter_storage_files, path_for, primary_root, reserve,
+    root_usage,
+)
+from app.services.tag_index import parse_tags, tag_counts, tagged_ids
+from app.services.update_check_service import check_for_update, check_updates_bulk
 
 router = APIRouter(prefix="/api", tags=["isos"])
 
@@ -34,69 +57,136 @@ def _filename_from_url(url: str) -> str:
     return _safe_filename(raw)
 
 
-def _check_disk_quota():
-    """Lève une HTTPException 507 si le quota disque est dépassé."""
-    if MAX_DISK_USAGE_PCT <= 0:
-        return
+def _insufficient_storage() -> HTTPException:
+    usage = root_usage(primary_root()) or {"pct": 100, "free": 0}
+    return HTTPException(
+        status_code=507,
+        detail=f"Espace disque insuffisant sur toutes les racines — {usage['pct']:.1f}% utilisé "
+               f"(quota : {MAX_DISK_USAGE_PCT}%, transferts en cours inclus). "
+               f"Espace libre : {usage['free'] / (1024 ** 3):.1f} Go.",
+    )
+
+
+def _choose_root(category: Optional[str] = None) -> str:
+    """Racine de destination d'une nouvelle image ; 507 si toutes dépassent le quota."""
+    root = choose_root(category)
+    if root is None:
+        raise _insufficient_storage()
+    return root
+
+
+def _reserve(size: int, category: Optional[str] = None) -> Reservation:
+    """Réserve la taille d'un transfert sur une racine ; 507 si aucune n'a la place."""
     try:
-        usage = shutil.disk_usage(ISO_STORAGE_PATH)
-        pct = usage.used / usage.total * 100
-        if pct >= MAX_DISK_USAGE_PCT:
-            free_gb = usage.free / (1024 ** 3)
-            raise HTTPException(
-                status_code=507,
-                detail=f"Espace disque insuffisant — {pct:.1f}% utilisé (quota : {MAX_DISK_USAGE_PCT}%). "
-                       f"Espace libre : {free_gb:.1f} Go.",
-            )
-    except HTTPException:
-        raise
-    except Exception:
-        pass  # Ne pas bloquer si disk_usage échoue
+        return reserve(size, category=category)
+    except InsufficientStorage:
+        raise _insufficient_storage()
 
 
 def _safe_filename(filename: str) -> str:
-    """Extrait uniquement le nom de fichier, sans chemin."""
-    return os.path.basename(filename) or "upload.iso"
+    """Extrait uniquement le nom de fichier, sans chemin ni point initial (noms cachés réservés)."""
+    return os.path.basename(filename).lstrip(".") or "upload.iso"
 
 
 def _unique_filename(filename: str) -> str:
     filename = _safe_filename(filename)
     base, ext = os.path.splitext(filename)
-    path = os.path.join(ISO_STORAGE_PATH, filename)
     counter = 1
-    while os.path.exists(path):
+    # Unique sur l'ensemble des racines : /files/{filename} doit rester non ambigu
+    while filename_taken(filename):
         filename = f"{base}_{counter}{ext}"
-        path = os.path.join(ISO_STORAGE_PATH, filename)
         counter += 1
     return filename
 
 
-@router.get("/isos", response_model=ISOListResponse)
-def list_isos(
-    category: Optional[str] = None,
-    os: Optional[str] = None,
-    arch: Optional[str] = None,
-    edition: Optional[str] = None,
-    q: Optional[str] = None,
-    favorites: Optional[bool] = None,
-    page: int = 1,
-    per_page: int = 20,
-    db: Session = Depends(get_db),
-):
-    query = db.query(ISO)
+def _ingest_codec(filename: str, decompress: bool) -> Optional[str]:
+    """Codec à décompresser à l'ingestion ; 400 si demandé pour un fichier non compressé."""
+    if not decompress:
+        return None
+    codec = codec_for(filename)
+    if not codec:
+        raise HTTPException(status_code=400, detail="decompress requires a .gz, .xz or .zst file")
+    return codec
+
+
+def _create_from_blob(db: Session, blob: ISO, filename: str, add_method: str, **fields) -> ISO:
+    """Crée une entrée catalogue liée au blob d'une image existante, sans transfert."""
+    filename = _unique_filename(filename)
+    blob_path = path_for(blob.filename)
+    blob_root = os.path.dirname(blob_path)
+    if DEDUP_MODE == "off":
+        # Pas d'inode partagé : reflink si possible, sinon copie complète, qui doit tenir dans le quota
+        # (même racine que le blob de préférence : un reflink ne traverse pas les systèmes de fichiers)
+        try:
+            with reserve(blob.size_bytes or 0, blob_root) as reservation:
+                dest_path = os.path.join(reservation.root, filename)
+                link_blob(blob_path, dest_path, "off")
+        except InsufficientStorage:
+            raise _insufficient_storage()
+    else:
+        # Même racine que le blob : un hardlink/reflink ne traverse pas les systèmes de fichiers
+        dest_path = os.path.join(blob_root, filename)
+        link_blob(blob_path, dest_path, DEDUP_MODE)
+    iso = ISO(
+        filename=filename,
+        add_method=add_method,
+        status="available",
+        download_progress=100,
+        size_bytes=blob.size_bytes,
+        sha256=blob.sha256,
+        sha512=blob.sha512,
+        md5=blob.md5,
+        file_path=dest_path,
+        http_url=f"{BASE_URL}/files/{filename}",
+        **fields,
+    )
+    db.add(iso)
+    db.commit()
+    db.refresh(iso)
+
+    manifest = load_manifest(db, blob.id)
+    if manifest:
+        store_manifest(iso.id, manifest.block_size, manifest.leaves)
+        db.refresh(iso)
+    return iso
 
+
+def _cached_iso(db: Session, iso_id: int):
+    if catalog_cache.enabled:
+        return catalog_cache.get(db, iso_id)
+    return db.query(ISO).filter(ISO.id == iso_id).first()
+
+
+LIST_FIELDS = tuple(ISOResponse.model_fields)
+
+
+def _list_fields(fields: Optional[str]) -> Optional[tuple]:
+    """Projection fields=a,b,c (id toujours inclus) ; 400 pour un champ inconnu."""
+    if not fields:
+        return None
+    wanted = ["id"] + [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in wanted if f not in ISOResponse.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return tuple(dict.fromkeys(wanted))
+
+
+def _list_filters(db, favorites, category, os, arch, edition, q, tags, tag_mode) -> list:
+    conditions = []
+    if tags:
+        conditions.append(ISO.id.in_(tagged_ids(db, tags, tag_mode)))
     if favorites:
-        query = query.filter(ISO.is_favorite == True)  # noqa: E712
+        conditions.append(ISO.is_favorite == True)  # noqa: E712
     if category:
-        query = query.filter(ISO.category == category)
+        conditions.append(ISO.category == category)
     if os:
-        query = query.filter(ISO.os_family.ilike(f"%{os}%"))
+        conditions.append(ISO.os_family.ilike(f"%{os}%"))
     if arch:
-        query = query.filter(ISO.architecture == arch)
+        conditions.append(ISO.architecture == arch)
     if edition:
-        query = query.filter(ISO.edition == edition)
+        conditions.append(ISO.edition == edition)
     if q:
-        query = query.filter(
+        conditions.append(
             or_(
                 ISO.name.ilike(f"%{q}%"),
                 ISO.filename.ilike(f"%{q}%"),
@@ -106,12 +196,49 @@ def list_isos(
                 ISO.os_family.ilike(f"%{q}%"),
             )
         )
+    return conditions
 
-    total = query.count()
-    items = query.order_by(ISO.created_at.desc()).offset((page - 1) * per_page).limit(per_page).all()
-    pages = math.ceil(total / per_page) if total > 0 else 1
 
-    return ISOListResponse(items=items, total=total, page=page, per_page=per_page, pages=pages)
+@router.get("/isos", response_model=ISOListResponse)
+def list_isos(
+    request: Request,
+    category: Optional[str] = None,
+    os: Optional[str] = None,
+    arch: Optional[str] = None,
+    edition: Optional[str] = None,
+    q: Optional[str] = None,
+    favorites: Optional[bool] = None,
+    page: int = 1,
+    per_page: int = 20,
+    fields: Optional[str] = None,
+    tags: Optional[str] = None,
+    tag_mode: str = "all",
+    db: Session = Depends(get_db),
+):
+    """
+    fields=name,size_bytes,... : seules ces colonnes sont lues et renvoyées (plus id).
+    tags=a,b : tags exacts (index iso_tags), tous (tag_mode=all) ou au moins un (tag_mode=any).
+    """
+    columns = _list_fields(fields)
+    tag_list = parse_tags(tags, tag_mode)
+    if catalog_cache.enabled:
+        items, total = catalog_cache.list(db, page, per_page, favorites=favorites, category=category, os=os,
+                                          arch=arch, edition=edition, q=q, tags=tag_list, tag_mode=tag_mode,
+                                          fields=columns)
+    else:
+        columns = columns or LIST_FIELDS
+        conditions = _list_filters(db, favorites, category, os, arch, edition, q, tag_list, tag_mode)
+        total = db.query(func.count(ISO.id)).filter(*conditions).scalar()
+        rows = (
+            db.query(*[getattr(ISO, c) for c in columns]).filter(*conditions)
+            .order_by(ISO.created_at.desc(), ISO.id.desc()).offset((page - 1) * per_page).limit(per_page).all()
+        )
+        items = [row._asdict() for row in rows]
+        if "mirror_urls" in columns:
+            for item in items:
+                item["mirror_urls"] = json.loads(item["mirror_urls"]) if item["mirror_urls"] else None
+    pages = math.ceil(total / per_page) if total > 0 else 1
+    return json_response(request, {"items": items, "total": total, "page": page, "per_page": per_page, "pages": pages})
 
 
 @router.get("/stats", response_model=StatsResponse)
@@ -127,14 +254,29 @@ def get_stats(db: Session = Depends(get_db)):
         uploading=sum(1 for i in all_isos if i.status == "uploading"),
         verifying=sum(1 for i in all_isos if i.status == "verifying"),
         error=sum(1 for i in all_isos if i.status == "error"),
+        corrupt=sum(1 for i in all_isos if i.status == "corrupt"),
         disk_used_bytes=disk_used,
         disk_used_formatted=_format_size(disk_used),
     )
 
 
+@router.get("/tags", response_model=List[TagCountResponse])
+def list_tags(prefix: Optional[str] = None, limit: int = 100, db: Session = Depends(get_db)):
+    """Nuage de tags : nombre d'images par tag, les plus fréquents d'abord."""
+    return tag_counts(db, prefix, max(1, min(limit, 1000)))
+
+
+@router.get("/stats/top", response_model=List[AccessStatsResponse])
+def top_accessed(by: str = "requests", limit: int = 10, db: Session = Depends(get_db)):
+    """Images les plus utilisées : by = requests / bytes / downloads / last_access."""
+    if by not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"by must be one of {', '.join(SORT_KEYS)}")
+    return top_images(db, by, max(1, min(limit, 500)))
+
+
 @router.get("/isos/{iso_id}", response_model=ISOResponse)
 def get_iso(iso_id: int, db: Session = Depends(get_db)):
-    iso = db.query(ISO).filter(ISO.id == iso_id).first()
+    iso = _cached_iso(db, iso_id)
     if not iso:
         raise HTTPException(status_code=404, detail="ISO not found")
     return iso
@@ -142,9 +284,36 @@ def get_iso(iso_id: int, db: Session = Depends(get_db)):
 
 @router.post("/isos/from-url", response_model=ISOResponse)
 def create_from_url(payload: ISOCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    _check_disk_quota()
+    codec = _ingest_codec(_filename_from_url(payload.url), payload.decompress)
+    # Contenu déjà présent : créer l'entrée sans rien télécharger
+    # (décompression : le checksum attendu porte sur le fichier compressé, pas sur l'image)
+    if not codec and payload.expected_checksum and (payload.checksum_type or "sha256").lower() == "sha256":
+        blob = find_blob(db, payload.expected_checksum.strip())
+        if blob:
+            filename = _filename_from_url(payload.url)
+            try:
+                return _create_from_blob(
+                    db, blob, filename, "url",
+                    name=payload.name or filename,
+                    category=payload.category,
+                    os_family=payload.os_family,
+                    edition=payload.edition,
+                    file_format=payload.file_format,
+                    version=payload.version,
+                    architecture=payload.architecture,
+                    expected_checksum=payload.expected_checksum,
+                    checksum_type=payload.checksum_type,
+                    checksum_verified=True,
+                    description=payload.description,
+                    tags=payload.tags,
+                    source_url=payload.url,
+                )
+            except OSError:
+                pass  # blob disparu entre-temps — téléchargement normal
+
+    storage_root = _choose_root(payload.category)
     filename = _filename_from_url(payload.url)
-    filename = _unique_filename(filename)
+    filename = _unique_filename(decompressed_name(filename) if codec else filename)
     name = payload.name or filename
 
     iso = ISO(
@@ -159,10 +328,12 @@ def create_from_url(payload: ISOCreate, background_tasks: BackgroundTasks, db: S
         description=payload.description,
         tags=payload.tags,
         source_url=payload.url,
+        mirror_urls=json.dumps(payload.mirrors) if payload.mirrors else None,
+        source_codec=codec,
         add_method="url",
         status="downloading",
         download_progress=0,
-        file_path=f"/data/isos/{filename}",
+        file_path=os.path.join(storage_root, filename),
     )
     db.add(iso)
     db.commit()
@@ -178,11 +349,45 @@ def create_from_url(payload: ISOCreate, background_tasks: BackgroundTasks, db: S
         payload.expected_checksum,
         payload.checksum_type,
         bg_db,
+        storage_root,
+        payload.category,
+        payload.mirrors,
+        codec,
     )
 
     return iso
 
 
+@router.post("/isos/handshake", response_model=HandshakeResponse)
+def upload_handshake(payload: ISOHandshake, db: Session = Depends(get_db)):
+    """
+    Annonce le SHA256 et la taille d'un fichier avant son upload.
+    Si ce contenu est déjà stocké, l'entrée est créée immédiatement (match=true)
+    et le client n'a rien à transférer ; sinon il procède à l'upload normal.
+    """
+    blob = find_blob(db, payload.sha256.strip())
+    if not blob or blob.size_bytes != payload.size_bytes:
+        return HandshakeResponse(match=False)
+
+    filename = _safe_filename(payload.filename)
+    try:
+        iso = _create_from_blob(
+            db, blob, filename, "upload",
+            name=payload.name or filename,
+            category=payload.category,
+            os_family=payload.os_family,
+            edition=payload.edition,
+            file_format=payload.file_format,
+            version=payload.version,
+            architecture=payload.architecture,
+            description=payload.description,
+            tags=payload.tags,
+        )
+    except OSError:
+        return HandshakeResponse(match=False)
+    return HandshakeResponse(match=True, iso=iso)
+
+
 @router.post("/isos/upload", response_model=ISOResponse)
 async def upload_iso(  # noqa: PLR0913
     file: UploadFile = File(...),
@@ -193,12 +398,19 @@ async def upload_iso(  # noqa: PLR0913
     architecture: Optional[str] = Form("x86_64"),
     description: Optional[str] = Form(None),
     tags: Optional[str] = Form(None),
+    decompress: bool = Form(False),
     db: Session = Depends(get_db),
 ):
-    _check_disk_quota()
-    filename = _unique_filename(file.filename or "upload.iso")
+    codec = _ingest_codec(_safe_filename(file.filename or ""), decompress)
+    size = file.size or 0
+    if codec:
+        # Fichier déjà reçu (spooled) : taille décompressée annoncée par le flux si possible
+        size = max(size, estimated_size(file.file, codec))
+    reservation = _reserve(size, category)
+    filename = file.filename or "upload.iso"
+    filename = _unique_filename(decompressed_name(_safe_filename(filename)) if codec else filename)
     display_name = name or filename
-    dest_path = os.path.join(ISO_STORAGE_PATH, filename)
+    dest_path = os.path.join(reservation.root, filename)
 
     iso = ISO(
         name=display_name,
@@ -209,21 +421,41 @@ async def upload_iso(  # noqa: PLR0913
         architecture=architecture,
         description=description,
         tags=tags,
+        source_codec=codec,
         add_method="upload",
         status="uploading",
         download_progress=0,
-        file_path=f"/data/isos/{filename}",
+        file_path=dest_path,
     )
-    db.add(iso)
-    db.commit()
-    db.refresh(iso)
+    try:
+        db.add(iso)
+        db.commit()
+        db.refresh(iso)
+    except Exception:
+        reservation.release()
+        raise
 
     try:
+        source = {}
         with open(dest_path, "wb") as f:
-            while chunk := await file.read(1024 * 1024):
-                f.write(chunk)
-
-        sha256 = await compute_sha256(dest_path)
+            reservation.attach(f)
+            if codec:
+                sha256, source = await _receive_decompressed(file, f, codec, iso.id, reservation)
+            else:
+                behind = WriteBehind(f)
+                written = 0
+                while chunk := await file.read(1024 * 1024):
+                    reservation.grow(written + len(chunk))  # file.size inconnu : réservation au fil de l'eau
+                    f.write(chunk)
+                    written += len(chunk)
+                    if behind.due(written):
+                        await asyncio.to_thread(behind.drop)
+                # La préallocation a pu étendre le fichier au-delà des octets reçus
+                f.truncate(written)
+                reservation.resize(written)
+
+        if not codec:
+            sha256 = await hash_and_index(iso.id, dest_path)
         size_bytes = os.path.getsize(dest_path)
         http_url = f"{BASE_URL}/files/{filename}"
 
@@ -234,8 +466,10 @@ async def upload_iso(  # noqa: PLR0913
             "http_url": http_url,
             "download_progress": 100,
             "updated_at": datetime.utcnow(),
+            **source,
         })
         db.commit()
+        await dedup_iso(iso.id)
         db.refresh(iso)
     except Exception as e:
         db.query(ISO).filter(ISO.id == iso.id).update({
@@ -246,10 +480,30 @@ async def upload_iso(  # noqa: PLR0913
         db.commit()
         if os.path.exists(dest_path):
             os.remove(dest_path)
+        if isinstance(e, InsufficientStorage):
+            raise _insufficient_storage()
+    finally:
+        reservation.release()
 
     return iso
 
 
+async def _receive_decompressed(file: UploadFile, f, codec: str, iso_id: int, reservation: Reservation):
+    """Décompresse l'upload vers f au fil de la réception ; SHA256 et manifeste en une passe."""
+    sink = DecompressingSink(f, codec, reservation=reservation)
+    try:
+        while chunk := await file.read(1024 * 1024):
+            await asyncio.to_thread(sink.write, chunk)
+        sha256, leaves = await asyncio.to_thread(sink.finish)
+    except BaseException:
+        sink.abort()
+        raise
+    f.truncate(sink.output_bytes)
+    reservation.resize(sink.output_bytes)
+    store_manifest(iso_id, sink.block_size, leaves)
+    return sha256, {"source_sha256": sink.source_sha256.hexdigest(), "source_size_bytes": sink.compressed_bytes}
+
+
 @router.put("/isos/{iso_id}", response_model=ISOResponse)
 def update_iso(iso_id: int, payload: ISOUpdate, db: Session = Depends(get_db)):
     iso = db.query(ISO).filter(ISO.id == iso_id).first()
@@ -270,15 +524,12 @@ def delete_iso(iso_id: int, db: Session = Depends(get_db)):
     if not iso:
         raise HTTPException(status_code=404, detail="ISO not found")
 
-    safe_name = os.path.basename(iso.filename)
-    file_path = os.path.realpath(os.path.join(ISO_STORAGE_PATH, safe_name))
-    storage_root = os.path.realpath(ISO_STORAGE_PATH)
-    if file_path.startswith(storage_root + os.sep) and os.path.exists(file_path):
-        os.remove(file_path)
-
+    reclaimed_bytes = remove_file(iso.filename, iso.storage_mode)
+    delete_manifest(db, [iso.id])
+    delete_access_stats(db, [iso.id])
     db.delete(iso)
     db.commit()
-    return {"success": True}
+    return {"success": True, "reclaimed_bytes": reclaimed_bytes}
 
 
 @router.post("/isos/{iso_id}/verify", response_model=ISOResponse)
@@ -287,30 +538,176 @@ async def verify_iso(iso_id: int, db: Session = Depends(get_db)):
     if not iso:
         raise HTTPException(status_code=404, detail="ISO not found")
 
-    file_path = os.path.join(ISO_STORAGE_PATH, iso.filename)
-    if not os.path.exists(file_path):
+    await verify_file(db, iso)
+    db.refresh(iso)
+    return iso
+
+
+@router.get("/isos/{iso_id}/manifest", response_model=ManifestResponse)
+def get_manifest(iso_id: int, start: Optional[int] = None, end: Optional[int] = None, db: Session = Depends(get_db)):
+    """
+    Hachés de blocs de l'image. Avec start/end (octets, inclus), seuls les blocs
+    couvrant la plage sont renvoyés, chacun avec sa preuve de Merkle.
+    """
+    iso = db.query(ISO).filter(ISO.id == iso_id).first()
+    if not iso:
+        raise HTTPException(status_code=404, detail="ISO not found")
+    manifest = load_manifest(db, iso_id)
+    if not manifest:
+        raise HTTPException(status_code=404, detail="No manifest for this ISO")
+
+    leaves = split_leaves(manifest.leaves)
+    bs = manifest.block_size
+    size = iso.size_bytes or 0
+    ranged = start is not None or end is not None
+    first = (start or 0) // bs
+    last = min((end if end is not None else size - 1) // bs, len(leaves) - 1)
+    levels = merkle_levels(leaves) if ranged else None
+
+    blocks = [
+        ManifestBlock(
+            index=i,
+            offset=i * bs,
+            length=min(bs, size - i * bs),
+            hash=leaves[i].hex(),
+            proof=merkle_proof(levels, i) if ranged else None,
+        )
+        for i in range(first, last + 1)
+    ]
+    return ManifestResponse(
+        iso_id=iso_id,
+        sha256=iso.sha256,
+        merkle_root=iso.merkle_root,
+        block_size=bs,
+        block_count=len(leaves),
+        size_bytes=size,
+        blocks=blocks,
+    )
+
+
+@router.post("/isos/{iso_id}/verify-blocks")
+async def verify_blocks(iso_id: int, payload: BlockVerifyRequest, db: Session = Depends(get_db)):
+    """Re-vérifie uniquement les blocs couvrant une plage d'octets (ex. après une écriture partielle)."""
+    iso = db.query(ISO).filter(ISO.id == iso_id).first()
+    if not iso:
+        raise HTTPException(status_code=404, detail="ISO not found")
+    manifest = load_manifest(db, iso_id)
+    if not manifest:
+        raise HTTPException(status_code=404, detail="No manifest for this ISO")
+    file_path = storage_file(iso.filename)
+    if not image_exists(file_path):
         raise HTTPException(status_code=404, detail="File not found on disk")
 
-    db.query(ISO).filter(ISO.id == iso_id).update({
-        "status": "verifying",
-        "updated_at": datetime.utcnow(),
-    })
+    bad = await verify_range(file_path, manifest, payload.start, payload.end)
+    bs = manifest.block_size
+    return {
+        "ok": not bad,
+        "corrupt_blocks": [{"index": i, "offset": i * bs, "length": bs} for i in bad],
+    }
+
+
+async def _run_freeze(job_id: int, iso_id: int, file_path: str, sha256: Optional[str]):
+    from app.database import SessionLocal
+    update_job(job_id, status="running")
+    db = SessionLocal()
+    try:
+        stored = await asyncio.to_thread(compress_to_cold, file_path, sha256)
+        db.query(ISO).filter(ISO.id == iso_id).update({
+            "storage_mode": "zstd",
+            "stored_bytes": stored,
+            "updated_at": datetime.utcnow(),
+        })
+        db.commit()
+        update_job(job_id, done=1, status="done", result={"stored_bytes": stored})
+    except Exception as e:
+        db.query(ISO).filter(ISO.id == iso_id).update({"storage_mode": "raw"})
+        db.commit()
+        update_job(job_id, failed=1, status="error", error_message=str(e))
+    finally:
+        db.close()
+
+
+async def _run_thaw(job_id: int, iso_id: int, file_path: str, reservation: Reservation):
+    from app.database import SessionLocal
+    update_job(job_id, status="running")
+    db = SessionLocal()
+    try:
+        await asyncio.to_thread(decompress_from_cold, file_path, reservation)
+        db.query(ISO).filter(ISO.id == iso_id).update({
+            "storage_mode": "raw",
+            "stored_bytes": None,
+            "updated_at": datetime.utcnow(),
+        })
+        db.commit()
+        update_job(job_id, done=1, status="done")
+    except Exception as e:
+        db.query(ISO).filter(ISO.id == iso_id).update({"storage_mode": "zstd"})
+        db.commit()
+        update_job(job_id, failed=1, status="error", error_message=str(e))
+    finally:
+        reservation.release()
+        db.close()
+
+
+@router.post("/isos/{iso_id}/cold", response_model=JobResponse)
+def freeze_iso(iso_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Passe une image en stockage froid (zstd seekable) ; elle reste servie pendant et après."""
+    iso = db.query(ISO).filter(ISO.id == iso_id).first()
+    if not iso:
+        raise HTTPException(status_code=404, detail="ISO not found")
+    if iso.status != "available":
+        raise HTTPException(status_code=409, detail="ISO is not available")
+    file_path = storage_file(iso.filename)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=409, detail="ISO is already in cold storage")
+    if os.stat(file_path).st_nlink > 1:
+        raise HTTPException(status_code=409, detail="ISO shares its blob with other entries (dedup)")
+    if os.path.exists(cold_path(file_path)):
+        raise HTTPException(status_code=409, detail=f"{os.path.basename(cold_path(file_path))} already exists")
+
+    claimed = db.query(ISO).filter(
+        ISO.id == iso_id, or_(ISO.storage_mode == "raw", ISO.storage_mode.is_(None))
+    ).update({"storage_mode": "compressing"}, synchronize_session=False)
     db.commit()
+    if not claimed:
+        raise HTTPException(status_code=409, detail="A storage operation is already running")
 
-    sha256 = await compute_sha256(file_path)
-    checksum_verified = None
-    if iso.expected_checksum:
-        checksum_verified = await verify_checksum(file_path, iso.expected_checksum, iso.checksum_type or "sha256")
+    job = create_job(db, "cold", 1)
+    background_tasks.add_task(_run_freeze, job.id, iso_id, file_path, iso.sha256)
+    return job
 
-    db.query(ISO).filter(ISO.id == iso_id).update({
-        "status": "available",
-        "sha256": sha256,
-        "checksum_verified": checksum_verified,
-        "updated_at": datetime.utcnow(),
-    })
+
+@router.post("/isos/{iso_id}/thaw", response_model=JobResponse)
+def thaw_iso(iso_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Restaure une image froide en fichier brut."""
+    iso = db.query(ISO).filter(ISO.id == iso_id).first()
+    if not iso:
+        raise HTTPException(status_code=404, detail="ISO not found")
+    file_path = storage_file(iso.filename)
+    if not os.path.exists(cold_path(file_path)):
+        raise HTTPException(status_code=409, detail="ISO is not in cold storage")
+
+    # L'image décongelée reste sur sa racine : la réservation doit y tenir
+    root = os.path.dirname(file_path)
+    try:
+        reservation = reserve(image_size(file_path), root)
+    except InsufficientStorage:
+        raise _insufficient_storage()
+    if reservation.root != root:
+        reservation.release()
+        raise _insufficient_storage()
+
+    claimed = db.query(ISO).filter(
+        ISO.id == iso_id, ISO.storage_mode == "zstd"
+    ).update({"storage_mode": "thawing"}, synchronize_session=False)
     db.commit()
-    db.refresh(iso)
-    return iso
+    if not claimed:
+        reservation.release()
+        raise HTTPException(status_code=409, detail="A storage operation is already running")
+
+    job = create_job(db, "thaw", 1)
+    background_tasks.add_task(_run_thaw, job.id, iso_id, file_path, reservation)
+    return job
 
 
 @router.post("/isos/{iso_id}/favorite", response_model=ISOResponse)
@@ -330,7 +727,7 @@ def toggle_favorite(iso_id: int, db: Session = Depends(get_db)):
 
 @router.get("/isos/{iso_id}/progress", response_model=ISOProgressResponse)
 def get_progress(iso_id: int, db: Session = Depends(get_db)):
-    iso = db.query(ISO).filter(ISO.id == iso_id).first()
+    iso = _cached_iso(db, iso_id)
     if not iso:
         raise HTTPException(status_code=404, detail="ISO not found")
     return iso
@@ -343,29 +740,42 @@ ALLOWED_EXTENSIONS = {".iso", ".img", ".vmdk", ".vdi", ".qcow2", ".raw", ".vhd",
 
 
 @router.get("/browse")
-def browse_storage(db: Session = Depends(get_db)):
-    """List ALL compatible files in ISO_STORAGE_PATH with tracking status."""
-    tracked_map = {iso.filename: iso.id for iso in db.query(ISO.filename, ISO.id).all()}
+def browse_storage(request: Request, db: Session = Depends(get_db)):
+    """List ALL compatible files in every storage root with tracking status."""
+    if not catalog_cache.enabled:
+        return json_response(request, _browse(db))
+    key = tuple(_dir_mtime(root) for root in STORAGE_ROOTS)
+    return json_response(request, catalog_cache.browse(db, key, lambda: _browse(db)))
 
-    files = []
+
+def _dir_mtime(root: str) -> Optional[int]:
     try:
-        for fname in sorted(os.listdir(ISO_STORAGE_PATH)):
-            ext = os.path.splitext(fname)[1].lower()
-            if ext not in ALLOWED_EXTENSIONS:
-                continue
-            full = os.path.join(ISO_STORAGE_PATH, fname)
-            if not os.path.isfile(full):
-                continue
-            iso_id = tracked_map.get(fname)
-            files.append({
-                "filename": fname,
-                "size_bytes": os.path.getsize(full),
-                "extension": ext,
-                "tracked": fname in tracked_map,
-                "iso_id": iso_id,
-            })
-    except FileNotFoundError:
-        pass
+        return os.stat(root).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _browse(db: Session) -> dict:
+    tracked_map = {}
+    for iso in db.query(ISO.filename, ISO.id, ISO.storage_mode).all():
+        tracked_map[iso.filename] = iso.id
+        if iso.storage_mode == "zstd":
+            tracked_map[os.path.basename(cold_path(iso.filename))] = iso.id
+
+    files = []
+    for root, fname, full in iter_storage_files():
+        ext = os.path.splitext(fname)[1].lower()
+        if ext not in ALLOWED_EXTENSIONS:
+            continue
+        iso_id = tracked_map.get(fname)
+        files.append({
+            "filename": fname,
+            "root": root,
+            "size_bytes": os.path.getsize(full),
+            "extension": ext,
+            "tracked": fname in tracked_map,
+            "iso_id": iso_id,
+        })
 
     return {
         "files": files,
@@ -386,8 +796,9 @@ async def check_iso_update(iso_id: int, db: Session = Depends(get_db)):
 
     result = await check_for_update(
         source_url=iso.source_url,
-        local_sha256=iso.sha256,
-        local_size_bytes=iso.size_bytes,
+        # Image décompressée à l'ingestion : l'amont publie le fichier compressé
+        local_sha256=iso.source_sha256 or iso.sha256,
+        local_size_bytes=iso.source_size_bytes or iso.size_bytes,
     )
 
     db.query(ISO).filter(ISO.id == iso_id).update({
@@ -401,71 +812,70 @@ async def check_iso_update(iso_id: int, db: Session = Depends(get_db)):
     return iso
 
 
-@router.post("/isos/import")
-async def import_from_storage(payload: dict, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    """Import an existing file from storage into the DB."""
-    filename = os.path.basename(payload.get("filename") or "")
-    if not filename:
-        raise HTTPException(status_code=400, detail="filename required")
-
-    file_path = os.path.realpath(os.path.join(ISO_STORAGE_PATH, filename))
-    storage_root = os.path.realpath(ISO_STORAGE_PATH)
-    if not file_path.startswith(storage_root + os.sep):
-        raise HTTPException(status_code=400, detail="Invalid filename")
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found in storage")
-
-    existing = db.query(ISO).filter(ISO.filename == filename).first()
-    if existing:
-        raise HTTPException(status_code=409, detail="File already tracked")
-
-    name = payload.get("name") or os.path.splitext(filename)[0]
-    size_bytes = os.path.getsize(file_path)
-    http_url = f"{BASE_URL}/files/{filename}"
-
-    iso = ISO(
-        name=name,
+@router.post("/isos/{iso_id}/delta-update", response_model=JobResponse)
+async def delta_update(iso_id: int, payload: DeltaUpdateRequest, background_tasks: BackgroundTasks,
+                       db: Session = Depends(get_db)):
+    """
+    Nouvelle version de l'image en nouvelle entrée, reconstruite depuis les blocs locaux :
+    seules les plages qui diffèrent sont téléchargées (.zsync publié par l'amont).
+    """
+    iso = db.query(ISO).filter(ISO.id == iso_id).first()
+    if not iso:
+        raise HTTPException(status_code=404, detail="ISO not found")
+    if iso.status != "available" or not image_exists(path_for(iso.filename)):
+        raise HTTPException(status_code=409, detail="ISO is not available")
+    url = payload.url or iso.source_url
+    if not url:
+        raise HTTPException(status_code=400, detail="No source URL recorded for this ISO")
+    for candidate in (url, payload.zsync_url):
+        if candidate:
+            try:
+                await validate_url(candidate)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+    storage_root = _choose_root(iso.category)
+    filename = _unique_filename(_filename_from_url(url))
+    new = ISO(
+        name=payload.name or filename,
         filename=filename,
-        category=payload.get("category", "other"),
-        os_family=payload.get("os_family"),
-        version=payload.get("version"),
-        architecture=payload.get("architecture", "x86_64"),
-        description=payload.get("description"),
-        tags=payload.get("tags"),
-        add_method="import",
-        status="verifying",
+        category=iso.category,
+        os_family=iso.os_family,
+        edition=iso.edition,
+        file_format=iso.file_format,
+        version=payload.version,
+        architecture=iso.architecture,
+        description=iso.description,
+        tags=iso.tags,
+        source_url=url,
+        add_method="delta",
+        status="downloading",
         download_progress=0,
-        size_bytes=size_bytes,
-        file_path=f"/data/isos/{filename}",
-        http_url=http_url,
+        file_path=os.path.join(storage_root, filename),
     )
-    db.add(iso)
+    db.add(new)
     db.commit()
-    db.refresh(iso)
+    job = create_job(db, "delta", 1)
+    background_tasks.add_task(
+        run_delta_update, job.id, iso.id, new.id, url, payload.zsync_url, storage_root, iso.category,
+        payload.allow_full,
+    )
+    return job
 
-    from app.database import SessionLocal
-    from app.services.hash_service import compute_sha256 as _sha256
 
-    async def _compute_and_update(iso_id: int):
-        bg_db = SessionLocal()
-        try:
-            sha = await _sha256(file_path)
-            bg_db.query(ISO).filter(ISO.id == iso_id).update({
-                "status": "available",
-                "sha256": sha,
-                "download_progress": 100,
-                "updated_at": datetime.utcnow(),
-            })
-            bg_db.commit()
-        except Exception as e:
-            bg_db.query(ISO).filter(ISO.id == iso_id).update({
-                "status": "error",
-                "error_message": str(e),
-                "updated_at": datetime.utcnow(),
-            })
-            bg_db.commit()
-        finally:
-            bg_db.close()
-
-    background_tasks.add_task(_compute_and_update, iso.id)
+@router.post("/isos/check-updates")
+async def check_updates(payload: Optional[dict] = None):
+    """Bulk update check: all ISOs with a source URL, or only payload["ids"]."""
+    ids = (payload or {}).get("ids")
+    return await check_updates_bulk(ids)
+
+
+@router.post("/isos/import")
+async def import_from_storage(payload: dict, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Import an existing file from storage into the DB."""
+    iso = new_import_entry(db, payload.get("filename"), payload)
+    db.commit()
+    db.refresh(iso)
+
+    background_tasks.add_task(hash_imported, iso.id)
     return iso
@@ -6,9 +6,20 @@ from fastapi import APIRouter, Depends
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
-from app.config import ISO_STORAGE_PATH, DB_PATH, MAX_DISK_USAGE_PCT, AUTO_IMPORT_ENABLED
+from app.config import DB_MAINTENANCE_INTERVAL_HOURS, DB_PATH, MAX_DISK_USAGE_PCT, AUTO_IMPORT_ENABLED, DEDUP_MODE
 from app.database import get_db, engine
 from app.models import ISO
+from app.services.cold_storage import image_exists
+from app.services import db_writer
+from app.services.db_maintenance import last_run, run_db_maintenance
+from app.services.dedup_service import dedup_report, run_dedup
+from app.services.catalog_cache import catalog_cache
+from app.services.file_cache import file_cache
+from app.services.leader import leader_info
+from app.services.serving import stream_stats
+from app.services.access_log import delete_access_stats
+from app.services.manifest_service import delete_manifest
+from app.services.storage_service import path_for, rebalance_once, reserved_bytes, storage_roots
 
 router = APIRouter(prefix="/api", tags=["maintenance"])
 
@@ -26,35 +37,74 @@ def _disk_usage(path: str):
         return None
 
 
+def _total_usage(disks: list):
+    """Somme des racines, chaque système de fichiers n'étant compté qu'une fois."""
+    seen, total, used, free = set(), 0, 0, 0
+    for d in disks:
+        if not d["usage"] or d["device"] in seen:
+            continue
+        seen.add(d["device"])
+        total += d["usage"]["total"]
+        used += d["usage"]["used"]
+        free += d["usage"]["free"]
+    if not seen:
+        return None
+    return {"total": total, "used": used, "free": free, "pct": round(used / total * 100, 1) if total else 0}
+
+
 @router.get("/system-info")
 def system_info(db: Session = Depends(get_db)):
-    """Retourne les informations système : chemin stockage, DB, espace disque."""
-    disk = _disk_usage(ISO_STORAGE_PATH)
+    """Retourne les informations système : racines de stockage, DB, espace disque."""
+    disks = []
+    for root in storage_roots():
+        try:
+            device = os.stat(root).st_dev
+        except OSError:
+            device = None
+        disks.append({"path": root, "device": device, "usage": _disk_usage(root)})
+    disk = _total_usage(disks)
     db_size = os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0
     iso_count = db.query(ISO).count()
 
+    # Quota dépassé seulement si plus aucune racine n'accepte de nouvelle image
     disk_quota_exceeded = False
-    if disk and MAX_DISK_USAGE_PCT > 0:
-        disk_quota_exceeded = disk["pct"] >= MAX_DISK_USAGE_PCT
+    if MAX_DISK_USAGE_PCT > 0:
+        usable = [d for d in disks if d["usage"]]
+        disk_quota_exceeded = bool(usable) and all(d["usage"]["pct"] >= MAX_DISK_USAGE_PCT for d in usable)
 
     return {
         "db_size_bytes": db_size,
         "iso_count": iso_count,
         "disk": disk,
+        "disks": [{"path": d["path"], **(d["usage"] or {}), "reserved": reserved_bytes(d["path"])} for d in disks],
         "disk_quota_pct": MAX_DISK_USAGE_PCT,
         "disk_quota_exceeded": disk_quota_exceeded,
         "auto_import_enabled": AUTO_IMPORT_ENABLED,
+        "dedup_mode": DEDUP_MODE,
+        "file_cache": file_cache.stats(),
+        "catalog_cache": catalog_cache.stats(),
+        "streams": stream_stats(),
+        "db_maintenance": {**last_run, "interval_hours": DB_MAINTENANCE_INTERVAL_HOURS},
+        "db_writer": dict(db_writer.stats),
+        "worker": leader_info(),
     }
 
 
 @router.post("/maintenance/vacuum")
 def vacuum_db():
-    """Compacte la base SQLite (VACUUM)."""
+    """
+    Lance tout de suite la maintenance planifiée (optimize, vacuum incrémental, checkpoint WAL).
+    Remplace l'ancien VACUUM complet, qui bloquait toute la base ; seule exception, la
+    conversion unique d'une ancienne base en auto_vacuum=INCREMENTAL, faite ici à la demande.
+    """
     try:
-        with engine.connect() as conn:
-            conn.execute(text("VACUUM"))
-        db_size = os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0
-        return {"success": True, "message": "VACUUM exécuté avec succès.", "db_size_bytes": db_size}
+        result = run_db_maintenance(convert=True)
+        converted = " Base convertie en vacuum incrémental (VACUUM complet)." if result["converted"] else ""
+        return {
+            "success": True,
+            "message": f"Base optimisée — {result['freed_pages']} page(s) libérée(s).{converted}",
+            "db_size_bytes": result["db_size_bytes"],
+        }
     except Exception as e:
         return {"success": False, "message": str(e)}
 
@@ -83,10 +133,11 @@ def cleanup_orphans(db: Session = Depends(get_db)):
     isos = db.query(ISO).filter(ISO.status == "available").all()
     removed = []
     for iso in isos:
-        file_path = os.path.join(ISO_STORAGE_PATH, iso.filename)
-        if not os.path.exists(file_path):
+        if not image_exists(path_for(iso.filename)):
             removed.append({"id": iso.id, "name": iso.name, "filename": iso.filename})
             db.delete(iso)
+    delete_manifest(db, [r["id"] for r in removed])
+    delete_access_stats(db, [r["id"] for r in removed])
     db.commit()
     return {
         "success": True,
@@ -105,3 +156,43 @@ def reindex_db():
         return {"success": True, "message": "Index reconstruits avec succès."}
     except Exception as e:
         return {"success": False, "message": str(e)}
+
+
+@router.get("/maintenance/dedup")
+def dedup_status(db: Session = Depends(get_db)):
+    """Rapport de déduplication : octets logiques, physiques et économisés."""
+    return dedup_report(db)
+
+
+@router.post("/maintenance/dedup")
+def dedup_run(db: Session = Depends(get_db)):
+    """Ramène les doublons (même SHA256) sur un blob unique."""
+    if DEDUP_MODE == "off":
+        return {"success": False, "message": "Déduplication désactivée (DEDUP_MODE=off).", **dedup_report(db)}
+    try:
+        freed = run_dedup(db)
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+    report = dedup_report(db)
+    return {
+        "success": True,
+        "freed_bytes": freed,
+        "message": f"Déduplication terminée — {report['bytes_saved']} octets économisés au total.",
+        **report,
+    }
+
+
+@router.post("/maintenance/rebalance")
+async def rebalance_run():
+    """Déplace des images de la racine la plus pleine vers la plus libre."""
+    if len(storage_roots()) < 2:
+        return {"success": False, "moved": 0, "message": "Une seule racine de stockage configurée."}
+    try:
+        moved = await rebalance_once()
+    except Exception as e:
+        return {"success": False, "moved": 0, "message": str(e)}
+    return {
+        "success": True,
+        "moved": moved,
+        "message": f"{moved} image(s) déplacée(s)." if moved else "Racines déjà équilibrées.",
+    }
@@ -1,6 +1,7 @@
+import json
 from datetime import datetime
-from typing import List, Optional
-from pydantic import BaseModel
+from typing import Any, List, Optional
+from pydantic import BaseModel, field_serializer, field_validator
 
 
 class ISOCreate(BaseModel):
@@ -16,6 +17,23 @@ class ISOCreate(BaseModel):
     checksum_type: Optional[str] = "sha256"
     description: Optional[str] = None
     tags: Optional[str] = None
+    mirrors: Optional[List[str]] = None  # autres URL du même fichier, sondées avant le téléchargement
+    decompress: bool = False  # .gz / .xz / .zst décompressé pendant le téléchargement
+
+
+class ISOHandshake(BaseModel):
+    sha256: str
+    size_bytes: int
+    filename: str
+    name: Optional[str] = None
+    category: str = "other"
+    os_family: Optional[str] = None
+    edition: Optional[str] = None
+    file_format: Optional[str] = None
+    version: Optional[str] = None
+    architecture: Optional[str] = "x86_64"
+    description: Optional[str] = None
+    tags: Optional[str] = None
 
 
 class ISOUpdate(BaseModel):
@@ -30,6 +48,107 @@ class ISOUpdate(BaseModel):
     tags: Optional[str] = None
     expected_checksum: Optional[str] = None
     checksum_type: Optional[str] = None
+    mirror_urls: Optional[List[str]] = None
+
+    @field_serializer("mirror_urls")
+    def _dump_mirrors(self, v):
+        return json.dumps(v) if v is not None else None
+
+
+class BulkIds(BaseModel):
+    ids: List[int]
+
+
+class BulkUpdate(BaseModel):
+    ids: List[int]
+    changes: ISOUpdate
+
+
+class BulkImportItem(BaseModel):
+    filename: str
+    name: Optional[str] = None
+    category: Optional[str] = None
+    os_family: Optional[str] = None
+    edition: Optional[str] = None
+    file_format: Optional[str] = None
+    version: Optional[str] = None
+    architecture: Optional[str] = None
+    description: Optional[str] = None
+    tags: Optional[str] = None
+
+
+class BulkImport(BaseModel):
+    files: List[BulkImportItem]
+
+
+class PathImportItem(BaseModel):
+    path: str  # fichier sous l'un des IMPORT_SOURCE_PATHS
+    filename: Optional[str] = None  # nom dans le stockage (défaut : celui de la source)
+    name: Optional[str] = None
+    category: Optional[str] = None
+    os_family: Optional[str] = None
+    edition: Optional[str] = None
+    file_format: Optional[str] = None
+    version: Optional[str] = None
+    architecture: Optional[str] = None
+    description: Optional[str] = None
+    tags: Optional[str] = None
+
+
+class PathImport(BaseModel):
+    files: List[PathImportItem]
+
+
+class CatalogRecord(BaseModel):
+    """Une ligne de l'export NDJSON du catalogue (GET /api/bulk/export)."""
+    filename: str
+    name: Optional[str] = None
+    category: Optional[str] = None
+    os_family: Optional[str] = None
+    edition: Optional[str] = None
+    file_format: Optional[str] = None
+    version: Optional[str] = None
+    architecture: Optional[str] = None
+    size_bytes: Optional[int] = None
+    sha256: Optional[str] = None
+    sha512: Optional[str] = None
+    md5: Optional[str] = None
+    expected_checksum: Optional[str] = None
+    checksum_type: Optional[str] = None
+    checksum_verified: Optional[bool] = None
+    description: Optional[str] = None
+    tags: Optional[str] = None
+    source_url: Optional[str] = None
+    add_method: Optional[str] = None
+    is_favorite: Optional[bool] = None
+    upstream_sha256: Optional[str] = None
+    last_verified_at: Optional[datetime] = None
+    status: Optional[str] = None
+    storage_mode: Optional[str] = None
+    created_at: Optional[datetime] = None
+    file_identity: Optional[dict] = None  # {"size": octets sur disque, "mtime_ns": ...}
+    manifest: Optional[dict] = None       # {"block_size": ..., "leaves": base64}
+
+
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    status: str
+    total: int
+    done: int
+    failed: int
+    result: Optional[Any] = None
+    error_message: Optional[str]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    @field_validator("result", mode="before")
+    @classmethod
+    def _parse_result(cls, v):
+        return json.loads(v) if isinstance(v, str) else v
+
+    class Config:
+        from_attributes = True
 
 
 class ISOResponse(BaseModel):
@@ -62,18 +181,84 @@ class ISOResponse(BaseModel):
     upstream_sha256: Optional[str]
     update_available: Optional[bool]
     last_update_check: Optional[datetime]
+    last_verified_at: Optional[datetime]
+    merkle_root: Optional[str]
+    manifest_block_size: Optional[int]
+    storage_mode: Optional[str]
+    stored_bytes: Optional[int]
+    mirror_urls: Optional[List[str]] = None
+    active_mirror: Optional[str] = None
+    source_codec: Optional[str] = None
+    source_sha256: Optional[str] = None
+    source_size_bytes: Optional[int] = None
     created_at: Optional[datetime]
     updated_at: Optional[datetime]
 
+    @field_validator("mirror_urls", mode="before")
+    @classmethod
+    def _parse_mirrors(cls, v):
+        return json.loads(v) if isinstance(v, str) else v
+
     class Config:
         from_attributes = True
 
 
+class MirrorStatsResponse(BaseModel):
+    host: str
+    latency_ms: Optional[int]
+    throughput_bps: Optional[int]
+    successes: int
+    failures: int
+    last_used_at: Optional[datetime]
+
+    class Config:
+        from_attributes = True
+
+
+class HandshakeResponse(BaseModel):
+    match: bool
+    iso: Optional[ISOResponse] = None
+
+
+class ManifestBlock(BaseModel):
+    index: int
+    offset: int
+    length: int
+    hash: str
+    proof: Optional[List[str]] = None
+
+
+class ManifestResponse(BaseModel):
+    iso_id: int
+    sha256: Optional[str]
+    merkle_root: str
+    block_size: int
+    block_count: int
+    size_bytes: int
+    leaf_hash: str = "sha256(0x00 || block)"
+    node_hash: str = "sha256(0x01 || left || right), odd node promoted"
+    blocks: List[ManifestBlock]
+
+
+class BlockVerifyRequest(BaseModel):
+    start: int = 0
+    end: Optional[int] = None
+
+
+class DeltaUpdateRequest(BaseModel):
+    url: Optional[str] = None        # nouvelle version ; source_url de l'image par défaut
+    zsync_url: Optional[str] = None  # <url>.zsync par défaut
+    name: Optional[str] = None
+    version: Optional[str] = None
+    allow_full: bool = True          # false : échec plutôt que téléchargement complet sans .zsync
+
+
 class ISOProgressResponse(BaseModel):
     id: int
     status: str
     download_progress: int
     error_message: Optional[str]
+    active_mirror: Optional[str] = None
 
 
 class ISOListResponse(BaseModel):
@@ -91,5 +276,21 @@ class StatsResponse(BaseModel):
     uploading: int
     verifying: int
     error: int
+    corrupt: int
     disk_used_bytes: int
     disk_used_formatted: str
+
+
+class TagCountResponse(BaseModel):
+    tag: str
+    count: int
+
+
+class AccessStatsResponse(BaseModel):
+    iso_id: int
+    name: Optional[str] = None
+    filename: Optional[str] = None
+    requests: int = 0
+    bytes_served: int = 0
+    full_downloads: int = 0
+    last_access_at: Optional[datetime] = None
@@ -0,0 +1,152 @@
+"""
+Statistiques d'accès par image (/files) : requêtes, octets servis, téléchargements
+complets, dernier accès.
+
+Le chemin de service ne fait qu'incrémenter des compteurs en mémoire (write-behind) ;
+access_log_loop les écrit dans iso_access_stats par lots toutes les
+ACCESS_LOG_FLUSH_INTERVAL secondes (via l'écrivain unique), et une dernière fois à l'arrêt.
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from app.config import ACCESS_LOG_FLUSH_INTERVAL
+from app.models import ISO, ISOAccessStats
+from app.services.db_writer import submit
+
+logger = logging.getLogger("access_log")
+
+_lock = threading.Lock()
+
+
+def _empty() -> dict:
+    return {"requests": 0, "bytes_served": 0, "full_downloads": 0, "last_access_at": None}
+
+
+_pending: Dict[str, dict] = defaultdict(_empty)  # par nom de fichier
+
+
+def record_request(filename: str) -> None:
+    with _lock:
+        entry = _pending[filename]
+        entry["requests"] += 1
+        entry["last_access_at"] = datetime.utcnow()
+
+
+def record_bytes(filename: str, nbytes: int, full_download: bool = False) -> None:
+    with _lock:
+        entry = _pending[filename]
+        entry["bytes_served"] += nbytes
+        if full_download:
+            entry["full_downloads"] += 1
+        entry["last_access_at"] = datetime.utcnow()
+
+
+def _take_pending() -> Dict[str, dict]:
+    global _pending
+    with _lock:
+        pending, _pending = _pending, defaultdict(_empty)
+    return dict(pending)
+
+
+def flush() -> int:
+    """Écrit les compteurs en attente en une transaction. Retourne le nombre d'images mises à jour."""
+    pending = _take_pending()
+    if not pending:
+        return 0
+    try:
+        return submit(lambda session: _write(session, pending)).result()
+    except Exception:
+        _restore(pending)
+        raise
+
+
+def _write(session: Session, pending: Dict[str, dict]) -> int:
+    ids = dict(session.query(ISO.filename, ISO.id).filter(ISO.filename.in_(list(pending))).all())
+    rows = [{"iso_id": ids[name], **counters} for name, counters in pending.items() if name in ids]
+    for row in rows:
+        stmt = insert(ISOAccessStats).values(**row)
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=[ISOAccessStats.iso_id],
+            set_={
+                "requests": ISOAccessStats.requests + stmt.excluded.requests,
+                "bytes_served": ISOAccessStats.bytes_served + stmt.excluded.bytes_served,
+                "full_downloads": ISOAccessStats.full_downloads + stmt.excluded.full_downloads,
+                "last_access_at": stmt.excluded.last_access_at,
+            },
+        ))
+    return len(rows)
+
+
+def _restore(pending: Dict[str, dict]) -> None:
+    """Remet en attente des compteurs dont l'écriture a échoué."""
+    with _lock:
+        for name, counters in pending.items():
+            entry = _pending[name]
+            for key in ("requests", "bytes_served", "full_downloads"):
+                entry[key] += counters[key]
+            if entry["last_access_at"] is None or (
+                counters["last_access_at"] and counters["last_access_at"] > entry["last_access_at"]
+            ):
+                entry["last_access_at"] = counters["last_access_at"]
+
+
+def delete_access_stats(db: Session, iso_ids: List[int]) -> None:
+    db.query(ISOAccessStats).filter(ISOAccessStats.iso_id.in_(iso_ids)).delete(synchronize_session=False)
+
+
+SORT_KEYS = {
+    "requests": ISOAccessStats.requests,
+    "bytes": ISOAccessStats.bytes_served,
+    "downloads": ISOAccessStats.full_downloads,
+    "last_access": ISOAccessStats.last_access_at,
+}
+
+
+def top_images(db: Session, by: str = "requests", limit: int = 10) -> List[dict]:
+    """Images les plus utilisées (compteurs en base + ceux pas encore écrits)."""
+    flush_error: Optional[Exception] = None
+    try:
+        flush()
+    except Exception as e:  # la base reste lisible : on sert les derniers compteurs écrits
+        flush_error = e
+    rows = db.query(ISOAccessStats, ISO.name, ISO.filename).join(
+        ISO, ISO.id == ISOAccessStats.iso_id
+    ).order_by(SORT_KEYS[by].desc().nulls_last()).limit(limit).all()
+    if flush_error:
+        logger.warning(f"Statistiques d'accès non écrites : {flush_error}")
+    return [
+        {
+            "iso_id": stats.iso_id,
+            "name": name,
+            "filename": filename,
+            "requests": stats.requests or 0,
+            "bytes_served": stats.bytes_served or 0,
+            "full_downloads": stats.full_downloads or 0,
+            "last_access_at": stats.last_access_at,
+        }
+        for stats, name, filename in rows
+    ]
+
+
+async def access_log_loop():
+    logger.info(f"Statistiques d'accès : écriture toutes les {ACCESS_LOG_FLUSH_INTERVAL}s")
+    try:
+        while True:
+            await asyncio.sleep(ACCESS_LOG_FLUSH_INTERVAL)
+            try:
+                await asyncio.to_thread(flush)
+            except Exception as e:
+                logger.error(f"Erreur écriture statistiques d'accès : {e}")
+    finally:
+        # Arrêt : ne pas perdre les derniers compteurs
+        try:
+            flush()
+        except Exception as e:
+            logger.error(f"Erreur écriture statistiques d'accès : {e}")
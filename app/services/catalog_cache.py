@@ -0,0 +1,192 @@
+"""
+Cache mémoire du catalogue pour les lectures (/api/isos, /api/isos/{id}, progression, /api/browse).
+
+Le catalogue change quelques fois par heure mais est relu à chaque requête : on garde un
+instantané des ISOResponse déjà construits. Toute écriture sur isos — route, file_watcher,
+téléchargement, écrivain unique, autre worker — passe par les triggers SQLite qui journalisent
+l'id modifié dans catalog_changes ; chaque lecture commence par lire les entrées du journal
+postérieures à l'instantané (une requête sur la clé primaire, vide la plupart du temps)
+et ne recharge que ces lignes.
+
+Au-dessus de l'instantané, les listes filtrées (ids triés) sont mémorisées par jeu de filtres
+(CATALOG_CACHE_QUERIES au plus), et /api/browse l'est tant que le catalogue et les
+répertoires de stockage (mtime) n'ont pas changé. Les lignes sont servies sous forme de
+dict (model_dump mémorisé par image), projetées sur les champs demandés (fields=).
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import CATALOG_CACHE_ENABLED, CATALOG_CACHE_QUERIES
+from app.models import ISO
+from app.schemas import ISOResponse
+from app.services.tag_index import tagged_ids
+
+SEARCH_FIELDS = ("name", "filename", "description", "tags", "version", "os_family")
+FULL_RELOAD_RATIO = 0.2  # au-delà de cette part de lignes modifiées, rechargement complet
+BROWSE_MAX_AGE = 10.0
+
+
+def _contains(value: Optional[str], needle: str) -> bool:
+    return value is not None and needle in value.lower()
+
+
+class CatalogCache:
+    def __init__(self, enabled: bool = CATALOG_CACHE_ENABLED, max_queries: int = CATALOG_CACHE_QUERIES):
+        self.enabled = enabled
+        self.max_queries = max_queries
+        self._lock = threading.Lock()
+        self._items: Dict[int, ISOResponse] = {}
+        self._rows: Dict[int, dict] = {}
+        self._seq: Optional[int] = None
+        self._ordered: Optional[List[int]] = None
+        self._queries: "OrderedDict[tuple, List[int]]" = OrderedDict()
+        self._browse: Optional[Tuple[tuple, float, dict]] = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    # ── synchronisation avec le journal ──────────────────────────────
+
+    def _reload(self, db: Session) -> None:
+        seq = db.execute(text("SELECT COALESCE(MAX(seq), 0) FROM catalog_changes")).scalar()
+        self._items = {iso.id: ISOResponse.model_validate(iso) for iso in db.query(ISO).all()}
+        self._rows = {}
+        self._seq = seq
+        self._changed()
+        self.reloads += 1
+
+    def _changed(self) -> None:
+        self._ordered = None
+        self._queries.clear()
+        self._browse = None
+
+    def _sync(self, db: Session) -> None:
+        """
+        À appeler sous le verrou. Le journal est lu avant les lignes : une ligne déjà plus
+        récente que le journal lu sera simplement rechargée une fois de plus.
+        """
+        if self._seq is None:
+            self._reload(db)
+            return
+        changes = db.execute(
+            text("SELECT seq, iso_id FROM catalog_changes WHERE seq > :seq ORDER BY seq"), {"seq": self._seq}
+        ).all()
+        if not changes:
+            self.hits += 1
+            return
+        self.misses += 1
+        ids = {row.iso_id for row in changes}
+        pruned = changes[0].seq != self._seq + 1  # journal élagué depuis : des changements manquent
+        if pruned or len(ids) > max(100, FULL_RELOAD_RATIO * len(self._items)):
+            self._reload(db)
+            return
+        fresh = {iso.id: iso for iso in db.query(ISO).filter(ISO.id.in_(ids)).all()}
+        for iso_id in ids:
+            self._rows.pop(iso_id, None)
+            if iso_id in fresh:
+                self._items[iso_id] = ISOResponse.model_validate(fresh[iso_id])
+            else:
+                self._items.pop(iso_id, None)
+        self._seq = changes[-1].seq
+        self._changed()
+
+    # ── lectures ─────────────────────────────────────────────────────
+
+    def get(self, db: Session, iso_id: int) -> Optional[ISOResponse]:
+        with self._lock:
+            self._sync(db)
+            return self._items.get(iso_id)
+
+    def list(self, db: Session, page: int, per_page: int, favorites: Optional[bool] = None,
+             category: Optional[str] = None, os: Optional[str] = None, arch: Optional[str] = None,
+             edition: Optional[str] = None, q: Optional[str] = None, tags: Sequence[str] = (),
+             tag_mode: str = "all", fields: Optional[Sequence[str]] = None) -> Tuple[List[dict], int]:
+        """
+        Mêmes filtres et même ordre (created_at décroissant) que la requête SQL de list_isos ;
+        lignes complètes ou réduites à fields. Les dict retournés sont partagés : ne pas les modifier.
+        """
+        tags = tuple(sorted(tags))
+        key = (bool(favorites), category, (os or "").lower(), arch, edition, (q or "").lower(), tags, tag_mode)
+        with self._lock:
+            self._sync(db)
+            ids = self._queries.get(key)
+            if ids is None:
+                # tags : ids lus sur l'index iso_tags, modifié dans les mêmes transactions que isos
+                tagged = set(db.execute(tagged_ids(db, list(tags), tag_mode)).scalars()) if tags else None
+                ids = [iso.id for iso in self._filter(*key[:6], tagged)]
+                self._queries[key] = ids
+                if len(self._queries) > self.max_queries:
+                    self._queries.popitem(last=False)
+            else:
+                self._queries.move_to_end(key)
+            start = (page - 1) * per_page
+            rows = [self._row(i) for i in ids[start:start + per_page]]
+        if fields:
+            rows = [{f: row[f] for f in fields} for row in rows]
+        return rows, len(ids)
+
+    def _row(self, iso_id: int) -> dict:
+        row = self._rows.get(iso_id)
+        if row is None:
+            row = self._rows[iso_id] = self._items[iso_id].model_dump()
+        return row
+
+    def _filter(self, favorites, category, os, arch, edition, q, tagged):
+        if self._ordered is None:
+            self._ordered = [
+                iso.id for iso in sorted(
+                    self._items.values(),
+                    key=lambda i: (i.created_at is not None, i.created_at or 0, i.id), reverse=True,
+                )
+            ]
+        for iso_id in self._ordered:
+            iso = self._items[iso_id]
+            if tagged is not None and iso_id not in tagged:
+                continue
+            if favorites and not iso.is_favorite:
+                continue
+            if category and iso.category != category:
+                continue
+            if os and not _contains(iso.os_family, os):
+                continue
+            if arch and iso.architecture != arch:
+                continue
+            if edition and iso.edition != edition:
+                continue
+            if q and not any(_contains(getattr(iso, f), q) for f in SEARCH_FIELDS):
+                continue
+            yield iso
+
+    def browse(self, db: Session, key: tuple, build: Callable[[], dict]) -> dict:
+        """
+        Résultat de build() mémorisé tant que le catalogue et key (mtimes des racines) sont
+        inchangés, et au plus BROWSE_MAX_AGE secondes (taille d'un fichier non suivi qui grossit).
+        """
+        with self._lock:
+            self._sync(db)
+            seq = self._seq
+            if self._browse and self._browse[0] == key and time.monotonic() - self._browse[1] < BROWSE_MAX_AGE:
+                return self._browse[2]
+        result = build()
+        with self._lock:
+            if self._seq == seq:  # sinon le catalogue a changé pendant build()
+                self._browse = (key, time.monotonic(), result)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "items": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "cached_queries": len(self._queries),
+        }
+
+
+catalog_cache = CatalogCache()
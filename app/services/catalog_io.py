@@ -0,0 +1,246 @@
+"""
+Export / import du catalogue en NDJSON (un objet JSON par ligne).
+
+- Export : curseur côté serveur (yield_per), mémoire constante quelle que soit la taille du catalogue
+- Import : flux de lignes appliqué par lots de IMPORT_BATCH enregistrements, un commit par lot.
+  Si le fichier présent dans le stockage a la même identité que celle exportée
+  (taille et mtime du fichier physique, ou taille seule avec match="size"), le SHA256
+  et le manifeste exportés sont repris tels quels : rien n'est re-haché. Sinon l'entrée
+  est créée en 'verifying' et son SHA256 est calculé ensuite, en file.
+"""
+import asyncio
+import base64
+import json
+import os
+from datetime import datetime
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from app.config import BASE_URL
+from app.database import SessionLocal
+from app.models import ISO, ISOManifest
+from app.schemas import CatalogRecord
+from app.services.cold_storage import cold_path, image_size
+from app.services.iso_service import storage_file
+from app.services.job_service import update_job
+from app.services.manifest_service import DIGEST_SIZE, merkle_root, split_leaves
+
+EXPORT_BATCH = 500
+IMPORT_BATCH = 1000
+MAX_LINE_BYTES = 32 * 1024 * 1024  # un manifeste d'image de 1 To tient en ~11 Mo base64
+REJECTED_SAMPLE = 100
+
+EXPORT_FIELDS = [
+    "name", "filename", "category", "os_family", "edition", "file_format", "version",
+    "architecture", "size_bytes", "sha256", "sha512", "md5", "expected_checksum",
+    "checksum_type", "checksum_verified", "description", "tags", "source_url", "add_method",
+    "is_favorite", "upstream_sha256", "last_verified_at", "status", "storage_mode", "created_at",
+]
+
+
+def _physical_stat(path: str) -> Optional[os.stat_result]:
+    """stat du fichier réellement stocké (brut, sinon sa version froide)."""
+    for physical in (path, cold_path(path)):
+        try:
+            return os.stat(physical)
+        except FileNotFoundError:
+            continue
+    return None
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _export_line(iso: ISO, manifest: Optional[ISOManifest]) -> str:
+    record = {field: getattr(iso, field) for field in EXPORT_FIELDS}
+    st = _physical_stat(iso.file_path or "") if iso.file_path else None
+    if st:
+        record["file_identity"] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if manifest:
+        record["manifest"] = {
+            "block_size": manifest.block_size,
+            "leaves": base64.b64encode(manifest.leaves).decode(),
+        }
+    return json.dumps(record, default=_json_default, separators=(",", ":")) + "\n"
+
+
+def iter_catalog_ndjson(manifests: bool = True) -> Iterator[bytes]:
+    """Génère le catalogue en NDJSON, par paquets d'environ 64 Kio."""
+    db = SessionLocal()
+    try:
+        if manifests:
+            query = db.query(ISO, ISOManifest).outerjoin(ISOManifest, ISOManifest.iso_id == ISO.id)
+        else:
+            query = db.query(ISO)
+        buffer = []
+        buffered = 0
+        for row in query.order_by(ISO.id).yield_per(EXPORT_BATCH):
+            iso, manifest = row if manifests else (row, None)
+            line = _export_line(iso, manifest)
+            buffer.append(line)
+            buffered += len(line)
+            if buffered >= 64 * 1024:
+                yield "".join(buffer).encode()
+                buffer, buffered = [], 0
+        if buffer:
+            yield "".join(buffer).encode()
+    finally:
+        db.close()
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Découpe un corps de requête en lignes, sans jamais le charger en entier."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line
+        if len(pending) > MAX_LINE_BYTES:
+            raise HTTPException(status_code=413, detail=f"NDJSON line longer than {MAX_LINE_BYTES} bytes")
+    if pending:
+        yield pending
+
+
+def _exported_manifest(record: CatalogRecord, size: int) -> Optional[Tuple[int, bytes]]:
+    """(block_size, feuilles) du manifeste exporté, s'il est cohérent avec la taille de l'image."""
+    manifest = record.manifest or {}
+    try:
+        block_size = int(manifest["block_size"])
+        leaves = base64.b64decode(manifest["leaves"], validate=True)
+    except (KeyError, TypeError, ValueError):
+        return None
+    blocks = max(1, -(-size // block_size)) if block_size > 0 else 0
+    if not block_size or len(leaves) != blocks * DIGEST_SIZE:
+        return None
+    return block_size, leaves
+
+
+def _identity_matches(record: CatalogRecord, st: os.stat_result, match: str) -> bool:
+    identity = record.file_identity or {}
+    if not record.sha256 or record.status not in (None, "available") or identity.get("size") != st.st_size:
+        return False
+    return match == "size" or identity.get("mtime_ns") == st.st_mtime_ns
+
+
+def import_batch(records: List[CatalogRecord], match: str = "mtime") -> dict:
+    """
+    Crée les entrées d'un lot en une transaction.
+    Retourne les compteurs, les rejets et les ids dont le SHA256 reste à calculer.
+    """
+    outcome = {"imported": 0, "reused_hashes": 0, "skipped": 0, "rejected": [], "to_hash": []}
+    db = SessionLocal()
+    try:
+        names = {os.path.basename(r.filename) for r in records}
+        tracked = {row.filename for row in db.query(ISO.filename).filter(ISO.filename.in_(names))}
+        created = []
+        for record in records:
+            filename = os.path.basename(record.filename)
+            if filename in tracked:
+                outcome["skipped"] += 1
+                continue
+            try:
+                file_path = storage_file(filename)
+            except HTTPException as e:
+                outcome["rejected"].append({"filename": record.filename, "detail": e.detail})
+                continue
+            st = _physical_stat(file_path)
+            if st is None:
+                outcome["rejected"].append({"filename": filename, "detail": "File not found in storage"})
+                continue
+            cold = not os.path.exists(file_path)
+            reuse = _identity_matches(record, st, match)
+            try:
+                size = record.size_bytes if reuse and record.size_bytes is not None else image_size(file_path)
+            except (OSError, ValueError) as e:
+                outcome["rejected"].append({"filename": filename, "detail": f"Unreadable cold image: {e}"})
+                continue
+            fields = record.model_dump(include=set(EXPORT_FIELDS) - {"filename", "name", "add_method", "status", "storage_mode", "size_bytes"})
+            if not reuse:
+                for field in ("sha256", "sha512", "md5", "checksum_verified", "last_verified_at"):
+                    fields.pop(field, None)
+            fields = {k: v for k, v in fields.items() if v is not None}
+            iso = ISO(
+                **{**fields, "filename": filename},
+                name=record.name or os.path.splitext(filename)[0],
+                add_method=record.add_method or "import",
+                status="available" if reuse else "verifying",
+                download_progress=100 if reuse else 0,
+                size_bytes=size,
+                file_path=file_path,
+                http_url=f"{BASE_URL}/files/{filename}",
+                storage_mode="zstd" if cold else "raw",
+                stored_bytes=st.st_size if cold else None,
+            )
+            db.add(iso)
+            tracked.add(filename)
+            created.append((iso, reuse, _exported_manifest(record, size) if reuse else None))
+        db.flush()
+        for iso, reuse, manifest in created:
+            outcome["imported"] += 1
+            if not reuse:
+                outcome["to_hash"].append(iso.id)
+                continue
+            outcome["reused_hashes"] += 1
+            if manifest:
+                block_size, leaves = manifest
+                db.add(ISOManifest(iso_id=iso.id, block_size=block_size, leaves=leaves))
+                iso.merkle_root = merkle_root(split_leaves(leaves)).hex()
+                iso.manifest_block_size = block_size
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return outcome
+
+
+async def import_ndjson(lines: AsyncIterator[bytes], job_id: int, match: str = "mtime") -> dict:
+    """
+    Applique un flux NDJSON par lots (un lot = une transaction, hors boucle d'événements).
+    Retourne le bilan ; les ids à hacher sont dans summary["to_hash"].
+    """
+    summary = {"records": 0, "imported": 0, "reused_hashes": 0, "skipped": 0,
+               "rejected": 0, "rejected_sample": [], "to_hash": []}
+
+    def reject(entry: dict) -> None:
+        summary["rejected"] += 1
+        if len(summary["rejected_sample"]) < REJECTED_SAMPLE:
+            summary["rejected_sample"].append(entry)
+
+    async def flush(batch: List[CatalogRecord]) -> None:
+        outcome = await asyncio.to_thread(import_batch, batch, match)
+        for key in ("imported", "reused_hashes", "skipped"):
+            summary[key] += outcome[key]
+        for entry in outcome["rejected"]:
+            reject(entry)
+        summary["to_hash"].extend(outcome["to_hash"])
+        # Les entrées reprises telles quelles et les doublons sont terminés ; les autres attendent leur hachage
+        update_job(job_id, total=len(batch), done=outcome["reused_hashes"] + outcome["skipped"],
+                   failed=len(outcome["rejected"]))
+
+    batch: List[CatalogRecord] = []
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+        summary["records"] += 1
+        try:
+            batch.append(CatalogRecord.model_validate_json(line))
+        except ValidationError as e:
+            reject({"line": line_no, "detail": e.errors(include_url=False)[0]["msg"]})
+            update_job(job_id, total=1, failed=1)
+            continue
+        if len(batch) >= IMPORT_BATCH:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+    return summary
@@ -0,0 +1,245 @@
+"""
+Stockage froid : recompression d'une image au format zstd « seekable ».
+
+Le fichier .<nom>.cold.zst (caché, à côté de l'image) est une suite de trames zstd indépendantes (COLD_STORAGE_FRAME_SIZE
+octets décompressés chacune) suivie d'une table de saut dans une trame « skippable »,
+selon le format seekable de zstd (contrib/seekable_format) — lisible par les outils standards.
+
+Tant que <nom> n'existe pas mais que sa version froide est un zstd seekable, les lectures
+(service /files, hachage, scrub, manifeste) passent par open_image() et voient les
+octets d'origine : SHA256 et Range inchangés pour les clients.
+
+Le nom caché ne peut pas être celui d'une image du catalogue (les noms commençant par un
+point sont refusés à l'ingestion) : un fichier <nom>.zst téléversé n'est jamais pris pour
+la version froide de <nom>. Les versions froides des anciennes versions (<nom>.zst) sont
+renommées au démarrage (storage_service.adopt_legacy_cold).
+"""
+import bisect
+import hashlib
+import os
+import struct
+from typing import List, Optional, Tuple
+
+import zstandard
+
+from app.config import COLD_STORAGE_FRAME_SIZE, COLD_STORAGE_LEVEL
+
+COLD_SUFFIX = ".cold.zst"
+LEGACY_COLD_SUFFIX = ".zst"
+
+SKIPPABLE_MAGIC = 0x184D2A5E
+SEEKABLE_MAGIC = 0x8F92EAB1
+FOOTER_SIZE = 9  # nombre de trames (u32) + descripteur (u8) + magic (u32)
+
+
+def cold_path(path: str) -> str:
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}{COLD_SUFFIX}")
+
+
+def is_cold_name(name: str) -> bool:
+    """Nom réservé à une version froide (jamais un nom d'image du catalogue)."""
+    return name.startswith(".") and name.endswith(COLD_SUFFIX)
+
+
+def _read_seek_table(f) -> List[Tuple[int, int]]:
+    """Retourne [(taille compressée, taille décompressée)] ; ValueError si pas seekable."""
+    f.seek(0, os.SEEK_END)
+    end = f.tell()
+    if end < FOOTER_SIZE + 8:
+        raise ValueError("Not a seekable zstd file")
+    f.seek(end - FOOTER_SIZE)
+    nframes, descriptor, magic = struct.unpack("<IBI", f.read(FOOTER_SIZE))
+    if magic != SEEKABLE_MAGIC:
+        raise ValueError("Not a seekable zstd file")
+    entry_size = 12 if descriptor & 0x80 else 8
+    table_size = nframes * entry_size
+    f.seek(end - FOOTER_SIZE - table_size - 8)
+    skip_magic, frame_size = struct.unpack("<II", f.read(8))
+    if skip_magic != SKIPPABLE_MAGIC or frame_size != table_size + FOOTER_SIZE:
+        raise ValueError("Corrupt seek table")
+    raw = f.read(table_size)
+    return [struct.unpack_from("<II", raw, i * entry_size) for i in range(nframes)]
+
+
+def is_seekable_zstd(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            _read_seek_table(f)
+        return True
+    except (OSError, ValueError, struct.error):
+        return False
+
+
+class SeekableZstdFile:
+    """Lecture aléatoire (read/seek/tell) des octets décompressés d'un zstd seekable."""
+
+    def __init__(self, path: str):
+        self._f = open(path, "rb")
+        try:
+            table = _read_seek_table(self._f)
+        except Exception:
+            self._f.close()
+            raise
+        self._c_offsets = [0]
+        self._d_offsets = [0]
+        for c_size, d_size in table:
+            self._c_offsets.append(self._c_offsets[-1] + c_size)
+            self._d_offsets.append(self._d_offsets[-1] + d_size)
+        self.size = self._d_offsets[-1]
+        self._pos = 0
+        self._dctx = zstandard.ZstdDecompressor()
+        self._frame_index: Optional[int] = None
+        self._frame: bytes = b""
+
+    def _load_frame(self, index: int) -> bytes:
+        if index != self._frame_index:
+            self._f.seek(self._c_offsets[index])
+            compressed = self._f.read(self._c_offsets[index + 1] - self._c_offsets[index])
+            self._frame = self._dctx.decompress(compressed)
+            self._frame_index = index
+        return self._frame
+
+    def read(self, n: int = -1) -> bytes:
+        if self._pos >= self.size:
+            return b""
+        if n is None or n < 0:
+            n = self.size - self._pos
+        out = bytearray()
+        while n > 0 and self._pos < self.size:
+            index = bisect.bisect_right(self._d_offsets, self._pos) - 1
+            frame = self._load_frame(index)
+            start = self._pos - self._d_offsets[index]
+            piece = frame[start:start + n]
+            out += piece
+            self._pos += len(piece)
+            n -= len(piece)
+        return bytes(out)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def fileno(self) -> int:
+        return self._f.fileno()
+
+    def compressed_offset(self) -> int:
+        """Position atteinte dans le fichier compressé (pour les conseils fadvise)."""
+        return self._f.tell()
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def image_exists(path: str) -> bool:
+    return os.path.isfile(path) or os.path.isfile(cold_path(path))
+
+
+def open_image(path: str):
+    """Ouvre une image en lecture : fichier brut, sinon sa version froide décompressée."""
+    if os.path.exists(path):
+        return open(path, "rb")
+    cold = cold_path(path)
+    if os.path.exists(cold):
+        return SeekableZstdFile(cold)
+    raise FileNotFoundError(path)
+
+
+def image_size(path: str) -> int:
+    """Taille des octets d'origine (décompressés pour une image froide)."""
+    if os.path.exists(path):
+        return os.path.getsize(path)
+    with SeekableZstdFile(cold_path(path)) as f:
+        return f.size
+
+
+def compress_to_cold(path: str, expected_sha256: Optional[str] = None,
+                     level: int = COLD_STORAGE_LEVEL, frame_size: int = COLD_STORAGE_FRAME_SIZE) -> int:
+    """
+    Recompresse path en cold_path(path) (seekable) puis supprime l'original.
+    Le SHA256 de la source est contrôlé pendant la compression : une image déjà
+    corrompue n'est jamais figée. FileExistsError si la version froide existe déjà.
+    Retourne la taille stockée.
+    """
+    from app.services.io_policy import ScanReader, WriteBehind
+
+    cold = cold_path(path)
+    if os.path.exists(cold):
+        raise FileExistsError(f"{os.path.basename(cold)} already exists")
+    tmp = cold + ".tmp"
+    cctx = zstandard.ZstdCompressor(level=level, write_checksum=True, threads=-1)
+    h = hashlib.sha256()
+    entries = []
+    written = 0
+    try:
+        with ScanReader(path) as src, open(tmp, "wb") as dst:
+            behind = WriteBehind(dst)
+            for block in src.chunks(frame_size):
+                h.update(block)
+                frame = cctx.compress(block)
+                dst.write(frame)
+                written += len(frame)
+                if behind.due(written):
+                    behind.drop()
+                entries.append((len(frame), len(block)))
+            table = b"".join(struct.pack("<II", c, d) for c, d in entries)
+            dst.write(struct.pack("<II", SKIPPABLE_MAGIC, len(table) + FOOTER_SIZE))
+            dst.write(table)
+            dst.write(struct.pack("<IBI", len(entries), 0, SEEKABLE_MAGIC))
+            dst.flush()
+            os.fsync(dst.fileno())
+        if expected_sha256 and h.hexdigest() != expected_sha256.lower():
+            raise ValueError("SHA256 mismatch — source file is not the catalogued image")
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    # version froide en place avant de retirer l'original : l'image reste servie sans interruption
+    os.replace(tmp, cold)
+    os.remove(path)
+    return os.path.getsize(cold)
+
+
+def decompress_from_cold(path: str, reservation=None) -> int:
+    """
+    Restaure path depuis cold_path(path) puis supprime la version froide. Retourne la taille.
+    reservation (storage_service.Reservation) préalloue le fichier restauré.
+    """
+    from app.services.io_policy import ScanReader, WriteBehind
+
+    cold = cold_path(path)
+    tmp = path + ".thaw-tmp"
+    written = 0
+    try:
+        with ScanReader(path) as src, open(tmp, "wb") as dst:
+            if reservation:
+                reservation.attach(dst)
+            behind = WriteBehind(dst)
+            for block in src.chunks(COLD_STORAGE_FRAME_SIZE):
+                dst.write(block)
+                written += len(block)
+                if behind.due(written):
+                    behind.drop()
+            dst.flush()
+            os.fsync(dst.fileno())
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+    os.remove(cold)
+    return os.path.getsize(path)
@@ -0,0 +1,75 @@
+"""
+Maintenance automatique de la base SQLite, toutes les DB_MAINTENANCE_INTERVAL_HOURS :
+- PRAGMA optimize        : statistiques du planificateur à jour
+- PRAGMA incremental_vacuum : rend les pages libres au système, sans le verrou global d'un VACUUM
+- PRAGMA wal_checkpoint(TRUNCATE) : reporte le WAL dans la base et le ramène à zéro
+- élagage du journal catalog_changes (CATALOG_CHANGES_KEEP dernières entrées)
+
+Le vacuum incrémental suppose auto_vacuum=INCREMENTAL. Une base créée avant ce mode ne
+le prend qu'après un VACUUM complet (toute la base réécrite, écritures bloquées) : jamais
+au démarrage ni en tâche planifiée, seulement sur demande (POST /api/maintenance/vacuum,
+carte « Optimiser »).
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import text
+
+from app.config import CATALOG_CHANGES_KEEP, DB_MAINTENANCE_INTERVAL_HOURS, DB_PATH
+from app.database import engine
+
+logger = logging.getLogger("db_maintenance")
+
+last_run = {"at": None, "freed_pages": 0, "db_size_bytes": None, "error": None, "auto_vacuum": None,
+            "converted": False}
+
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+
+def convert_auto_vacuum(conn) -> bool:
+    """Passe une base existante en auto_vacuum=INCREMENTAL (VACUUM complet) ; False si déjà fait."""
+    if conn.execute(text("PRAGMA auto_vacuum")).scalar() == 2:
+        return False
+    conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+    conn.execute(text("VACUUM"))
+    return True
+
+
+def run_db_maintenance(convert: bool = False) -> dict:
+    """convert : autorise la conversion auto_vacuum (VACUUM complet) si la base ne l'a pas encore."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        converted = convert_auto_vacuum(conn) if convert else False
+        freelist = conn.execute(text("PRAGMA freelist_count")).scalar() or 0
+        conn.execute(text(
+            "DELETE FROM catalog_changes WHERE seq <= (SELECT MAX(seq) FROM catalog_changes) - :keep"
+        ), {"keep": CATALOG_CHANGES_KEEP})
+        conn.execute(text("PRAGMA optimize"))
+        if freelist:
+            conn.execute(text("PRAGMA incremental_vacuum")).fetchall()
+        conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)")).fetchall()
+        mode = AUTO_VACUUM_MODES.get(conn.execute(text("PRAGMA auto_vacuum")).scalar())
+    last_run.update({
+        "auto_vacuum": mode,
+        "converted": converted,
+        "at": datetime.utcnow(),
+        "freed_pages": freelist,
+        "db_size_bytes": os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0,
+        "error": None,
+    })
+    return dict(last_run)
+
+
+async def db_maintenance_loop():
+    if DB_MAINTENANCE_INTERVAL_HOURS <= 0:
+        return
+    logger.info(f"Maintenance SQLite planifiée (intervalle : {DB_MAINTENANCE_INTERVAL_HOURS} h)")
+    while True:
+        await asyncio.sleep(DB_MAINTENANCE_INTERVAL_HOURS * 3600)
+        try:
+            result = await asyncio.to_thread(run_db_maintenance)
+            logger.info(f"Maintenance SQLite terminée — {result['freed_pages']} page(s) libérée(s)")
+        except Exception as e:
+            last_run["error"] = str(e)
+            logger.error(f"Erreur maintenance SQLite : {e}")
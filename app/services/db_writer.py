@@ -0,0 +1,163 @@
+"""
+Écrivain SQLite unique.
+
+Un thread dédié exécute les écritures de fond en série et les regroupe par lots
+(fenêtre DB_WRITE_BATCH_MS) dans une seule transaction :
+- queue_update() : mise à jour d'une ligne (progression, statut, compteurs) ; plusieurs
+  mises à jour de la même ligne dans un lot sont fusionnées en un seul UPDATE
+- write() / submit() : fonction arbitraire fn(session), isolée dans un SAVEPOINT
+- flushed() : attend que tout ce qui a été mis en file soit écrit
+
+L'ordre de soumission est respecté : une fonction voit les mises à jour mises en file avant elle.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.config import DB_WRITE_BATCH_MS
+from app.database import SessionLocal
+
+logger = logging.getLogger("db_writer")
+
+MAX_BATCH = 500
+
+_queue: "queue.Queue[tuple]" = queue.Queue()
+_thread: Optional[threading.Thread] = None
+_thread_lock = threading.Lock()
+_STOP = ("stop",)
+
+stats = {"batches": 0, "updates_queued": 0, "updates_written": 0, "calls": 0, "errors": 0}
+
+
+def _ensure_started() -> None:
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+    with _thread_lock:
+        if _thread and _thread.is_alive():
+            return
+        _thread = threading.Thread(target=_run, name="db-writer", daemon=True)
+        _thread.start()
+
+
+def queue_update(model, pk: Any, values: Optional[dict] = None, increments: Optional[dict] = None) -> None:
+    """Met en file un UPDATE de la ligne pk ; increments = {colonne: delta} (cumulés)."""
+    _ensure_started()
+    stats["updates_queued"] += 1
+    _queue.put(("update", model, pk, dict(values or {}), dict(increments or {})))
+
+
+def submit(fn: Callable) -> Future:
+    """Exécute fn(session) dans le thread écrivain ; la Future porte son résultat."""
+    _ensure_started()
+    future: Future = Future()
+    _queue.put(("call", fn, future))
+    return future
+
+
+async def write(fn: Callable):
+    return await asyncio.wrap_future(submit(fn))
+
+
+async def flushed() -> None:
+    """Attend que toutes les écritures déjà en file soient validées."""
+    await write(lambda session: None)
+
+
+def flush_sync(timeout: float = 30) -> None:
+    submit(lambda session: None).result(timeout)
+
+
+def stop(timeout: float = 30) -> None:
+    """Vide la file puis arrête le thread (arrêt de l'application)."""
+    if _thread and _thread.is_alive():
+        _queue.put(_STOP)
+        _thread.join(timeout)
+
+
+def _collect() -> Tuple[list, bool]:
+    """Premier élément bloquant, puis tout ce qui arrive pendant la fenêtre de regroupement."""
+    batch = [_queue.get()]
+    deadline = time.monotonic() + DB_WRITE_BATCH_MS / 1000
+    while len(batch) < MAX_BATCH and batch[-1] is not _STOP:
+        remaining = deadline - time.monotonic()
+        try:
+            batch.append(_queue.get(timeout=max(0, remaining)) if remaining > 0 else _queue.get_nowait())
+        except queue.Empty:
+            break
+    stopping = batch[-1] is _STOP
+    if stopping:
+        batch.pop()
+    return batch, stopping
+
+
+def _apply_updates(session, pending: Dict[tuple, dict]) -> None:
+    for (model, pk), change in pending.items():
+        values = dict(change["values"])
+        for col, delta in change["increments"].items():
+            values[col] = getattr(model, col) + delta
+        if hasattr(model, "updated_at") and "updated_at" not in values:
+            values["updated_at"] = datetime.utcnow()
+        pk_col = model.__mapper__.primary_key[0]
+        # Chaque mise à jour dans son propre savepoint : une ligne en erreur n'annule pas le lot
+        try:
+            with session.begin_nested():
+                session.query(model).filter(pk_col == pk).update(values, synchronize_session=False)
+        except Exception as e:
+            stats["errors"] += 1
+            logger.error(f"Mise à jour {model.__tablename__}#{pk} ignorée : {e}")
+            continue
+        stats["updates_written"] += 1
+    pending.clear()
+
+
+def _process(batch: list) -> None:
+    session = SessionLocal()
+    outcomes: Dict[Future, tuple] = {}
+    pending: Dict[tuple, dict] = {}
+    try:
+        for op in batch:
+            if op[0] == "update":
+                _, model, pk, values, increments = op
+                change = pending.setdefault((model, pk), {"values": {}, "increments": {}})
+                change["values"].update(values)
+                for col, delta in increments.items():
+                    change["increments"][col] = change["increments"].get(col, 0) + delta
+            else:
+                _, fn, future = op
+                _apply_updates(session, pending)
+                stats["calls"] += 1
+                try:
+                    with session.begin_nested():
+                        outcomes[future] = (fn(session), None)
+                except Exception as e:
+                    outcomes[future] = (None, e)
+        _apply_updates(session, pending)
+        session.commit()
+        stats["batches"] += 1
+    except Exception as e:
+        session.rollback()
+        stats["errors"] += 1
+        logger.error(f"Lot d'écritures annulé : {e}")
+        outcomes = {op[2]: (None, e) for op in batch if op[0] == "call"}
+    finally:
+        session.close()
+    for future, (result, error) in outcomes.items():
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+
+def _run() -> None:
+    while True:
+        batch, stopping = _collect()
+        if batch:
+            _process(batch)
+        if stopping:
+            return
@@ -0,0 +1,262 @@
+"""
+Décompression à la volée des images livrées compressées (.gz, .xz, .zst) pendant
+le téléchargement ou l'upload : l'image stockée est directement servable, sans
+seconde passe sur le disque.
+
+En une seule lecture du flux :
+- le checksum amont (sha256 / sha512 / md5) est calculé sur les octets compressés reçus
+- le SHA256 et les hachés de blocs du manifeste sont calculés sur la sortie décompressée
+
+La réservation de place (taille compressée ou estimation) grandit au fil de la sortie
+décompressée ; au-delà du quota, InsufficientStorage interrompt l'ingestion.
+
+Pipeline à deux étages : le décodeur tourne dans le thread qui reçoit les morceaux
+(asyncio.to_thread côté appelant), l'écriture disque et le hachage de la sortie dans un
+thread dédié ; zlib, lzma, zstandard et hashlib relâchent le GIL, les deux étages
+avancent donc en parallèle. Les décodeurs de la bibliothèque standard sont eux-mêmes
+mono-thread : la parallélisation se fait entre décodage et hachage/écriture.
+"""
+import hashlib
+import lzma
+import os
+import queue
+import threading
+import zlib
+from typing import Callable, Optional, Tuple
+
+import zstandard
+
+from app.config import MANIFEST_BLOCK_SIZE
+from app.services.hash_service import block_digest
+from app.services.io_policy import WriteBehind
+
+OUTPUT_CHUNK = 4 * 1024 * 1024  # sortie bornée par appel au décodeur (images creuses : ratio énorme)
+QUEUE_DEPTH = 8
+
+CODECS = {".gz": "gzip", ".xz": "xz", ".zst": "zstd"}
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def codec_for(filename: str) -> Optional[str]:
+    return CODECS.get(os.path.splitext(filename or "")[1].lower())
+
+
+def decompressed_name(filename: str) -> str:
+    """'debian.img.xz' -> 'debian.img' ; sans extension restante : '.img'."""
+    base = os.path.splitext(filename)[0]
+    return base if os.path.splitext(base)[1] else base + ".img"
+
+
+def estimated_size(f, codec: str) -> int:
+    """
+    Taille décompressée annoncée par un fichier compressé déjà reçu (f : fichier binaire
+    positionnable), 0 si inconnue : trame zstd avec taille de contenu, champ ISIZE du
+    dernier membre gzip (modulo 2^32 : au moins la taille compressée). Pour xz, 0 ; la
+    réservation grandit alors au fil de la sortie (DecompressingSink).
+    """
+    position = f.tell()
+    try:
+        if codec == "zstd":
+            f.seek(0)
+            size = zstandard.frame_content_size(f.read(18))
+            return max(size, 0)
+        if codec == "gzip":
+            compressed = f.seek(0, os.SEEK_END)
+            if compressed < 18:
+                return 0
+            f.seek(-4, os.SEEK_END)
+            isize = int.from_bytes(f.read(4), "little")
+            while isize < compressed:
+                isize += 2 ** 32
+            return isize
+        return 0
+    except (OSError, zstandard.ZstdError):
+        return 0
+    finally:
+        f.seek(position)
+
+
+class _GzipDecoder:
+    """Gzip multi-membres ; les octets nuls de bourrage après le dernier membre sont ignorés."""
+
+    def __init__(self, emit: Callable[[bytes], None]):
+        self._emit = emit
+        self._d = zlib.decompressobj(wbits=31)
+        self._trailing = False
+
+    def feed(self, data: bytes) -> None:
+        pending = bool(data)
+        while pending and not self._trailing:
+            if self._d.eof:
+                if not data:
+                    return
+                if data[:2] != GZIP_MAGIC[:len(data[:2])]:
+                    self._trailing = True
+                    return
+                self._d = zlib.decompressobj(wbits=31)
+            out = self._d.decompress(data, OUTPUT_CHUNK)
+            if out:
+                self._emit(out)
+            data = self._d.unused_data if self._d.eof else self._d.unconsumed_tail
+            pending = bool(data) or len(out) == OUTPUT_CHUNK
+
+    def finish(self) -> None:
+        if not self._d.eof:
+            raise ValueError("Flux gzip tronqué")
+
+
+class _XzDecoder:
+    """Flux xz concaténés ; le bourrage de flux (octets nuls) est ignoré."""
+
+    def __init__(self, emit: Callable[[bytes], None]):
+        self._emit = emit
+        self._d = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+        self._started = False
+
+    def feed(self, data: bytes) -> None:
+        while data or (self._started and not self._d.eof and not self._d.needs_input):
+            if self._d.eof:
+                data = data.lstrip(b"\x00")
+                if not data:
+                    return
+                self._d = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+            self._started = True
+            out = self._d.decompress(data, OUTPUT_CHUNK)
+            if out:
+                self._emit(out)
+            data = self._d.unused_data if self._d.eof else b""
+
+    def finish(self) -> None:
+        if not self._d.eof:
+            raise ValueError("Flux xz tronqué")
+
+
+class _ZstdDecoder:
+    """Trames zstd successives, sortie découpée en morceaux de OUTPUT_CHUNK."""
+
+    def __init__(self, emit: Callable[[bytes], None]):
+        self._writer = zstandard.ZstdDecompressor().stream_writer(
+            _Emitter(emit), write_size=OUTPUT_CHUNK, closefd=False,
+        )
+
+    def feed(self, data: bytes) -> None:
+        self._writer.write(data)
+
+    def finish(self) -> None:
+        # zstandard ne signale pas une trame incomplète : la taille annoncée et le
+        # checksum amont (calculé sur les octets reçus) couvrent ce cas
+        self._writer.flush()
+
+
+class _Emitter:
+    def __init__(self, emit: Callable[[bytes], None]):
+        self.write = lambda b: emit(bytes(b)) or len(b)
+
+
+_DECODERS = {"gzip": _GzipDecoder, "xz": _XzDecoder, "zstd": _ZstdDecoder}
+
+
+class DecompressingSink:
+    """
+    Reçoit les octets compressés (write, bloquant) et écrit la sortie décompressée dans f.
+    finish() termine le flux et retourne (sha256, feuilles du manifeste) de la sortie.
+    """
+
+    def __init__(self, f, codec: str, checksum_type: Optional[str] = None,
+                 block_size: int = MANIFEST_BLOCK_SIZE, reservation=None):
+        self.f = f
+        self.reservation = reservation  # agrandie au fil de la sortie (storage_service.Reservation.grow)
+        self.codec = codec
+        self.block_size = block_size
+        self.compressed_bytes = 0
+        self.output_bytes = 0
+        self.source_sha256 = hashlib.sha256()
+        checksum_type = (checksum_type or "sha256").lower()
+        self.checksum = None
+        if checksum_type in ("sha512", "md5"):
+            self.checksum = hashlib.new(checksum_type)
+        elif checksum_type == "sha256":
+            self.checksum = self.source_sha256
+        self._sha256 = hashlib.sha256()
+        self._leaves = bytearray()
+        self._block = bytearray()
+        self._behind = WriteBehind(f)
+        self._queue = queue.Queue(maxsize=QUEUE_DEPTH)
+        self._error: Optional[BaseException] = None
+        self._done = False
+        self._decoder = _DECODERS[codec](self._emit)
+        self._thread = threading.Thread(target=self._drain, name="decompress-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, data) -> None:
+        self.source_sha256.update(data)
+        if self.checksum is not None and self.checksum is not self.source_sha256:
+            self.checksum.update(data)
+        self.compressed_bytes += len(data)
+        self._decoder.feed(bytes(data))
+
+    def _emit(self, out: bytes) -> None:
+        if self._error:
+            raise self._error
+        self._queue.put(out)
+
+    def _drain(self) -> None:
+        while (out := self._queue.get()) is not None:
+            if self._error:
+                continue
+            try:
+                if self.reservation is not None:
+                    self.reservation.grow(self.output_bytes + len(out))
+                self.f.write(out)
+                self.output_bytes += len(out)
+                self._hash(out)
+                if self._behind.due(self.output_bytes):
+                    self._behind.drop()
+            except BaseException as e:  # remonté au prochain write() / finish()
+                self._error = e
+
+    def _hash(self, out: bytes) -> None:
+        self._sha256.update(out)
+        view = memoryview(out)
+        if self._block:
+            need = self.block_size - len(self._block)
+            self._block += view[:need]
+            view = view[need:]
+            if len(self._block) < self.block_size:
+                return
+            self._leaves += block_digest(self._block)
+            self._block = bytearray()
+        while len(view) >= self.block_size:
+            self._leaves += block_digest(view[:self.block_size])
+            view = view[self.block_size:]
+        self._block += view
+
+    def _stop(self) -> None:
+        if not self._done:
+            self._done = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def finish(self) -> Tuple[str, bytes]:
+        try:
+            self._decoder.finish()
+        finally:
+            self._stop()
+        if self._error:
+            raise self._error
+        if self._block:
+            self._leaves += block_digest(self._block)
+            self._block = bytearray()
+        return self._sha256.hexdigest(), bytes(self._leaves)
+
+    def abort(self) -> None:
+        self._error = self._error or RuntimeError("Décompression interrompue")
+        self._stop()
+
+    def checksum_matches(self, expected: Optional[str]) -> Optional[bool]:
+        """Checksum amont contre les octets compressés (None sans checksum attendu)."""
+        if not expected:
+            return None
+        if self.checksum is None:
+            return False
+        return self.checksum.hexdigest() == expected.strip().lower()
@@ -0,0 +1,189 @@
+"""
+Déduplication par contenu des images stockées.
+
+Les entrées du catalogue au SHA256 identique restent distinctes (nom, métadonnées,
+URL de service), mais leurs fichiers sont ramenés sur un seul blob physique :
+- reflink (FICLONE) si le système de fichiers le permet — copie-sur-écriture
+- hardlink sinon — le blob n'est libéré qu'à la suppression du dernier lien
+
+Modes (DEDUP_MODE) : off / hardlink / reflink / auto (reflink puis hardlink).
+"""
+import asyncio
+import fcntl
+import logging
+import os
+import shutil
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import DEDUP_MODE
+from app.database import SessionLocal
+from app.models import ISO
+from app.services.storage_service import path_for
+
+logger = logging.getLogger("dedup")
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) — linux/fs.h
+
+
+def _reflink(src: str, dst: str) -> None:
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def link_blob(src: str, dst: str, mode: str = DEDUP_MODE) -> str:
+    """
+    Remplace (ou crée) dst par une référence au contenu de src.
+    Le remplacement est atomique : dst n'est jamais absent ou partiel.
+    Retourne la méthode utilisée ("reflink", "hardlink" ou "copy").
+    mode "off" : jamais d'inode partagé — reflink (copie-sur-écriture) sinon copie complète.
+    """
+    tmp = os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}.dedup-tmp")
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+
+    method = None
+    if mode in ("reflink", "auto", "off"):
+        try:
+            _reflink(src, tmp)
+            method = "reflink"
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            if mode == "reflink":
+                raise
+    if method is None and mode == "off":
+        shutil.copyfile(src, tmp)
+        method = "copy"
+    elif method is None:
+        os.link(src, tmp)
+        method = "hardlink"
+
+    os.replace(tmp, dst)
+    return method
+
+
+def release_file(path: str) -> int:
+    """
+    Supprime un fichier et retourne le nombre d'octets réellement libérés :
+    0 tant qu'un autre hardlink référence encore le même blob.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return 0
+    os.remove(path)
+    return st.st_size if st.st_nlink <= 1 else 0
+
+
+def _file_path(iso: ISO) -> str:
+    return path_for(iso.filename)
+
+
+def find_blob(db: Session, sha256: str, exclude_id: Optional[int] = None) -> Optional[ISO]:
+    """Retourne une entrée disponible dont le fichier contient ce SHA256."""
+    query = db.query(ISO).filter(ISO.sha256 == sha256.lower(), ISO.status == "available")
+    if exclude_id is not None:
+        query = query.filter(ISO.id != exclude_id)
+    for candidate in query.order_by(ISO.id).all():
+        if os.path.isfile(_file_path(candidate)):
+            return candidate
+    return None
+
+
+def _dedup_one(db: Session, iso: ISO) -> int:
+    """Lie le fichier de iso sur le blob canonique. Retourne les octets économisés."""
+    if not iso.sha256 or iso.status != "available":
+        return 0
+    canonical = find_blob(db, iso.sha256, exclude_id=iso.id)
+    if not canonical:
+        return 0
+
+    src, dst = _file_path(canonical), _file_path(iso)
+    try:
+        st_src, st_dst = os.stat(src), os.stat(dst)
+    except FileNotFoundError:
+        return 0
+    if (st_src.st_dev, st_src.st_ino) == (st_dst.st_dev, st_dst.st_ino):
+        return 0  # déjà partagé
+    if st_src.st_dev != st_dst.st_dev or st_src.st_size != st_dst.st_size:
+        return 0
+
+    method = link_blob(src, dst)
+    saved = st_dst.st_size if st_dst.st_nlink <= 1 else 0
+    logger.info(f"Dédup : {iso.filename} → {canonical.filename} ({method}, {saved} octets libérés)")
+    return saved
+
+
+async def dedup_iso(iso_id: int) -> int:
+    """À appeler après le calcul du SHA256 d'une image. No-op si DEDUP_MODE=off."""
+    if DEDUP_MODE == "off":
+        return 0
+    db = SessionLocal()
+    try:
+        iso = db.query(ISO).filter(ISO.id == iso_id).first()
+        if not iso:
+            return 0
+        return await asyncio.to_thread(_dedup_one, db, iso)
+    except Exception as e:
+        logger.error(f"Dédup échouée pour id={iso_id} : {e}")
+        return 0
+    finally:
+        db.close()
+
+
+def run_dedup(db: Session) -> int:
+    """Passe complète sur la bibliothèque. Retourne les octets libérés."""
+    if DEDUP_MODE == "off":
+        return 0
+    saved = 0
+    isos = db.query(ISO).filter(ISO.status == "available", ISO.sha256.isnot(None)).order_by(ISO.id).all()
+    for iso in isos:
+        try:
+            saved += _dedup_one(db, iso)
+        except OSError as e:
+            logger.error(f"Dédup échouée pour {iso.filename} : {e}")
+    return saved
+
+
+def dedup_report(db: Session) -> dict:
+    """
+    Octets logiques (somme des tailles catalogue) vs octets physiques (inodes distincts).
+    Les reflinks ne sont pas détectables par stat : ils comptent comme physiques.
+    """
+    groups: dict = {}
+    for iso in db.query(ISO).filter(ISO.status == "available", ISO.sha256.isnot(None)).all():
+        groups.setdefault(iso.sha256, []).append(iso)
+
+    logical = physical = reclaimable = 0
+    duplicates = []
+    for sha256, isos in groups.items():
+        inodes = {}
+        for iso in isos:
+            try:
+                st = os.stat(_file_path(iso))
+            except FileNotFoundError:
+                continue
+            logical += st.st_size
+            inodes[(st.st_dev, st.st_ino)] = st.st_size
+        physical += sum(inodes.values())
+        if len(isos) > 1:
+            size = max(inodes.values(), default=0)
+            reclaimable += size * (len(inodes) - 1)
+            duplicates.append({
+                "sha256": sha256,
+                "size_bytes": size,
+                "references": len(isos),
+                "blobs": len(inodes),
+                "ids": [i.id for i in isos],
+            })
+
+    return {
+        "mode": DEDUP_MODE,
+        "logical_bytes": logical,
+        "physical_bytes": physical,
+        "bytes_saved": logical - physical,
+        "bytes_reclaimable": reclaimable,
+        "duplicate_groups": duplicates,
+    }
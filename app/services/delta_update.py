@@ -0,0 +1,526 @@
+"""
+Mise à jour différentielle d'une image, façon zsync.
+
+Quand l'amont publie <url>.zsync (format de zsync 0.6 : pour chaque bloc de la nouvelle
+image, somme glissante et MD4 tronqués), la nouvelle version est reconstruite à partir des
+blocs déjà présents dans l'image locale ; seules les plages manquantes sont téléchargées,
+par requêtes Range. Sans .zsync, ou si l'image reconstruite ne correspond pas au SHA-1
+annoncé, on retombe sur un téléchargement complet (raison dans le résultat du job), ou le
+job échoue si la requête l'interdit (allow_full=false).
+
+Recherche des blocs locaux : l'image locale est parcourue aux offsets multiples de
+SCAN_STEP (un secteur de 2048 octets), un MD4 (en C) par secteur. Après une correspondance
+la lecture se poursuit bloc par bloc à partir de l'offset trouvé. Quand le bloc attendu
+manque, la somme glissante est calculée octet par octet sur la fenêtre suivante (une
+taille de bloc, donc tous les décalages possibles) et chaque position dont la somme figure
+au .zsync est vérifiée par MD4 : des données décalées d'un nombre d'octets quelconque
+(insertion non alignée) sont retrouvées. Cette recherche, lente en CPython, n'est faite
+qu'au premier bloc manquant puis tous les ROLL_INTERVAL pas dans une zone qui diffère.
+Chaque correspondance est confirmée par le bloc suivant quand le .zsync l'exige
+(seq_matches), puis l'image entière par son SHA-1.
+
+Le moteur (parse_zsync, assemble, make_zsync) ne fait aucune vérification SSRF :
+run_delta_update valide les URL avant de l'appeler.
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import hashlib
+import logging
+import os
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import accumulate
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import urljoin
+
+import httpx
+
+from app.config import BASE_URL
+from app.database import SessionLocal
+from app.models import ISO
+from app.services.db_writer import flushed, queue_update
+from app.services.dns_service import validate_url
+from app.services.io_policy import ScanReader
+from app.services.job_service import update_job
+
+logger = logging.getLogger("delta_update")
+
+SCAN_STEP = 2048
+ROLL_INTERVAL = 64                  # pas manqués entre deux recherches par somme glissante
+SCAN_READ_SIZE = 8 * 1024 * 1024
+RANGE_MERGE_GAP = 16 * 1024         # plages manquantes séparées de moins : une seule requête
+MAX_CONTROL_BYTES = 256 * 1024 * 1024
+
+
+class DeltaMismatch(ValueError):
+    """L'image reconstruite ne correspond pas au SHA-1 du .zsync."""
+
+
+def _md4_function() -> Optional[Callable[[bytes], bytes]]:
+    """MD4 de hashlib si OpenSSL l'expose encore, sinon MD4() de libcrypto ; None sinon."""
+    try:
+        hashlib.new("md4")
+        return lambda data: hashlib.new("md4", data).digest()
+    except ValueError:
+        pass
+    path = ctypes.util.find_library("crypto")
+    try:
+        fn = ctypes.CDLL(path).MD4 if path else None
+    except (OSError, AttributeError):
+        fn = None
+    if fn is None:
+        return None
+    fn.argtypes = [ctypes.c_char_p, ctypes.c_size_t, ctypes.c_char_p]
+    fn.restype = ctypes.c_void_p
+
+    def md4(data: bytes) -> bytes:
+        out = ctypes.create_string_buffer(16)
+        fn(data, len(data), out)
+        return out.raw
+
+    return md4
+
+
+md4 = _md4_function()
+
+
+def rsum(block: bytes) -> int:
+    """Somme glissante de zsync : a = Σ x, b = Σ (n - i)·x, modulo 2¹⁶ ; (a << 16) | b."""
+    a = sum(block) & 0xFFFF
+    b = sum(accumulate(block)) & 0xFFFF
+    return (a << 16) | b
+
+
+@dataclass
+class ZsyncControl:
+    blocksize: int
+    length: int
+    seq_matches: int
+    rsum_bytes: int
+    checksum_bytes: int
+    table: bytes
+    url: Optional[str] = None
+    sha1: Optional[str] = None
+    filename: Optional[str] = None
+
+    @property
+    def blocks(self) -> int:
+        return -(-self.length // self.blocksize)
+
+    def checksum(self, index: int) -> bytes:
+        start = index * (self.rsum_bytes + self.checksum_bytes) + self.rsum_bytes
+        return self.table[start:start + self.checksum_bytes]
+
+    def weak_sum(self, index: int) -> int:
+        """Somme glissante du bloc, tronquée à ses rsum_bytes derniers octets."""
+        start = index * (self.rsum_bytes + self.checksum_bytes)
+        return int.from_bytes(self.table[start:start + self.rsum_bytes], "big")
+
+
+def parse_zsync(data: bytes) -> ZsyncControl:
+    """Fichier de contrôle .zsync → ZsyncControl ; ValueError s'il est invalide."""
+    head, sep, table = data.partition(b"\n\n")
+    if not sep:
+        raise ValueError("Invalid .zsync file: no header terminator")
+    headers = {}
+    for line in head.decode("utf-8", errors="replace").splitlines():
+        key, _, value = line.partition(":")
+        headers[key.strip().lower()] = value.strip()
+    try:
+        blocksize = int(headers["blocksize"])
+        length = int(headers["length"])
+        seq_matches, rsum_bytes, checksum_bytes = (int(x) for x in headers["hash-lengths"].split(","))
+    except (KeyError, ValueError):
+        raise ValueError("Invalid .zsync file: missing Blocksize, Length or Hash-Lengths")
+    if blocksize <= 0 or not (1 <= rsum_bytes <= 4) or not (1 <= checksum_bytes <= 16):
+        raise ValueError("Invalid .zsync file: unsupported hash lengths")
+    control = ZsyncControl(
+        blocksize=blocksize, length=length, seq_matches=seq_matches,
+        rsum_bytes=rsum_bytes, checksum_bytes=checksum_bytes, table=table,
+        url=headers.get("url"), sha1=(headers.get("sha-1") or "").lower() or None,
+        filename=headers.get("filename"),
+    )
+    if len(table) < control.blocks * (rsum_bytes + checksum_bytes):
+        raise ValueError("Invalid .zsync file: truncated block table")
+    return control
+
+
+def make_zsync(path: str, blocksize: int = SCAN_STEP, url: Optional[str] = None,
+               seq_matches: int = 2, rsum_bytes: int = 4, checksum_bytes: int = 8) -> bytes:
+    """Fichier de contrôle .zsync d'une image (publication, bancs d'essai)."""
+    if md4 is None:
+        raise RuntimeError("MD4 is not available (hashlib / libcrypto)")
+    sha1 = hashlib.sha1()
+    table = bytearray()
+    length = 0
+    with ScanReader(path) as f:
+        for block in f.chunks(blocksize):
+            sha1.update(block)
+            length += len(block)
+            block = block.ljust(blocksize, b"\0")
+            table += rsum(block).to_bytes(4, "big")[4 - rsum_bytes:]
+            table += md4(block)[:checksum_bytes]
+    header = (
+        "zsync: 0.6.2\n"
+        f"Filename: {os.path.basename(path)}\n"
+        f"Blocksize: {blocksize}\n"
+        f"Length: {length}\n"
+        f"Hash-Lengths: {seq_matches},{rsum_bytes},{checksum_bytes}\n"
+        f"URL: {url or os.path.basename(path)}\n"
+        f"SHA-1: {sha1.hexdigest()}\n\n"
+    )
+    return header.encode() + bytes(table)
+
+
+class _BlockIndex:
+    """
+    Index des blocs cible par MD4 tronqué : un seul tableau trié d'entiers
+    (clé << bits d'index | index), soit 8 octets par bloc au lieu d'un dict Python.
+    """
+
+    def __init__(self, control: ZsyncControl):
+        self.control = control
+        self.index_bits = max(1, control.blocks.bit_length())
+        self.key_bits = min(control.checksum_bytes * 8, 64 - self.index_bits)
+        self._mask = (1 << self.index_bits) - 1
+        self._packed = array("Q", sorted(
+            (self._key(control.checksum(i)) << self.index_bits) | i for i in range(control.blocks)
+        ))
+
+    def _key(self, checksum: bytes) -> int:
+        return int.from_bytes(checksum, "big") >> (len(checksum) * 8 - self.key_bits)
+
+    def candidates(self, checksum: bytes) -> List[int]:
+        key = self._key(checksum)
+        found = []
+        j = bisect_left(self._packed, key << self.index_bits)
+        while j < len(self._packed) and self._packed[j] >> self.index_bits == key:
+            index = self._packed[j] & self._mask
+            if self.control.checksum(index) == checksum:
+                found.append(index)
+            j += 1
+        return found
+
+
+def _rolling_hits(buf: bytes, start: int, stop: int, bs: int, sums: set, mask: int):
+    """
+    Offsets k de [start, stop) dont la somme glissante de buf[k:k + bs] figure dans sums,
+    mise à jour octet par octet : a += x_in - x_out ; b += a - bs·x_out.
+    """
+    stop = min(stop, len(buf) - bs + 1)
+    if start >= stop:
+        return
+    value = rsum(buf[start:start + bs])
+    a, b = value >> 16, value & 0xFFFF
+    for k in range(start, stop):
+        if k > start:
+            out = buf[k - 1]
+            a = (a - out + buf[k + bs - 1]) & 0xFFFF
+            b = (b - bs * out + a) & 0xFFFF
+        if ((a << 16) | b) & mask in sums:
+            yield k
+
+
+def _reuse_local_blocks(control: ZsyncControl, local_path: str, fd: int,
+                        progress: Optional[Callable[[float], None]] = None) -> Tuple[bytearray, int]:
+    """
+    Copie dans fd (au bon offset) chaque bloc cible trouvé dans l'image locale.
+    Retourne (blocs obtenus, octets réutilisés).
+    """
+    bs, n, ck = control.blocksize, control.blocks, control.checksum_bytes
+    step = SCAN_STEP if bs % SCAN_STEP == 0 else bs
+    index = _BlockIndex(control)
+    sums = {control.weak_sum(i) for i in range(n)}
+    mask = (1 << control.rsum_bytes * 8) - 1
+    have = bytearray(n)
+    done_keys = set()  # checksums dont tous les blocs cible sont déjà obtenus (ex. blocs nuls)
+    reused = 0
+    local_size = os.path.getsize(local_path) if os.path.exists(local_path) else None
+    last = None  # (offset local, bloc cible) de la dernière correspondance acceptée
+
+    def digest(window: bytes) -> bytes:
+        return md4(window.ljust(bs, b"\0"))[:ck]
+
+    def match(offset: int) -> bool:
+        nonlocal reused, last
+        window = buf[offset - base:offset - base + bs]
+        checksum = digest(window)
+        if checksum in done_keys:
+            return False
+        matched = pending = False
+        candidates = index.candidates(checksum)
+        for target in candidates:
+            if have[target]:
+                continue
+            confirmed = (
+                control.seq_matches < 2 or target == n - 1 or last == (offset - bs, target - 1)
+                or digest(buf[offset - base + bs:offset - base + 2 * bs]) == control.checksum(target + 1)
+            )
+            if not confirmed:
+                pending = True
+                continue
+            size = min(bs, control.length - target * bs)
+            os.pwrite(fd, window[:size].ljust(size, b"\0"), target * bs)
+            have[target] = 1
+            reused += size
+            last = (offset, target)
+            matched = True
+        if not pending and all(have[t] for t in candidates):
+            done_keys.add(checksum)
+        return matched
+
+    with ScanReader(local_path) as src:
+        buf, base, offset, eof, misses = b"", 0, 0, False, 0
+        while True:
+            if not eof and offset + 3 * bs > base + len(buf):
+                chunk = src.read(SCAN_READ_SIZE)
+                if chunk:
+                    buf, base = buf[offset - base:] + chunk, offset
+                    if progress and local_size:
+                        progress(min(1.0, (base + len(buf)) / local_size))
+                else:
+                    eof = True
+                continue
+            if offset >= base + len(buf):
+                break
+            if match(offset):
+                offset += bs
+                misses = 0
+                continue
+            misses += 1
+            if misses % ROLL_INTERVAL == 1:
+                start = offset - base
+                for k in _rolling_hits(buf, start + 1, start + bs, bs, sums, mask):
+                    if match(base + k):
+                        offset, misses = base + k + bs, 0
+                        break
+                else:
+                    offset += step
+            else:
+                offset += step
+    return have, reused
+
+
+def missing_ranges(control: ZsyncControl, have: bytearray, merge_gap: int = RANGE_MERGE_GAP) -> List[Tuple[int, int]]:
+    """Plages d'octets [début, fin] à télécharger, les plus proches fusionnées."""
+    bs = control.blocksize
+    ranges: List[Tuple[int, int]] = []
+    for i, got in enumerate(have):
+        if got:
+            continue
+        start, end = i * bs, min(control.length, (i + 1) * bs) - 1
+        if ranges and start - ranges[-1][1] - 1 <= merge_gap:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def _sha1_of(path: str) -> str:
+    h = hashlib.sha1()
+    with ScanReader(path) as f:
+        for block in f.chunks():
+            h.update(block)
+    return h.hexdigest()
+
+
+async def assemble(control: ZsyncControl, local_path: str, data_url: str, dest_path: str,
+                   client: httpx.AsyncClient, reservation=None,
+                   progress: Optional[Callable[[int], None]] = None) -> dict:
+    """
+    Reconstruit la nouvelle image dans dest_path : blocs locaux, puis plages manquantes
+    téléchargées depuis data_url. DeltaMismatch si le SHA-1 final diffère.
+    """
+    if md4 is None:
+        raise RuntimeError("MD4 is not available (hashlib / libcrypto)")
+    with open(dest_path, "wb") as f:
+        if reservation:
+            reservation.attach(f)
+        f.truncate(control.length)
+        fd = f.fileno()
+
+        scan_progress = (lambda ratio: progress(int(ratio * 50))) if progress else None
+        have, reused = await asyncio.to_thread(_reuse_local_blocks, control, local_path, fd, scan_progress)
+
+        ranges = missing_ranges(control, have)
+        to_fetch = sum(end - start + 1 for start, end in ranges)
+        downloaded = 0
+        for start, end in ranges:
+            headers = {"Range": f"bytes={start}-{end}", "Accept-Encoding": "identity"}
+            async with client.stream("GET", data_url, headers=headers) as response:
+                if response.status_code != 206:
+                    raise ValueError(f"Upstream ignored the Range request (HTTP {response.status_code})")
+                position = start
+                async for chunk in response.aiter_bytes(1024 * 1024):
+                    chunk = chunk[:end + 1 - position]
+                    await asyncio.to_thread(os.pwrite, fd, chunk, position)
+                    position += len(chunk)
+                    downloaded += len(chunk)
+                    if progress and to_fetch:
+                        progress(50 + int(downloaded / to_fetch * 50))
+                if position != end + 1:
+                    raise ValueError(f"Short read for bytes {start}-{end}")
+        f.flush()
+        os.fsync(fd)
+
+    if control.sha1 and await asyncio.to_thread(_sha1_of, dest_path) != control.sha1:
+        raise DeltaMismatch("Rebuilt image does not match the SHA-1 of the .zsync file")
+    return {
+        "method": "zsync",
+        "length": control.length,
+        "reused_bytes": reused,
+        "downloaded_bytes": downloaded,
+        "saved_bytes": control.length - downloaded,
+        "saved_pct": round((control.length - downloaded) / control.length * 100, 1) if control.length else 0.0,
+        "range_requests": len(ranges),
+    }
+
+
+def _client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        follow_redirects=True,
+        max_redirects=5,
+        timeout=httpx.Timeout(connect=10.0, read=60.0, write=10.0, pool=5.0),
+    )
+
+
+async def fetch_control(client: httpx.AsyncClient, zsync_url: str) -> Optional[ZsyncControl]:
+    """Télécharge et lit le .zsync ; None s'il n'est pas publié."""
+    async with client.stream("GET", zsync_url) as response:
+        if response.status_code != 200:
+            return None
+        data = bytearray()
+        async for chunk in response.aiter_bytes(65536):
+            data += chunk
+            if len(data) > MAX_CONTROL_BYTES:
+                raise ValueError(".zsync file too large")
+    return parse_zsync(bytes(data))
+
+
+async def run_delta_update(job_id: int, source_id: int, new_id: int, url: str,
+                           zsync_url: Optional[str], storage_root: str, category: Optional[str] = None,
+                           allow_full: bool = True):
+    """
+    Job de mise à jour : nouvelle entrée new_id construite depuis l'image source_id.
+    Retombe sur download_iso (téléchargement complet) sans .zsync utilisable, sauf si
+    allow_full est faux : le job échoue alors avec la raison.
+    """
+    from app.services.dedup_service import dedup_iso
+    from app.services.download_service import download_iso
+    from app.services.manifest_service import hash_and_index
+    from app.services.storage_service import path_for, reserve
+    from app.services.update_check_service import check_for_update
+
+    db = SessionLocal()
+    source = db.query(ISO).filter(ISO.id == source_id).first()
+    new = db.query(ISO).filter(ISO.id == new_id).first()
+    db.close()
+    if source is None or new is None:
+        error = "Source ISO no longer exists" if source is None else "Target entry no longer exists"
+        if new is not None:
+            queue_update(ISO, new_id, {"status": "error", "error_message": error})
+        update_job(job_id, failed=1, status="error", error_message=error)
+        return
+    local_path, filename = path_for(source.filename), new.filename
+    dest_path = new.file_path
+    tmp = dest_path + ".delta-tmp"
+    zsync_url = zsync_url or url + ".zsync"
+    reservation = None
+    fallback = None
+
+    update_job(job_id, status="running", result={"iso_id": new_id})
+    try:
+        # SHA256 publié à côté de la nouvelle image (SHA256SUMS…), s'il existe
+        expected = (await check_for_update(url, None, None))["upstream_sha256"]
+        await validate_url(zsync_url)
+        async with _client() as client:
+            control = await fetch_control(client, zsync_url)
+            if control is None:
+                fallback = "no .zsync file published"
+            elif md4 is None:
+                fallback = "MD4 unavailable"
+            else:
+                data_url = urljoin(zsync_url, control.url) if control.url else url
+                await validate_url(data_url)
+                reservation = reserve(control.length, storage_root, category)
+                if reservation.root != os.path.dirname(dest_path):
+                    dest_path = os.path.join(reservation.root, filename)
+                    tmp = dest_path + ".delta-tmp"
+                    queue_update(ISO, new_id, {"file_path": dest_path})
+                try:
+                    result = await assemble(
+                        control, local_path, data_url, tmp, client, reservation,
+                        progress=lambda pct: queue_update(ISO, new_id, {"download_progress": pct}),
+                    )
+                except DeltaMismatch as e:
+                    fallback = str(e)
+    except Exception as e:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        if reservation:
+            reservation.release()
+        queue_update(ISO, new_id, {"status": "error", "error_message": str(e)})
+        update_job(job_id, failed=1, status="error", error_message=str(e))
+        return
+
+    if fallback:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        if reservation:
+            reservation.release()
+        if not allow_full:
+            error = f"Delta update impossible: {fallback}"
+            queue_update(ISO, new_id, {"status": "error", "error_message": error})
+            update_job(job_id, failed=1, status="error", error_message=error,
+                       result={"iso_id": new_id, "method": None, "reason": fallback})
+            return
+        logger.warning(f"Mise à jour différentielle impossible ({fallback}) — téléchargement complet de {url}")
+        await download_iso(new_id, url, filename, expected, "sha256" if expected else None,
+                           SessionLocal(), os.path.dirname(dest_path), category)
+        await flushed()
+        db = SessionLocal()
+        try:
+            status, error = db.query(ISO.status, ISO.error_message).filter(ISO.id == new_id).one()
+        finally:
+            db.close()
+        result = {"iso_id": new_id, "method": "full", "reason": fallback, "saved_bytes": 0}
+        if status == "available":
+            update_job(job_id, done=1, status="done", result=result)
+        else:
+            update_job(job_id, failed=1, status="error", result=result, error_message=error)
+        return
+
+    try:
+        os.replace(tmp, dest_path)
+        queue_update(ISO, new_id, {"status": "verifying", "download_progress": 100})
+        sha256 = await hash_and_index(new_id, dest_path)
+        if expected and sha256 != expected:
+            raise ValueError("SHA256 mismatch with the upstream checksum file")
+        queue_update(ISO, new_id, {
+            "status": "available",
+            "sha256": sha256,
+            "size_bytes": os.path.getsize(dest_path),
+            "http_url": f"{BASE_URL}/files/{filename}",
+            "expected_checksum": expected,
+            "checksum_type": "sha256" if expected else None,
+            "checksum_verified": True if expected else None,
+            "last_verified_at": datetime.utcnow(),
+        })
+        await flushed()  # dedup_iso relit l'entrée
+        await dedup_iso(new_id)
+        update_job(job_id, done=1, status="done", result={"iso_id": new_id, **result})
+        logger.info(
+            f"Mise à jour différentielle {filename} : {result['downloaded_bytes']} octet(s) téléchargé(s), "
+            f"{result['saved_bytes']} économisé(s) ({result['saved_pct']} %)"
+        )
+    except Exception as e:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        queue_update(ISO, new_id, {"status": "error", "error_message": str(e)})
+        update_job(job_id, failed=1, status="error", error_message=str(e))
+    finally:
+        if reservation:
+            reservation.release()
@@ -0,0 +1,137 @@
+"""
+Non-blocking, cached DNS resolution for the SSRF guard.
+
+- Resolution runs through the event loop's getaddrinfo (thread pool), never
+  blocking file streams or other requests
+- Every A/AAAA record is checked against the private-network list, not only
+  the first IPv4 address
+- Results are cached per hostname for DNS_CACHE_TTL seconds; concurrent
+  lookups of the same hostname share one query
+- The cache is an LRU bounded to DNS_CACHE_MAX_ENTRIES hostnames; expired
+  entries are swept when it is full, then the least recently used go
+- The resolver is injectable (set_resolver) so tests can use a local stub
+"""
+import asyncio
+import ipaddress
+import socket
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from app.config import DNS_CACHE_MAX_ENTRIES, DNS_CACHE_TTL
+
+_PRIVATE_NETWORKS = [
+    ipaddress.ip_network("0.0.0.0/8"),
+    ipaddress.ip_network("10.0.0.0/8"),
+    ipaddress.ip_network("172.16.0.0/12"),
+    ipaddress.ip_network("192.168.0.0/16"),
+    ipaddress.ip_network("127.0.0.0/8"),
+    ipaddress.ip_network("169.254.0.0/16"),   # link-local / AWS metadata
+    ipaddress.ip_network("::/128"),
+    ipaddress.ip_network("::1/128"),
+    ipaddress.ip_network("fc00::/7"),
+    ipaddress.ip_network("fe80::/10"),
+]
+
+ResolveFn = Callable[[str], Awaitable[List[str]]]
+
+
+async def _system_resolve(hostname: str) -> List[str]:
+    loop = asyncio.get_running_loop()
+    infos = await loop.getaddrinfo(hostname, None, type=socket.SOCK_STREAM)
+    return [info[4][0] for info in infos]
+
+
+def is_private(addr) -> bool:
+    if isinstance(addr, ipaddress.IPv6Address) and addr.ipv4_mapped:
+        addr = addr.ipv4_mapped
+    return any(addr in net for net in _PRIVATE_NETWORKS)
+
+
+class AsyncResolver:
+    """Hostname → addresses, with a TTL cache and in-flight query sharing."""
+
+    def __init__(self, resolve: Optional[ResolveFn] = None, ttl: float = DNS_CACHE_TTL,
+                 max_entries: int = DNS_CACHE_MAX_ENTRIES):
+        self._resolve = resolve or _system_resolve
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._cache: "OrderedDict[str, Tuple[float, List[ipaddress._BaseAddress]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def _lookup(self, hostname: str) -> List[ipaddress._BaseAddress]:
+        try:
+            raw = await self._resolve(hostname)
+        except (socket.gaierror, OSError):
+            raise ValueError(f"Cannot resolve hostname: {hostname!r}")
+        addrs = []
+        for value in raw:
+            try:
+                addrs.append(ipaddress.ip_address(value.split("%", 1)[0]))
+            except ValueError:
+                continue
+        if not addrs:
+            raise ValueError(f"Cannot resolve hostname: {hostname!r}")
+        self._store(hostname, addrs)
+        return addrs
+
+    def _store(self, hostname: str, addrs: List[ipaddress._BaseAddress]) -> None:
+        now = time.monotonic()
+        self._cache.pop(hostname, None)
+        if len(self._cache) >= self.max_entries:
+            for key in [key for key, (expires, _) in self._cache.items() if expires <= now]:
+                del self._cache[key]
+        while len(self._cache) >= self.max_entries:
+            self._cache.popitem(last=False)
+        self._cache[hostname] = (now + self.ttl, addrs)
+
+    async def resolve(self, hostname: str) -> List[ipaddress._BaseAddress]:
+        hostname = hostname.lower().rstrip(".")
+        cached = self._cache.get(hostname)
+        if cached and cached[0] > time.monotonic():
+            self._cache.move_to_end(hostname)
+            return cached[1]
+
+        future = self._inflight.get(hostname)
+        if future is None:
+            future = asyncio.ensure_future(self._lookup(hostname))
+            self._inflight[hostname] = future
+            future.add_done_callback(lambda _: self._inflight.pop(hostname, None))
+        return await asyncio.shield(future)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+_resolver = AsyncResolver()
+
+
+def get_resolver() -> AsyncResolver:
+    return _resolver
+
+
+def set_resolver(resolver: AsyncResolver) -> None:
+    """Replace the process-wide resolver (e.g. with a stub in tests)."""
+    global _resolver
+    _resolver = resolver
+
+
+async def validate_url(url: str) -> None:
+    """Raise ValueError if the URL is unsafe (non-HTTP/S or SSRF risk)."""
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https"):
+        raise ValueError(f"Unsupported scheme: {parsed.scheme!r}")
+
+    hostname = parsed.hostname
+    if not hostname:
+        raise ValueError("URL has no hostname")
+
+    try:
+        addrs = [ipaddress.ip_address(hostname)]
+    except ValueError:
+        addrs = await _resolver.resolve(hostname)
+
+    for addr in addrs:
+        if is_private(addr):
+            raise ValueError(f"Blocked: {addr} is in a private/reserved range (SSRF guard)")
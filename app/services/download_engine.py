@@ -0,0 +1,298 @@
+"""
+Moteur de téléchargement HTTP : un fichier de destination, une ou plusieurs sources (miroirs).
+
+- chien de garde de débit : une source sous DOWNLOAD_MIN_SPEED octets/s sur une fenêtre de
+  DOWNLOAD_STALL_WINDOW secondes (ou muette pendant DOWNLOAD_READ_TIMEOUT) est abandonnée
+- reprise : toute nouvelle connexion repart de l'octet courant (Range), sur la même
+  source ou sur le miroir suivant
+- nouvelles tentatives : quand toutes les sources ont échoué, attente exponentielle
+  (DOWNLOAD_RETRY_BASE_DELAY, doublée à chaque tour, plafonnée à DOWNLOAD_RETRY_MAX_DELAY)
+  puis nouveau tour, au plus DOWNLOAD_MAX_RETRIES tours sans progression ; les erreurs
+  définitives (4xx, source sans Range) retirent la source de la rotation
+- lecture et écriture adaptatives : les morceaux reçus sont regroupés en blocs de lecture
+  d'environ 1/20 de seconde de débit (jusqu'à 2 Mio, rendus au plus tard après 1/20 de
+  seconde ; contrôles du chien de garde et progression une fois par bloc), puis écrits hors de la boucle d'événements par paquets
+  d'environ DOWNLOAD_WRITE_INTERVAL secondes de débit (entre 256 Kio et 16 Mio) : peu
+  d'appels sur un lien lent, de gros blocs sur un lien rapide. La taille des lectures socket
+  elles-mêmes est fixée par httpcore (64 Kio)
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Callable, List, Optional, Tuple
+
+import httpx
+import zstandard
+
+from app.config import (
+    DOWNLOAD_MAX_RETRIES, DOWNLOAD_MIN_SPEED, DOWNLOAD_RETRY_BASE_DELAY, DOWNLOAD_RETRY_MAX_DELAY,
+    DOWNLOAD_STALL_WINDOW, DOWNLOAD_WRITE_INTERVAL,
+)
+from app.services.db_writer import queue_update
+from app.services.decompress_ingest import DecompressingSink
+from app.services.io_policy import WriteBehind
+from app.services.mirror_service import mirror_host, record_transfer
+from app.services.storage_service import reserve
+
+logger = logging.getLogger("downloads")
+
+WRITE_BUFFER_MIN = 256 * 1024
+WRITE_BUFFER_MAX = 16 * 1024 * 1024
+READ_CHUNK_MAX = 2 * 1024 * 1024
+READ_INTERVAL = 0.05
+
+
+class SourceFailed(Exception):
+    """La source courante a flanché ; permanent=True : inutile de la retenter."""
+
+    def __init__(self, message: str, permanent: bool = False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+class Stalled(SourceFailed):
+    pass
+
+
+def _content_range(response: httpx.Response):
+    """(début, taille totale) d'une réponse 206, (None, None) si l'en-tête est illisible."""
+    unit_range, _, total = response.headers.get("content-range", "").partition("/")
+    first = unit_range.replace("bytes", "").strip().partition("-")[0]
+    return (int(first) if first.isdigit() else None), (int(total) if total.isdigit() else None)
+
+
+def _is_permanent(error: Exception) -> bool:
+    if isinstance(error, SourceFailed):
+        return error.permanent
+    if isinstance(error, httpx.HTTPStatusError):
+        code = error.response.status_code
+        return 400 <= code < 500 and code not in (408, 425, 429)
+    return False
+
+
+def _write_size(throughput: float) -> int:
+    size = WRITE_BUFFER_MIN
+    while size < WRITE_BUFFER_MAX and size < throughput * DOWNLOAD_WRITE_INTERVAL:
+        size *= 2
+    return size
+
+
+def _read_size(throughput: float) -> int:
+    """Lien lent ou débit encore inconnu : chaque morceau reçu est traité aussitôt."""
+    return min(READ_CHUNK_MAX, int(throughput * READ_INTERVAL))
+
+
+async def _chunks(response: httpx.Response, size: Callable[[], int]):
+    """
+    Morceaux de response regroupés en blocs de size() octets, relu à chaque bloc. Un bloc
+    incomplet est aussi rendu au bout de READ_INTERVAL : une source qui ralentit après une
+    phase rapide reste vue par le chien de garde au lieu d'attendre READ_CHUNK_MAX octets.
+    """
+    pending = bytearray()
+    deadline = time.monotonic() + READ_INTERVAL
+    async for part in response.aiter_bytes():
+        pending += part
+        now = time.monotonic()
+        if len(pending) >= size() or now >= deadline:
+            yield pending
+            pending = bytearray()
+            deadline = now + READ_INTERVAL
+    if pending:
+        yield pending
+
+
+class Transfer:
+    """
+    Fichier de destination commun aux connexions successives : la première qui répond ouvre
+    le fichier et réserve la place, les suivantes reprennent à l'octet courant (Range).
+    """
+
+    def __init__(self, iso_id: int, dest_path: str, storage_root: Optional[str], category: Optional[str]):
+        self.iso_id = iso_id
+        self.dest_path = dest_path
+        self.storage_root = storage_root
+        self.category = category
+        self.file = None
+        self.behind = None
+        self.reservation = None
+        self.downloaded = 0  # octets reçus (écrits ou dans le tampon)
+        self.written = 0
+        self.total = 0
+        self.throughput = 0.0  # moyenne glissante, octets/s
+        self.last_update = time.monotonic()
+        self._buffer = bytearray()
+
+    def _open(self, response: httpx.Response) -> None:
+        from app.models import ISO
+
+        self.total = int(response.headers.get("content-length", 0))
+        # Content-Length n'est la taille finale que sans Content-Encoding
+        identity = response.headers.get("content-encoding", "identity").lower() == "identity"
+        self.reservation = reserve(self.total if identity else 0, self.storage_root, self.category)
+        if not identity:
+            self.total = 0
+        if self.reservation.root != os.path.dirname(self.dest_path):
+            # Racine prévue pleine entre-temps : bascule sur une racine qui a la place
+            self.dest_path = os.path.join(self.reservation.root, os.path.basename(self.dest_path))
+            queue_update(ISO, self.iso_id, {"file_path": self.dest_path})
+        self.file = open(self.dest_path, "wb")
+        self.reservation.attach(self.file)
+        self.behind = WriteBehind(self.file)
+
+    def _check_resume(self, response: httpx.Response) -> None:
+        if response.status_code != 206:
+            raise SourceFailed("la source ne gère pas les requêtes Range", permanent=True)
+        first, total = _content_range(response)
+        if first != self.downloaded:
+            raise SourceFailed(f"reprise à l'octet {first} au lieu de {self.downloaded}", permanent=True)
+        if self.total and total != self.total:
+            raise SourceFailed(f"taille différente ({total} octets au lieu de {self.total})", permanent=True)
+
+    def _write(self, data: bytearray) -> None:
+        """Bloquant : exécuté via asyncio.to_thread."""
+        self.reservation.grow(self.written + len(data))
+        self.file.write(data)
+        self.written += len(data)
+        if self.behind.due(self.written):
+            self.behind.drop()
+
+    async def _flush(self) -> None:
+        if self._buffer:
+            data, self._buffer = self._buffer, bytearray()
+            await asyncio.to_thread(self._write, data)
+
+    async def fetch(self, client: httpx.AsyncClient, url: str) -> None:
+        """Télécharge depuis url à partir de l'octet courant ; lève l'erreur si la source flanche."""
+        from app.models import ISO
+
+        headers = {"Range": f"bytes={self.downloaded}-"} if self.file else {}
+        started, received = time.monotonic(), 0
+        window_start, window_bytes = started, 0
+        try:
+            async with client.stream("GET", url, headers=headers) as response:
+                response.raise_for_status()
+                if self.file:
+                    self._check_resume(response)
+                else:
+                    self._open(response)
+                queue_update(ISO, self.iso_id, {"active_mirror": mirror_host(url)})
+
+                write_size = _write_size(self.throughput)
+                read_size = _read_size(self.throughput)
+                async for chunk in _chunks(response, lambda: read_size):
+                    self._buffer += chunk
+                    self.downloaded += len(chunk)
+                    received += len(chunk)
+                    if len(self._buffer) >= write_size:
+                        await self._flush()
+
+                    now = time.monotonic()
+                    if now - window_start >= DOWNLOAD_STALL_WINDOW:
+                        rate = (received - window_bytes) / (now - window_start)
+                        if rate < DOWNLOAD_MIN_SPEED:
+                            raise Stalled(f"débit de {rate / 1024:.1f} Kio/s sur {DOWNLOAD_STALL_WINDOW:g} s")
+                        self.throughput = rate if not self.throughput else 0.7 * self.throughput + 0.3 * rate
+                        write_size = _write_size(self.throughput)
+                        read_size = _read_size(self.throughput)
+                        window_start, window_bytes = now, received
+
+                    if now - self.last_update >= 2 and self.total > 0:
+                        progress = int(self.downloaded / self.total * 100)
+                        queue_update(ISO, self.iso_id, {"download_progress": progress})
+                        self.last_update = now
+            await self._flush()
+            if self.total and self.downloaded < self.total:
+                raise SourceFailed(f"transfert interrompu à {self.downloaded}/{self.total} octets")
+        except (httpx.HTTPError, SourceFailed):
+            record_transfer(url, received, time.monotonic() - started, ok=False)
+            raise
+        finally:
+            if self.file and self._buffer:
+                await self._flush()  # les octets reçus restent valides pour la reprise
+        record_transfer(url, received, time.monotonic() - started, ok=True)
+
+    def _size_on_disk(self) -> int:
+        return self.written
+
+    def close(self) -> None:
+        if self.file and not self.file.closed:
+            self.file.truncate(self._size_on_disk())
+            self.file.close()
+            self.reservation.resize(self._size_on_disk())
+
+
+class DecompressingTransfer(Transfer):
+    """
+    Transfert d'un flux compressé décompressé à la volée (decompress_ingest) : les reprises
+    Range portent sur les octets compressés, le fichier reçoit la sortie décompressée.
+    """
+
+    def __init__(self, iso_id: int, dest_path: str, storage_root: Optional[str], category: Optional[str],
+                 codec: str, checksum_type: Optional[str] = None):
+        super().__init__(iso_id, dest_path, storage_root, category)
+        self.codec = codec
+        self.checksum_type = checksum_type
+        self.sink: Optional[DecompressingSink] = None
+
+    def _open(self, response: httpx.Response) -> None:
+        super()._open(response)
+        self.sink = DecompressingSink(self.file, self.codec, self.checksum_type, reservation=self.reservation)
+
+    def _write(self, data: bytearray) -> None:
+        if not self.written and self.codec == "zstd":
+            # La réservation porte sur la taille compressée : la trame zstd annonce souvent la vraie
+            self.reservation.grow(max(zstandard.frame_content_size(bytes(data[:18])), 0))
+        self.sink.write(data)
+        self.written += len(data)
+
+    def finish(self) -> Tuple[str, bytes]:
+        """Bloquant : termine la décompression ; (sha256, feuilles) de l'image décompressée."""
+        return self.sink.finish()
+
+    def _size_on_disk(self) -> int:
+        return self.sink.output_bytes if self.sink else 0
+
+    def close(self) -> None:
+        if self.sink:
+            self.sink.abort()  # sans effet après finish()
+        super().close()
+
+
+def backoff_delay(attempt: int) -> float:
+    """Attente avant le tour n° attempt (1, 2, ...) : exponentielle plafonnée, avec gigue."""
+    delay = min(DOWNLOAD_RETRY_MAX_DELAY, DOWNLOAD_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+async def run_transfer(client: httpx.AsyncClient, transfer: Transfer, urls: List[str],
+                       on_retry: Optional[Callable[[float, str], None]] = None) -> None:
+    """
+    Essaie les sources dans l'ordre donné jusqu'à la fin du fichier. Un tour qui a fait
+    progresser le fichier d'au moins une fenêtre de débit minimal remet le compteur de
+    tentatives à zéro (une source qui ne fait que goutter ne relance pas indéfiniment).
+    """
+    progress_floor = DOWNLOAD_MIN_SPEED * DOWNLOAD_STALL_WINDOW
+    sources = list(urls)
+    attempt = 0
+    while True:
+        errors = []
+        before = transfer.downloaded
+        for url in list(sources):
+            try:
+                await transfer.fetch(client, url)
+                return
+            except (httpx.HTTPError, SourceFailed) as e:
+                errors.append(f"{mirror_host(url)} : {e}")
+                logger.warning(f"ISO {transfer.iso_id} : source {url} en échec à l'octet "
+                               f"{transfer.downloaded} ({e})")
+                if _is_permanent(e):
+                    sources.remove(url)
+        attempt = 0 if transfer.downloaded - before >= progress_floor else attempt + 1
+        if not sources or attempt > DOWNLOAD_MAX_RETRIES:
+            raise RuntimeError("Toutes les sources ont échoué : " + " ; ".join(errors))
+        delay = backoff_delay(max(attempt, 1))
+        if on_retry:
+            on_retry(delay, errors[-1])
+        await asyncio.sleep(delay)
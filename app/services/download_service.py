@@ -1,103 +1,97 @@
-import ipaddress
+import asyncio
 import os
-import socket
-import time
-from datetime import datetime
-from urllib.parse import urlparse
+from typing import List, Optional
 
 import httpx
 from sqlalchemy.orm import Session
 
-from app.config import ISO_STORAGE_PATH, BASE_URL
-from app.services.hash_service import compute_sha256, verify_checksum
-
-_PRIVATE_NETWORKS = [
-    ipaddress.ip_network("10.0.0.0/8"),
-    ipaddress.ip_network("172.16.0.0/12"),
-    ipaddress.ip_network("192.168.0.0/16"),
-    ipaddress.ip_network("127.0.0.0/8"),
-    ipaddress.ip_network("169.254.0.0/16"),
-    ipaddress.ip_network("::1/128"),
-    ipaddress.ip_network("fc00::/7"),
-]
-
-
-def _validate_url(url: str) -> None:
-    parsed = urlparse(url)
-    if parsed.scheme not in ("http", "https"):
-        raise ValueError("Seuls les schémas http et https sont autorisés")
-    host = parsed.hostname or ""
-    try:
-        ip = ipaddress.ip_address(socket.gethostbyname(host))
-        if any(ip in net for net in _PRIVATE_NETWORKS):
-            raise ValueError("Les adresses IP privées/locales ne sont pas autorisées")
-    except (socket.gaierror, ValueError):
-        raise
-
-
-async def download_iso(iso_id: int, url: str, filename: str, expected_checksum: str, checksum_type: str, db: Session):
+from app.config import BASE_URL, DOWNLOAD_READ_TIMEOUT
+from app.services.db_writer import flushed, queue_update
+from app.services.dedup_service import dedup_iso
+from app.services.dns_service import validate_url
+from app.services.download_engine import DecompressingTransfer, Transfer, run_transfer
+from app.services.hash_service import verify_checksum
+from app.services.manifest_service import hash_and_index, store_manifest
+from app.services.mirror_service import mirror_list, probe_mirrors
+from app.services.storage_service import primary_root
+
+
+async def download_iso(iso_id: int, url: str, filename: str, expected_checksum: str, checksum_type: str, db: Session,
+                       storage_root: Optional[str] = None, category: Optional[str] = None,
+                       mirrors: Optional[List[str]] = None, decompress: Optional[str] = None):
+    """
+    Télécharge l'image depuis url ou ses miroirs. Avec plusieurs sources, les miroirs sont
+    sondés puis essayés du plus rapide au plus lent ; si le miroir actif tombe en erreur ou
+    se fige, le suivant reprend au même octet (voir download_engine).
+    decompress : codec (gzip / xz / zstd) du flux, décompressé à la volée vers filename ;
+    le checksum attendu porte alors sur les octets compressés.
+    """
     from app.models import ISO
 
-    dest_path = os.path.join(ISO_STORAGE_PATH, filename)
+    dest_path = os.path.join(storage_root or primary_root(), filename)
+    if decompress:
+        transfer = DecompressingTransfer(iso_id, dest_path, storage_root, category, decompress, checksum_type)
+    else:
+        transfer = Transfer(iso_id, dest_path, storage_root, category)
 
     try:
-        _validate_url(url)
-        timeout = httpx.Timeout(connect=10.0, read=3600.0, write=None, pool=5.0)
-        async with httpx.AsyncClient(follow_redirects=True, timeout=timeout) as client:
-            async with client.stream("GET", url) as response:
-                response.raise_for_status()
-                total = int(response.headers.get("content-length", 0))
-                downloaded = 0
-                last_update = time.time()
-
-                with open(dest_path, "wb") as f:
-                    async for chunk in response.aiter_bytes(chunk_size=1024 * 1024):
-                        f.write(chunk)
-                        downloaded += len(chunk)
-
-                        now = time.time()
-                        if now - last_update >= 2 and total > 0:
-                            progress = int(downloaded / total * 100)
-                            db.query(ISO).filter(ISO.id == iso_id).update({
-                                "download_progress": progress,
-                                "updated_at": datetime.utcnow(),
-                            })
-                            db.commit()
-                            last_update = now
-
-        # Compute hashes
-        db.query(ISO).filter(ISO.id == iso_id).update({
-            "status": "verifying",
-            "download_progress": 100,
-            "updated_at": datetime.utcnow(),
-        })
-        db.commit()
-
-        sha256 = await compute_sha256(dest_path)
+        urls = mirror_list(url, mirrors)
+        for candidate in urls:
+            await validate_url(candidate)
+        timeout = httpx.Timeout(connect=10.0, read=DOWNLOAD_READ_TIMEOUT, write=None, pool=5.0)
+        # identity : les offsets de reprise doivent désigner les octets du fichier lui-même
+        async with httpx.AsyncClient(follow_redirects=True, timeout=timeout,
+                                     headers={"Accept-Encoding": "identity"}) as client:
+            if len(urls) > 1:
+                urls = [p["url"] for p in await probe_mirrors(client, urls)]
+            await run_transfer(client, transfer, urls, on_retry=lambda delay, error: queue_update(
+                ISO, iso_id, {"error_message": f"Nouvelle tentative dans {delay:.0f} s ({error})"}))
+        if decompress:
+            sha256, leaves = await asyncio.to_thread(transfer.finish)
+            transfer.close()
+            dest_path = transfer.dest_path
+            store_manifest(iso_id, transfer.sink.block_size, leaves)
+            checksum_verified = transfer.sink.checksum_matches(expected_checksum)
+            queue_update(ISO, iso_id, {
+                "source_sha256": transfer.sink.source_sha256.hexdigest(),
+                "source_size_bytes": transfer.sink.compressed_bytes,
+            })
+        else:
+            transfer.close()
+            dest_path = transfer.dest_path
+
+            # Compute hashes
+            queue_update(ISO, iso_id, {"status": "verifying", "download_progress": 100})
+
+            sha256 = await hash_and_index(iso_id, dest_path)
+
+            checksum_verified = None
+            if expected_checksum:
+                if (checksum_type or "sha256").lower() == "sha256":
+                    checksum_verified = sha256.lower() == expected_checksum.strip().lower()
+                else:
+                    checksum_verified = await verify_checksum(dest_path, expected_checksum, checksum_type)
         size_bytes = os.path.getsize(dest_path)
         http_url = f"{BASE_URL}/files/{filename}"
 
-        checksum_verified = None
-        if expected_checksum:
-            checksum_verified = await verify_checksum(dest_path, expected_checksum, checksum_type or "sha256")
-
-        db.query(ISO).filter(ISO.id == iso_id).update({
+        queue_update(ISO, iso_id, {
             "status": "available",
             "sha256": sha256,
             "size_bytes": size_bytes,
             "http_url": http_url,
             "checksum_verified": checksum_verified,
             "download_progress": 100,
-            "updated_at": datetime.utcnow(),
+            "error_message": None,
         })
-        db.commit()
+        await flushed()  # dedup_iso relit l'entrée
+        await dedup_iso(iso_id)
 
     except Exception as e:
-        db.query(ISO).filter(ISO.id == iso_id).update({
-            "status": "error",
-            "error_message": str(e),
-            "updated_at": datetime.utcnow(),
-        })
-        db.commit()
-        if os.path.exists(dest_path):
-            os.remove(dest_path)
+        queue_update(ISO, iso_id, {"status": "error", "error_message": str(e)})
+        transfer.close()
+        if os.path.exists(transfer.dest_path):
+            os.remove(transfer.dest_path)
+    finally:
+        if transfer.reservation:
+            transfer.reservation.release()
+        db.close()
@@ -0,0 +1,135 @@
+"""
+Cache mémoire LRU, borné en octets, des petites images les plus demandées sur /files
+(netboot .img, iPXE, petites ISO Alpine) : servies, Range compris, sans toucher au disque.
+
+- Seuls les fichiers de FILE_CACHE_MAX_FILE_BYTES au plus sont admis, et seulement à
+  leur FILE_CACHE_ADMIT_AFTER-ième demande (un téléchargement isolé n'évince rien)
+- Chaque entrée garde la signature (inode, taille, mtime) du fichier sur disque : une
+  entrée périmée n'est jamais servie, et le file watcher purge les fichiers modifiés
+  ou supprimés (invalidate_stale)
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.config import FILE_CACHE_ADMIT_AFTER, FILE_CACHE_MAX_BYTES, FILE_CACHE_MAX_FILE_BYTES
+from app.services.cold_storage import cold_path, open_image
+
+Signature = Tuple[int, int, int]
+
+SEEN_LIMIT = 4096  # chemins dont on compte les demandes avant admission
+
+
+def _signature(path: str) -> Optional[Signature]:
+    """Signature du fichier physique (brut, sinon sa version froide)."""
+    for physical in (path, cold_path(path)):
+        try:
+            st = os.stat(physical)
+        except FileNotFoundError:
+            continue
+        return st.st_ino, st.st_size, st.st_mtime_ns
+    return None
+
+
+class FileCache:
+    def __init__(self, max_bytes: int, max_file_bytes: int, admit_after: int):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.admit_after = max(1, admit_after)
+        self._entries: "OrderedDict[str, Tuple[Signature, bytes]]" = OrderedDict()
+        self._seen: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.max_file_bytes > 0
+
+    def get(self, path: str, size: int) -> Optional[bytes]:
+        """
+        Contenu de path s'il est en cache et à jour ; sinon le charge s'il est admissible.
+        None = à servir depuis le disque. Bloquant : à appeler via asyncio.to_thread.
+        """
+        if not self.enabled or size > self.max_file_bytes or size > self.max_bytes:
+            return None
+        signature = _signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == signature:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                self._drop(path)
+            self.misses += 1
+            seen = self._seen.pop(path, 0) + 1
+            self._seen[path] = seen
+            while len(self._seen) > SEEN_LIMIT:
+                self._seen.popitem(last=False)
+            if seen < self.admit_after:
+                return None
+
+        data = self._load(path)
+        if data is None or _signature(path) != signature:
+            return None  # modifié pendant la lecture
+        with self._lock:
+            if path not in self._entries:
+                self._entries[path] = (signature, data)
+                self._bytes += len(data)
+                self._seen.pop(path, None)
+                while self._bytes > self.max_bytes:
+                    oldest = next(iter(self._entries))
+                    self._drop(oldest)
+                    self.evictions += 1
+        return data
+
+    @staticmethod
+    def _load(path: str) -> Optional[bytes]:
+        try:
+            with open_image(path) as f:
+                return f.read()
+        except (OSError, ValueError):
+            return None
+
+    def _drop(self, path: str) -> None:
+        _, data = self._entries.pop(path)
+        self._bytes -= len(data)
+
+    def invalidate(self, path: str) -> None:
+        path = os.path.realpath(path)
+        with self._lock:
+            if path in self._entries:
+                self._drop(path)
+            self._seen.pop(path, None)
+
+    def invalidate_stale(self) -> int:
+        """Purge les entrées dont le fichier a changé ou disparu. Retourne leur nombre."""
+        with self._lock:
+            cached = [(path, entry[0]) for path, entry in self._entries.items()]
+        stale = [path for path, signature in cached if _signature(path) != signature]
+        with self._lock:
+            for path in stale:
+                if path in self._entries:
+                    self._drop(path)
+        return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 3) if total else 0,
+            }
+
+
+file_cache = FileCache(FILE_CACHE_MAX_BYTES, FILE_CACHE_MAX_FILE_BYTES, FILE_CACHE_ADMIT_AFTER)
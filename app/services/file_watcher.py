@@ -8,9 +8,12 @@ import asyncio
 import logging
 import os
 
-from app.config import ISO_STORAGE_PATH, FILE_CHECK_INTERVAL, AUTO_IMPORT_ENABLED, BASE_URL
+from app.config import FILE_CHECK_INTERVAL, AUTO_IMPORT_ENABLED, BASE_URL
 from app.database import SessionLocal
 from app.models import ISO
+from app.services.cold_storage import image_exists, image_size
+from app.services.file_cache import file_cache
+from app.services.storage_service import iter_storage_files, path_for
 
 logger = logging.getLogger("file_watcher")
 
@@ -32,12 +35,12 @@ def _detect_os_info(filename: str) -> dict:
     return {"category": "other", "os_family": None}
 
 
-async def _auto_import_file(filename: str):
+async def _auto_import_file(filename: str, file_path: str):
     """Importe un fichier dans la DB et calcule son SHA256 en arrière-plan."""
-    from app.services.hash_service import compute_sha256
+    from app.services.dedup_service import dedup_iso
+    from app.services.manifest_service import hash_and_index
     from datetime import datetime
 
-    file_path = os.path.join(ISO_STORAGE_PATH, filename)
     db = SessionLocal()
     try:
         # Double-check — un autre worker a peut-être déjà importé
@@ -61,7 +64,7 @@ async def _auto_import_file(filename: str):
             status="verifying",
             download_progress=0,
             size_bytes=size_bytes,
-            file_path=f"/data/isos/{filename}",
+            file_path=file_path,
             http_url=http_url,
         )
         db.add(iso)
@@ -70,7 +73,7 @@ async def _auto_import_file(filename: str):
         iso_id = iso.id
         logger.info(f"Auto-import : {filename} (id={iso_id}) — calcul SHA256…")
 
-        sha256 = await compute_sha256(file_path)
+        sha256 = await hash_and_index(iso_id, file_path)
         db.query(ISO).filter(ISO.id == iso_id).update({
             "status": "available",
             "sha256": sha256,
@@ -78,6 +81,7 @@ async def _auto_import_file(filename: str):
             "updated_at": datetime.utcnow(),
         })
         db.commit()
+        await dedup_iso(iso_id)
         logger.info(f"Auto-import terminé : {filename} sha256={sha256[:12]}…")
     except Exception as e:
         logger.error(f"Auto-import échoué pour {filename} : {e}")
@@ -90,30 +94,29 @@ async def _auto_import_file(filename: str):
 
 
 async def run_auto_import():
-    """Détecte les fichiers non suivis dans ISO_STORAGE_PATH et les importe."""
+    """Détecte les fichiers non suivis dans toutes les racines de stockage et les importe."""
     db = SessionLocal()
     try:
         tracked = {iso.filename for iso in db.query(ISO.filename).all()}
-        try:
-            all_files = os.listdir(ISO_STORAGE_PATH)
-        except FileNotFoundError:
-            return
-        new_files = [
-            f for f in all_files
-            if os.path.splitext(f)[1].lower() in WATCHED_EXTENSIONS
-            and f not in tracked
-            and os.path.isfile(os.path.join(ISO_STORAGE_PATH, f))
-        ]
+        new_files = []
+        for _root, name, full in iter_storage_files():
+            # Un même nom sur deux racines : seul le premier (celui que locate() sert) est importé
+            if os.path.splitext(name)[1].lower() in WATCHED_EXTENSIONS and name not in tracked:
+                tracked.add(name)
+                new_files.append((name, full))
     finally:
         db.close()
 
-    for filename in new_files:
-        logger.info(f"Nouveau fichier détecté : {filename}")
-        await _auto_import_file(filename)
+    for filename, file_path in new_files:
+        logger.info(f"Nouveau fichier détecté : {file_path}")
+        await _auto_import_file(filename, file_path)
 
 
 
 async def run_file_check():
+    stale = await asyncio.to_thread(file_cache.invalidate_stale)
+    if stale:
+        logger.info(f"Cache mémoire : {stale} fichier(s) modifié(s) ou supprimé(s) purgé(s)")
     db = SessionLocal()
     try:
         isos = db.query(ISO).filter(
@@ -124,8 +127,8 @@ async def run_file_check():
         for iso in isos:
             if not iso.filename:
                 continue
-            path = os.path.join(ISO_STORAGE_PATH, iso.filename)
-            exists = os.path.isfile(path)
+            path = path_for(iso.filename)
+            exists = image_exists(path)
 
             if not exists and iso.status == "available":
                 iso.status = "missing"
@@ -134,7 +137,8 @@ async def run_file_check():
             elif exists and iso.status == "missing":
                 iso.status = "available"
                 # Mettre à jour la taille au cas où
-                iso.size_bytes = os.path.getsize(path)
+                iso.size_bytes = image_size(path)
+                iso.file_path = path
                 logger.info(f"Fichier retrouvé : {iso.filename} (id={iso.id})")
                 changed += 1
 
@@ -1,5 +1,8 @@
 import hashlib
 import asyncio
+from typing import Tuple
+
+from app.services.io_policy import ScanReader
 
 
 async def compute_sha256(filepath: str) -> str:
@@ -16,12 +19,34 @@ async def compute_md5(filepath: str) -> str:
 
 def _compute_hash(filepath: str, algorithm: str) -> str:
     h = hashlib.new(algorithm)
-    with open(filepath, "rb") as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+    with ScanReader(filepath) as f:
+        for chunk in f.chunks():
             h.update(chunk)
     return h.hexdigest()
 
 
+async def compute_sha256_and_blocks(filepath: str, block_size: int) -> Tuple[str, bytes]:
+    """SHA256 du fichier et hachés des blocs de block_size octets, en une seule lecture."""
+    return await asyncio.to_thread(_compute_sha256_and_blocks, filepath, block_size)
+
+
+def block_digest(block) -> bytes:
+    """Haché d'une feuille du manifeste : sha256(0x00 || bloc), sans recopier le bloc (bytes ou memoryview)."""
+    h = hashlib.sha256(b"\x00")
+    h.update(block)
+    return h.digest()
+
+
+def _compute_sha256_and_blocks(filepath: str, block_size: int) -> Tuple[str, bytes]:
+    h = hashlib.sha256()
+    leaves = bytearray()
+    with ScanReader(filepath) as f:
+        for block in f.chunks(block_size):
+            h.update(block)
+            leaves += block_digest(block)
+    return h.hexdigest(), bytes(leaves)
+
+
 async def verify_checksum(filepath: str, expected: str, hash_type: str) -> bool:
     hash_type = hash_type.lower()
     if hash_type == "sha256":
@@ -0,0 +1,130 @@
+"""
+Politique d'I/O vis-à-vis du cache de pages (posix_fadvise).
+
+Deux profils :
+- flux (service /files) : SEQUENTIAL + WILLNEED sur la fenêtre suivante ; les pages
+  restent en cache, c'est précisément ce qu'on veut garder chaud (images netboot)
+- passe unique (hachage, scrub, vérification, copies, écritures de téléchargement) :
+  DONTNEED derrière la position de lecture/écriture, pour qu'un import de 10 Go
+  n'évince pas les images servies en continu ; une image servie depuis moins de
+  IO_HOT_WINDOW_SECONDS est lue sans DONTNEED (ses pages sont celles à garder)
+
+Sans posix_fadvise (macOS…) ou avec IO_FADVISE_ENABLED=false, les conseils sont ignorés.
+"""
+import os
+from typing import Iterator
+
+from app.config import (
+    IO_DROP_BEHIND_BYTES, IO_FADVISE_ENABLED, IO_HOT_WINDOW_SECONDS, IO_SCAN_READ_SIZE, IO_STREAM_READ_SIZE,
+    IO_STREAM_READAHEAD,
+)
+from app.services.cold_storage import open_image
+from app.services.serving import recently_served
+
+_HAS_FADVISE = hasattr(os, "posix_fadvise")
+
+
+def advise(f, offset: int, length: int, advice_name: str) -> None:
+    """posix_fadvise(POSIX_FADV_<advice_name>) sur le descripteur de f ; sans effet si indisponible."""
+    if not (IO_FADVISE_ENABLED and _HAS_FADVISE):
+        return
+    try:
+        os.posix_fadvise(f.fileno(), offset, length, getattr(os, f"POSIX_FADV_{advice_name}"))
+    except (OSError, AttributeError, ValueError):
+        pass
+
+
+def _physical_offset(f) -> int:
+    """Position dans le fichier sur disque (compressé pour une image froide)."""
+    return f.compressed_offset() if hasattr(f, "compressed_offset") else f.tell()
+
+
+# ── FLUX ─────────────────────────────────────────────────────────
+
+def iter_stream(path: str, start: int, length: int, read_size: int = IO_STREAM_READ_SIZE) -> Iterator[bytes]:
+    """Lit [start, start+length) d'une image à servir, en annonçant la lecture séquentielle."""
+    with open_image(path) as f:
+        advise(f, 0, 0, "SEQUENTIAL")
+        f.seek(start)
+        next_hint = 0
+        remaining = length
+        while remaining > 0:
+            pos = _physical_offset(f)
+            if pos >= next_hint:
+                advise(f, pos, IO_STREAM_READAHEAD, "WILLNEED")
+                next_hint = pos + IO_STREAM_READAHEAD // 2
+            data = f.read(min(read_size, remaining))
+            if not data:
+                break
+            yield data
+            remaining -= len(data)
+
+
+# ── PASSE UNIQUE ──────────────────────────────────────────────────
+
+class ScanReader:
+    """
+    Lecteur pour une passe unique (hachage, scrub, vérification, copie) :
+    lecture séquentielle annoncée, pages abandonnées (DONTNEED) derrière la position.
+    """
+
+    def __init__(self, path: str):
+        self._f = open_image(path)
+        self._dropped = 0
+        self._keep = recently_served(path, IO_HOT_WINDOW_SECONDS)
+        advise(self._f, 0, 0, "SEQUENTIAL")
+
+    def read(self, n: int = IO_SCAN_READ_SIZE) -> bytes:
+        data = self._f.read(n)
+        if self._keep:
+            return data
+        pos = _physical_offset(self._f)
+        if pos - self._dropped >= IO_DROP_BEHIND_BYTES or not data:
+            advise(self._f, self._dropped, pos - self._dropped, "DONTNEED")
+            self._dropped = pos
+        return data
+
+    def chunks(self, n: int = IO_SCAN_READ_SIZE) -> Iterator[bytes]:
+        return iter(lambda: self.read(n), b"")
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        pos = self._f.seek(offset, whence)
+        self._dropped = _physical_offset(self._f)
+        return pos
+
+    def tell(self) -> int:
+        return self._f.tell()
+
+    def close(self):
+        if not self._keep:
+            advise(self._f, self._dropped, 0, "DONTNEED")
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class WriteBehind:
+    """
+    Écriture séquentielle d'un fichier qui ne sera pas relu tout de suite depuis le cache :
+    toutes les IO_DROP_BEHIND_BYTES, les pages écrites sont synchronisées puis abandonnées.
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self._dropped = 0
+        self._written = 0
+
+    def due(self, written: int) -> bool:
+        self._written = written
+        return IO_FADVISE_ENABLED and _HAS_FADVISE and written - self._dropped >= IO_DROP_BEHIND_BYTES
+
+    def drop(self) -> None:
+        """Bloquant (fdatasync) : à appeler via asyncio.to_thread depuis la boucle d'événements."""
+        self._f.flush()
+        os.fdatasync(self._f.fileno())
+        advise(self._f, self._dropped, self._written - self._dropped, "DONTNEED")
+        self._dropped = self._written
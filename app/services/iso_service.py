@@ -0,0 +1,174 @@
+"""
+Opérations catalogue partagées entre les routes unitaires (/api/isos/...)
+et les opérations groupées (/api/bulk/...).
+"""
+import os
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.config import BASE_URL, MANIFEST_BLOCK_SIZE
+from app.database import SessionLocal
+from app.models import ISO
+from app.services.cold_storage import cold_path, image_exists, is_cold_name
+from app.services.dedup_service import dedup_iso, release_file
+from app.services.file_cache import file_cache
+from app.services.hash_service import compute_sha256_and_blocks, verify_checksum
+from app.services.manifest_service import (
+    corrupt_blocks, format_block_ranges, hash_and_index, load_manifest, store_manifest,
+)
+from app.services.storage_service import path_for, root_of
+
+
+def storage_file(filename: str) -> str:
+    """Chemin réel d'un fichier (quelle que soit sa racine) ; 400 si le nom sort du stockage."""
+    safe_name = os.path.basename(filename or "")
+    if not safe_name or safe_name in (".", "..") or is_cold_name(safe_name):
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    file_path = os.path.realpath(path_for(safe_name))
+    if root_of(file_path) is None:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    return file_path
+
+
+def remove_file(filename: str, storage_mode: Optional[str] = None) -> int:
+    """
+    Supprime le fichier d'une ISO (et sa version froide si storage_mode n'est pas raw) ;
+    retourne les octets réellement libérés.
+    """
+    try:
+        file_path = storage_file(filename)
+    except HTTPException:
+        return 0
+    file_cache.invalidate(file_path)
+    # Avec la déduplication, le blob n'est libéré qu'au dernier lien
+    reclaimed = release_file(file_path)
+    if (storage_mode or "raw") != "raw":
+        reclaimed += release_file(cold_path(file_path))
+    return reclaimed
+
+
+def new_import_entry(db: Session, filename: str, fields: dict) -> ISO:
+    """
+    Prépare (sans commit) l'entrée d'un fichier déjà présent dans le stockage.
+    Le SHA256 est calculé ensuite par hash_imported().
+    """
+    filename = os.path.basename(filename or "")
+    if not filename:
+        raise HTTPException(status_code=400, detail="filename required")
+    file_path = storage_file(filename)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File not found in storage")
+
+    existing = db.query(ISO).filter(ISO.filename == filename).first()
+    if existing:
+        raise HTTPException(status_code=409, detail="File already tracked")
+
+    iso = ISO(
+        name=fields.get("name") or os.path.splitext(filename)[0],
+        filename=filename,
+        category=fields.get("category") or "other",
+        os_family=fields.get("os_family"),
+        edition=fields.get("edition"),
+        file_format=fields.get("file_format"),
+        version=fields.get("version"),
+        architecture=fields.get("architecture") or "x86_64",
+        description=fields.get("description"),
+        tags=fields.get("tags"),
+        add_method="import",
+        status="verifying",
+        download_progress=0,
+        size_bytes=os.path.getsize(file_path),
+        file_path=file_path,
+        http_url=f"{BASE_URL}/files/{filename}",
+    )
+    db.add(iso)
+    return iso
+
+
+async def hash_imported(iso_id: int) -> bool:
+    """Calcule le SHA256 d'une entrée importée et la passe en 'available'."""
+    bg_db = SessionLocal()
+    try:
+        iso = bg_db.query(ISO).filter(ISO.id == iso_id).first()
+        if not iso:
+            return False
+        sha = await hash_and_index(iso_id, storage_file(iso.filename))
+        bg_db.query(ISO).filter(ISO.id == iso_id).update({
+            "status": "available",
+            "sha256": sha,
+            "download_progress": 100,
+            "updated_at": datetime.utcnow(),
+        })
+        bg_db.commit()
+        await dedup_iso(iso_id)
+        return True
+    except Exception as e:
+        bg_db.query(ISO).filter(ISO.id == iso_id).update({
+            "status": "error",
+            "error_message": str(e),
+            "updated_at": datetime.utcnow(),
+        })
+        bg_db.commit()
+        return False
+    finally:
+        bg_db.close()
+
+
+async def verify_file(db: Session, iso: ISO) -> Optional[bool]:
+    """Recalcule le SHA256 et contrôle le checksum attendu. Retourne checksum_verified."""
+    file_path = path_for(iso.filename)
+    if not image_exists(file_path):
+        raise HTTPException(status_code=404, detail="File not found on disk")
+
+    previous_status, reference_sha256 = iso.status, iso.sha256
+    manifest = load_manifest(db, iso.id)
+    block_size = manifest.block_size if manifest else MANIFEST_BLOCK_SIZE
+    db.query(ISO).filter(ISO.id == iso.id).update({
+        "status": "verifying",
+        "updated_at": datetime.utcnow(),
+    })
+    db.commit()
+
+    try:
+        sha256, leaves = await compute_sha256_and_blocks(file_path, block_size)
+        checksum_verified = None
+        if iso.expected_checksum:
+            if (iso.checksum_type or "sha256").lower() == "sha256":
+                checksum_verified = sha256.lower() == iso.expected_checksum.strip().lower()
+            else:
+                checksum_verified = await verify_checksum(file_path, iso.expected_checksum, iso.checksum_type)
+    except Exception as e:
+        db.query(ISO).filter(ISO.id == iso.id).update({
+            "status": "error",
+            "error_message": str(e),
+            "updated_at": datetime.utcnow(),
+        })
+        db.commit()
+        raise
+
+    values = {
+        "status": "available",
+        "sha256": sha256,
+        "checksum_verified": checksum_verified,
+        "last_verified_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow(),
+    }
+    if previous_status == "corrupt" and reference_sha256 and sha256 != reference_sha256.lower():
+        # Toujours différent du SHA256 de référence : reste corrompue
+        values.update({"status": "corrupt", "sha256": reference_sha256})
+        if manifest:
+            bad = corrupt_blocks(manifest.leaves, leaves)
+            values["error_message"] = (
+                f"SHA256 mismatch : {len(bad)} bloc(s) corrompu(s), "
+                f"octets {format_block_ranges(bad, manifest.block_size)}"
+            )
+    else:
+        if previous_status == "corrupt":
+            values["error_message"] = None
+        store_manifest(iso.id, block_size, leaves)
+    db.query(ISO).filter(ISO.id == iso.id).update(values)
+    db.commit()
+    return checksum_verified
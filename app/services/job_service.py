@@ -0,0 +1,34 @@
+"""
+Suivi des opérations groupées : chaque job est une ligne de la table jobs,
+consultable via GET /api/jobs/{id} pendant que le travail s'exécute en arrière-plan.
+Les mises à jour passent par l'écrivain unique (db_writer), qui les fusionne par lots.
+"""
+import json
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.models import Job
+from app.services.db_writer import queue_update
+
+
+def create_job(db: Session, kind: str, total: int) -> Job:
+    job = Job(kind=kind, status="queued", total=total, done=0, failed=0)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def update_job(job_id: int, done: int = 0, failed: int = 0, status: Optional[str] = None,
+               result: Optional[dict] = None, error_message: Optional[str] = None, total: int = 0) -> None:
+    """Incrémente les compteurs done/failed (et total, pour un job en flux) et met à jour le statut du job."""
+    values = {"updated_at": datetime.utcnow()}
+    if status is not None:
+        values["status"] = status
+    if result is not None:
+        values["result"] = json.dumps(result)
+    if error_message is not None:
+        values["error_message"] = error_message
+    queue_update(Job, job_id, values, {"done": done, "failed": failed, "total": total})
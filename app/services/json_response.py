@@ -0,0 +1,56 @@
+"""
+Réponses JSON des lectures du catalogue (/api/isos, /api/browse).
+
+Sérialisation directe en octets avec orjson (datetime natifs, pas de validation
+pydantic par ligne) ; repli sur json de la bibliothèque standard s'il n'est pas
+installé. Les corps dépassant CATALOG_COMPRESS_MIN_BYTES sont compressés en br
+(si brotli est installé) ou gzip selon Accept-Encoding.
+"""
+import gzip
+import json
+from datetime import date, datetime
+from typing import Any
+
+from fastapi import Request, Response
+
+from app.config import CATALOG_COMPRESS_LEVEL, CATALOG_COMPRESS_MIN_BYTES
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _accepts(request: Request, encoding: str) -> bool:
+    accepted = request.headers.get("accept-encoding", "")
+    return any(part.split(";")[0].strip() == encoding for part in accepted.lower().split(","))
+
+
+def json_response(request: Request, content: Any) -> Response:
+    body = dumps(content)
+    headers = {"Vary": "Accept-Encoding"}
+    if CATALOG_COMPRESS_MIN_BYTES and len(body) >= CATALOG_COMPRESS_MIN_BYTES:
+        if brotli is not None and _accepts(request, "br"):
+            body = brotli.compress(body, quality=min(CATALOG_COMPRESS_LEVEL, 11))
+            headers["Content-Encoding"] = "br"
+        elif _accepts(request, "gzip"):
+            body = gzip.compress(body, compresslevel=CATALOG_COMPRESS_LEVEL, mtime=0)
+            headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,109 @@
+"""
+Élection d'un leader entre les workers uvicorn (--workers N).
+
+Les tâches singleton (watcher, vérification planifiée des mises à jour, scrubber,
+rééquilibrage, maintenance SQLite) ne tournent que dans le worker qui tient un verrou
+fcntl exclusif sur LEADER_LOCK_PATH. Le bail dure tant que le processus vit : le noyau
+libère le verrou à sa mort, et un autre worker le reprend au plus LEADER_RETRY_SECONDS
+plus tard puis relance les tâches.
+
+Sans fcntl (Windows), le processus est toujours leader.
+"""
+import asyncio
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from app.config import LEADER_LOCK_PATH, LEADER_RETRY_SECONDS
+
+logger = logging.getLogger("leader")
+
+state = {"is_leader": False, "since": None}
+
+
+class LeaderLock:
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            self._fd = -1
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        # PID du leader, pour le diagnostic (holder())
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, f"{os.getpid()}\n".encode(), 0)
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        if self._fd >= 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        self._fd = None
+
+    def holder(self) -> Optional[int]:
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+
+_lock = LeaderLock(LEADER_LOCK_PATH)
+
+
+def leader_info() -> dict:
+    return {**state, "pid": os.getpid(), "leader_pid": _lock.holder()}
+
+
+@contextmanager
+def startup_lock():
+    """Sérialise l'initialisation (création des tables, migrations) entre workers."""
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(LEADER_LOCK_PATH + ".init", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+async def run_as_leader(loops: List[Callable]):
+    """
+    Attend d'être leader puis lance les boucles singleton, jusqu'à l'annulation
+    (arrêt du worker) : les boucles sont alors arrêtées et le verrou rendu.
+    """
+    tasks: List[asyncio.Task] = []
+    try:
+        while not _lock.try_acquire():
+            await asyncio.sleep(LEADER_RETRY_SECONDS)
+        state.update({"is_leader": True, "since": datetime.utcnow()})
+        logger.info(f"Worker {os.getpid()} élu leader — démarrage des tâches de fond")
+        tasks = [asyncio.create_task(loop()) for loop in loops]
+        await asyncio.Future()  # le bail est tenu jusqu'à l'arrêt du worker
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        _lock.release()
+        state.update({"is_leader": False, "since": None})
@@ -0,0 +1,131 @@
+"""
+Manifeste de hachés par bloc, organisé en arbre de Merkle.
+
+Calculé à l'ingestion en même temps que le SHA256 (une seule lecture), il permet :
+- au scrubber de localiser les blocs corrompus au lieu d'un simple « fichier invalide »
+- aux clients de vérifier une réponse Range bloc par bloc (avec preuve de Merkle)
+- de re-vérifier seulement les blocs touchés après une écriture partielle
+
+Feuille : sha256(0x00 || bloc). Nœud : sha256(0x01 || gauche || droite) ;
+un nœud sans frère remonte tel quel au niveau supérieur.
+"""
+import asyncio
+import hashlib
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from app.config import MANIFEST_BLOCK_SIZE
+from app.database import SessionLocal
+from app.models import ISO, ISOManifest
+from app.services.cold_storage import image_size
+from app.services.hash_service import block_digest, compute_sha256_and_blocks
+from app.services.io_policy import ScanReader
+
+DIGEST_SIZE = 32
+
+
+def split_leaves(leaves: bytes) -> List[bytes]:
+    return [leaves[i:i + DIGEST_SIZE] for i in range(0, len(leaves), DIGEST_SIZE)]
+
+
+def _node(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def merkle_levels(leaves: List[bytes]) -> List[List[bytes]]:
+    levels = [leaves or [hashlib.sha256(b"\x00").digest()]]
+    while len(levels[-1]) > 1:
+        prev = levels[-1]
+        nxt = [_node(prev[i], prev[i + 1]) for i in range(0, len(prev) - 1, 2)]
+        if len(prev) % 2:
+            nxt.append(prev[-1])
+        levels.append(nxt)
+    return levels
+
+
+def merkle_root(leaves: List[bytes]) -> bytes:
+    return merkle_levels(leaves)[-1][0]
+
+
+def merkle_proof(levels: List[List[bytes]], index: int) -> List[str]:
+    """Frères successifs de la feuille index jusqu'à la racine ("left:<hex>" / "right:<hex>")."""
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            side = "left" if sibling < index else "right"
+            proof.append(f"{side}:{level[sibling].hex()}")
+        index //= 2
+    return proof
+
+
+async def hash_and_index(iso_id: int, filepath: str, block_size: int = MANIFEST_BLOCK_SIZE) -> str:
+    """
+    Calcule le SHA256 et le manifeste d'une image en une seule lecture,
+    enregistre le manifeste et retourne le SHA256.
+    """
+    sha256, leaves = await compute_sha256_and_blocks(filepath, block_size)
+    store_manifest(iso_id, block_size, leaves)
+    return sha256
+
+
+def store_manifest(iso_id: int, block_size: int, leaves: bytes) -> str:
+    root = merkle_root(split_leaves(leaves)).hex()
+    db = SessionLocal()
+    try:
+        db.merge(ISOManifest(iso_id=iso_id, block_size=block_size, leaves=leaves, created_at=datetime.utcnow()))
+        db.query(ISO).filter(ISO.id == iso_id).update({
+            "merkle_root": root,
+            "manifest_block_size": block_size,
+        })
+        db.commit()
+    finally:
+        db.close()
+    return root
+
+
+def delete_manifest(db, iso_ids: List[int]) -> None:
+    db.query(ISOManifest).filter(ISOManifest.iso_id.in_(iso_ids)).delete(synchronize_session=False)
+
+
+def load_manifest(db, iso_id: int) -> Optional[ISOManifest]:
+    return db.query(ISOManifest).filter(ISOManifest.iso_id == iso_id).first()
+
+
+def corrupt_blocks(stored: bytes, actual: bytes) -> List[int]:
+    """Indices des blocs dont le haché diffère (ou qui manquent d'un côté)."""
+    a, b = split_leaves(stored), split_leaves(actual)
+    bad = [i for i, (x, y) in enumerate(zip(a, b)) if x != y]
+    bad.extend(range(min(len(a), len(b)), max(len(a), len(b))))
+    return bad
+
+
+def format_block_ranges(indices: List[int], block_size: int) -> str:
+    """[3, 4, 5, 9] avec des blocs de 4 Mio → "12582912-25165823, 37748736-41943039"."""
+    ranges: List[Tuple[int, int]] = []
+    for i in indices:
+        if ranges and ranges[-1][1] == i - 1:
+            ranges[-1] = (ranges[-1][0], i)
+        else:
+            ranges.append((i, i))
+    return ", ".join(f"{a * block_size}-{(b + 1) * block_size - 1}" for a, b in ranges)
+
+
+def _verify_range(filepath: str, manifest: ISOManifest, start: int, end: int) -> List[int]:
+    leaves = split_leaves(manifest.leaves)
+    bs = manifest.block_size
+    first, last = start // bs, min(end // bs, len(leaves) - 1)
+    bad = []
+    with ScanReader(filepath) as f:
+        f.seek(first * bs)
+        for i in range(first, last + 1):
+            if block_digest(f.read(bs)) != leaves[i]:
+                bad.append(i)
+    return bad
+
+
+async def verify_range(filepath: str, manifest: ISOManifest, start: int = 0, end: Optional[int] = None) -> List[int]:
+    """Re-vérifie uniquement les blocs couvrant [start, end] ; retourne les blocs invalides."""
+    if end is None:
+        end = image_size(filepath) - 1
+    return await asyncio.to_thread(_verify_range, filepath, manifest, start, end)
@@ -0,0 +1,144 @@
+"""
+Miroirs d'une image : classement avant téléchargement et mémoire des performances.
+
+- probe_mirrors() sonde chaque miroir en parallèle avec une petite requête Range
+  (MIRROR_PROBE_BYTES) : latence, débit, support des Range, taille annoncée
+- le classement combine la sonde et l'historique de mirror_stats (moyennes glissantes
+  par hôte) : un miroir rapide lors des derniers téléchargements reste favori même si
+  la sonde, trop courte, mesure surtout la latence
+- record_transfer() / record_probe() alimentent mirror_stats via l'écrivain unique
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from app.config import MIRROR_PROBE_BYTES, MIRROR_PROBE_TIMEOUT
+from app.database import SessionLocal
+from app.models import MirrorStats
+from app.services.db_writer import submit
+
+logger = logging.getLogger("mirrors")
+
+EWMA_ALPHA = 0.3
+REFERENCE_BYTES = 64 * 1024 * 1024  # le classement estime le temps de transfert de 64 Mio
+
+
+def mirror_host(url: str) -> str:
+    return (urlparse(url).netloc or url).lower()
+
+
+def mirror_list(url: str, mirrors: Optional[List[str]]) -> List[str]:
+    """URL principale puis miroirs, sans doublon, dans l'ordre donné."""
+    urls = []
+    for candidate in [url, *(mirrors or [])]:
+        candidate = (candidate or "").strip()
+        if candidate and candidate not in urls:
+            urls.append(candidate)
+    return urls
+
+
+async def _probe(client: httpx.AsyncClient, url: str) -> dict:
+    result = {"url": url, "ok": False, "latency": None, "throughput": None, "size": None, "ranges": False}
+    started = time.monotonic()
+    try:
+        headers = {"Range": f"bytes=0-{MIRROR_PROBE_BYTES - 1}", "Accept-Encoding": "identity"}
+        async with client.stream("GET", url, headers=headers) as response:
+            result["latency"] = time.monotonic() - started
+            if response.status_code not in (200, 206):
+                return result
+            result["ranges"] = response.status_code == 206
+            if result["ranges"]:
+                total = response.headers.get("content-range", "").rpartition("/")[2]
+                result["size"] = int(total) if total.isdigit() else None
+            elif response.headers.get("content-length", "").isdigit():
+                result["size"] = int(response.headers["content-length"])
+            received = 0
+            async for chunk in response.aiter_bytes():
+                received += len(chunk)
+                if received >= MIRROR_PROBE_BYTES:
+                    break  # serveur sans Range : ne pas télécharger l'image entière
+            elapsed = time.monotonic() - started - result["latency"]
+            result["throughput"] = received / elapsed if elapsed > 0 else None
+            result["ok"] = True
+    except (httpx.HTTPError, OSError) as e:
+        logger.info(f"Sonde du miroir {url} en échec : {e}")
+    return result
+
+
+def _history(hosts: List[str]) -> Dict[str, MirrorStats]:
+    db = SessionLocal()
+    try:
+        return {row.host: row for row in db.query(MirrorStats).filter(MirrorStats.host.in_(hosts)).all()}
+    finally:
+        db.close()
+
+
+def _expected_seconds(probe: dict, history: Optional[MirrorStats]) -> float:
+    latency = probe["latency"] or 0.0
+    throughput = probe["throughput"]
+    if history and history.throughput_bps:
+        throughput = history.throughput_bps if not throughput else (throughput + 2 * history.throughput_bps) / 3
+    if not throughput:
+        return float("inf")
+    penalty = 1 + (history.failures / (history.successes + history.failures + 1) if history else 0)
+    return (latency + REFERENCE_BYTES / throughput) * penalty
+
+
+async def probe_mirrors(client: httpx.AsyncClient, urls: List[str]) -> List[dict]:
+    """Sondes de tous les miroirs, du plus rapide estimé au plus lent ; les échecs en dernier."""
+    probes = await asyncio.gather(*[
+        asyncio.wait_for(_probe(client, url), MIRROR_PROBE_TIMEOUT) for url in urls
+    ], return_exceptions=True)
+    probes = [
+        p if isinstance(p, dict) else {"url": url, "ok": False, "latency": None, "throughput": None,
+                                       "size": None, "ranges": False}
+        for url, p in zip(urls, probes)
+    ]
+    history = await asyncio.to_thread(_history, [mirror_host(url) for url in urls])
+    for p in probes:
+        record_probe(p["url"], p["latency"] if p["ok"] else None, ok=p["ok"])
+        p["score"] = _expected_seconds(p, history.get(mirror_host(p["url"]))) if p["ok"] else float("inf")
+    return sorted(probes, key=lambda p: (not p["ok"], p["score"]))
+
+
+def _update(session, host: str, latency: Optional[float], throughput: Optional[float], ok: bool) -> None:
+    row = session.get(MirrorStats, host)
+    if row is None:
+        row = MirrorStats(host=host, successes=0, failures=0)
+        session.add(row)
+    if latency is not None:
+        ms = int(latency * 1000)
+        row.latency_ms = ms if row.latency_ms is None else int(row.latency_ms * (1 - EWMA_ALPHA) + ms * EWMA_ALPHA)
+    if throughput:
+        bps = int(throughput)
+        row.throughput_bps = (bps if row.throughput_bps is None
+                              else int(row.throughput_bps * (1 - EWMA_ALPHA) + bps * EWMA_ALPHA))
+    if not ok:
+        row.failures = (row.failures or 0) + 1
+    row.last_used_at = datetime.utcnow()
+
+
+def record_probe(url: str, latency: Optional[float], ok: bool) -> None:
+    submit(lambda session: _update(session, mirror_host(url), latency, None, ok))
+
+
+def record_transfer(url: str, nbytes: int, seconds: float, ok: bool) -> None:
+    """Débit d'un segment de transfert (jusqu'à la fin ou jusqu'à la bascule)."""
+    throughput = nbytes / seconds if nbytes and seconds > 0 else None
+
+    def write(session):
+        _update(session, mirror_host(url), None, throughput, ok)
+        if ok:
+            row = session.get(MirrorStats, mirror_host(url))
+            row.successes = (row.successes or 0) + 1
+
+    submit(write)
+
+
+def list_mirror_stats(db) -> List[MirrorStats]:
+    return db.query(MirrorStats).order_by(MirrorStats.throughput_bps.desc()).all()
@@ -0,0 +1,274 @@
+"""
+Import côté serveur depuis des répertoires locaux autorisés (IMPORT_SOURCE_PATHS),
+par exemple un ancien partage NFS monté : pas de transit par le navigateur ni
+d'attente du file_watcher.
+
+Copie de chaque fichier vers une racine de stockage :
+- reflink (FICLONE) si source et destination partagent un système de fichiers qui le
+  permet : copie instantanée en copie-sur-écriture, le hachage relit ensuite la source
+- sinon os.copy_file_range (copie dans le noyau, sans passer par l'espace utilisateur),
+  le hachage suivant la copie dans un second thread, bloc par bloc, sur des pages
+  que la copie vient de charger dans le cache
+- sinon (systèmes de fichiers différents, EXDEV…) copie classique, hachée au passage
+
+Les fichiers d'un job sont copiés en parallèle, au plus IMPORT_COPY_CONCURRENCY à la
+fois ; chaque image suit le même cycle qu'un téléchargement (downloading -> available,
+download_progress) et le job avance via /api/jobs/{id}.
+"""
+import asyncio
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.config import BASE_URL, IMPORT_COPY_CONCURRENCY, IMPORT_SOURCE_PATHS, MANIFEST_BLOCK_SIZE
+from app.models import ISO
+from app.services.db_writer import flushed, queue_update
+from app.services.dedup_service import FICLONE, dedup_iso
+from app.services.hash_service import block_digest
+from app.services.io_policy import ScanReader, advise
+from app.services.job_service import update_job
+from app.services.manifest_service import store_manifest
+from app.services.storage_service import InsufficientStorage, Reservation, filename_taken, reserve
+
+logger = logging.getLogger("path_import")
+
+COPY_CHUNK = 64 * 1024 * 1024
+# copy_file_range impossible entre ces deux fichiers : repli sur la copie classique
+_NO_KERNEL_COPY = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+
+def source_dirs() -> List[str]:
+    return [os.path.realpath(p) for p in IMPORT_SOURCE_PATHS]
+
+
+def resolve_source(path: str) -> str:
+    """Chemin réel d'un fichier source ; 403 hors des répertoires autorisés, 404 s'il n'existe pas."""
+    real = os.path.realpath(path or "")
+    if not any(os.path.commonpath([real, d]) == d for d in source_dirs()):
+        raise HTTPException(status_code=403, detail="Path outside IMPORT_SOURCE_PATHS")
+    if not os.path.isfile(real):
+        raise HTTPException(status_code=404, detail="Source file not found")
+    return real
+
+
+def list_sources(extensions) -> List[dict]:
+    """Fichiers importables de chaque répertoire autorisé (récursif)."""
+    files = []
+    for directory in source_dirs():
+        for dirpath, _, names in os.walk(directory):
+            for name in sorted(names):
+                if os.path.splitext(name)[1].lower() not in extensions:
+                    continue
+                full = os.path.join(dirpath, name)
+                try:
+                    files.append({"path": full, "size_bytes": os.path.getsize(full)})
+                except OSError:
+                    continue
+    return files
+
+
+def new_copy_entry(db: Session, source: str, fields: dict, taken: set) -> Tuple[ISO, Reservation]:
+    """
+    Prépare (sans commit) l'entrée d'une image copiée depuis source et réserve sa place ;
+    taken : noms déjà attribués dans ce job (les fichiers n'existent pas encore).
+    """
+    size = os.path.getsize(source)
+    try:
+        reservation = reserve(size, category=fields.get("category"))
+    except InsufficientStorage as e:
+        raise HTTPException(status_code=507, detail=str(e))
+
+    try:
+        filename = os.path.basename(fields.get("filename") or source).lstrip(".") or "import.iso"
+        base, ext = os.path.splitext(filename)
+        counter = 1
+        while filename in taken or filename_taken(filename) or db.query(ISO.id).filter(ISO.filename == filename).first():
+            filename = f"{base}_{counter}{ext}"
+            counter += 1
+        taken.add(filename)
+
+        iso = ISO(
+            name=fields.get("name") or os.path.splitext(filename)[0],
+            filename=filename,
+            category=fields.get("category") or "other",
+            os_family=fields.get("os_family"),
+            edition=fields.get("edition"),
+            file_format=fields.get("file_format"),
+            version=fields.get("version"),
+            architecture=fields.get("architecture") or "x86_64",
+            description=fields.get("description"),
+            tags=fields.get("tags"),
+            add_method="copy",
+            status="downloading",
+            download_progress=0,
+            size_bytes=size,
+            file_path=os.path.join(reservation.root, filename),
+        )
+        db.add(iso)
+    except Exception:
+        reservation.release()
+        raise
+    return iso, reservation
+
+
+def _reflink(fsrc, fdst) -> bool:
+    try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        return False
+
+
+class _KernelCopy:
+    """copy_file_range dans un thread ; copied : octets déjà copiés (attendus par le hachage)."""
+
+    def __init__(self, fsrc, fdst, size: int, first: int):
+        self.fsrc, self.fdst, self.size = fsrc, fdst, size
+        self.copied = first
+        self.error: Optional[BaseException] = None
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name="copy-file-range", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        try:
+            while self.copied < self.size:
+                n = os.copy_file_range(self.fsrc.fileno(), self.fdst.fileno(),
+                                       min(COPY_CHUNK, self.size - self.copied), self.copied, self.copied)
+                if n == 0:
+                    raise OSError(errno.EIO, "Source tronquée pendant la copie")
+                with self.cond:
+                    self.copied += n
+                    self.cond.notify_all()
+        except BaseException as e:
+            self.error = e
+        with self.cond:
+            self.cond.notify_all()
+
+    def wait_for(self, offset: int) -> None:
+        with self.cond:
+            while self.copied < offset and self.error is None:
+                self.cond.wait()
+        if self.error is not None:
+            raise self.error
+
+
+def copy_and_hash(source: str, dest: str, block_size: int = MANIFEST_BLOCK_SIZE,
+                  progress: Optional[Callable[[int, int], None]] = None) -> Tuple[str, bytes, str]:
+    """
+    Bloquant : copie source vers dest (fichier déjà créé et préalloué) et retourne
+    (sha256, feuilles du manifeste, méthode : reflink / copy_file_range / read_write).
+    """
+    sha = hashlib.sha256()
+    leaves = bytearray()
+    st = os.stat(source)
+    size = st.st_size
+
+    def account(block: bytes, done: int) -> None:
+        sha.update(block)
+        leaves.extend(block_digest(block))
+        if progress:
+            progress(done, size)
+
+    with open(source, "rb") as fsrc, open(dest, "r+b") as fdst:
+        advise(fsrc, 0, 0, "SEQUENTIAL")
+        if _reflink(fsrc, fdst):
+            method = "reflink"
+            with ScanReader(source) as reader:
+                done = 0
+                for block in reader.chunks(block_size):
+                    done += len(block)
+                    account(block, done)
+        else:
+            try:
+                first = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(COPY_CHUNK, size), 0, 0) if size else 0
+            except OSError as e:
+                if e.errno not in _NO_KERNEL_COPY:
+                    raise
+                first = None
+            if first is None:
+                method = "read_write"
+                done = 0
+                while block := fsrc.read(block_size):
+                    fdst.write(block)
+                    done += len(block)
+                    account(block, done)
+                    advise(fsrc, 0, done, "DONTNEED")
+            else:
+                method = "copy_file_range"
+                copier = _KernelCopy(fsrc, fdst, size, first)
+                done = 0
+                while done < size:
+                    end = min(done + block_size, size)
+                    copier.wait_for(end)
+                    block = os.pread(fsrc.fileno(), end - done, done)
+                    done += len(block)
+                    account(block, done)
+                    advise(fsrc, 0, done, "DONTNEED")
+                copier.thread.join()
+                if copier.error is not None:
+                    raise copier.error
+            fdst.truncate(size)
+
+    after = os.stat(source)
+    if (after.st_size, after.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+        raise OSError(errno.EAGAIN, "Source modifiée pendant la copie")
+    return sha.hexdigest(), bytes(leaves), method
+
+
+async def _copy_one(iso_id: int, source: str, dest: str, reservation: Reservation, job_id: int) -> Optional[str]:
+    last = [0.0]
+
+    def progress(done: int, total: int) -> None:
+        now = time.monotonic()
+        if total and now - last[0] >= 2:
+            queue_update(ISO, iso_id, {"download_progress": int(done / total * 100)})
+            last[0] = now
+
+    try:
+        with open(dest, "wb") as f:
+            reservation.attach(f)
+        sha256, leaves, method = await asyncio.to_thread(copy_and_hash, source, dest, MANIFEST_BLOCK_SIZE, progress)
+        store_manifest(iso_id, MANIFEST_BLOCK_SIZE, leaves)
+        queue_update(ISO, iso_id, {
+            "status": "available",
+            "sha256": sha256,
+            "size_bytes": os.path.getsize(dest),
+            "http_url": f"{BASE_URL}/files/{os.path.basename(dest)}",
+            "download_progress": 100,
+        })
+        await flushed()  # dedup_iso relit l'entrée
+        await dedup_iso(iso_id)
+        update_job(job_id, done=1)
+        return method
+    except Exception as e:
+        logger.warning(f"Import de {source} en échec : {e}")
+        queue_update(ISO, iso_id, {"status": "error", "error_message": str(e)})
+        if os.path.exists(dest):
+            os.remove(dest)
+        update_job(job_id, failed=1)
+        return None
+    finally:
+        reservation.release()
+
+
+async def run_path_import(job_id: int, copies: List[tuple], result: dict) -> None:
+    """copies : (iso_id, source, destination, réservation) ; au plus IMPORT_COPY_CONCURRENCY en parallèle."""
+    update_job(job_id, status="running")
+    semaphore = asyncio.Semaphore(IMPORT_COPY_CONCURRENCY)
+
+    async def bounded(copy):
+        async with semaphore:
+            return await _copy_one(*copy, job_id)
+
+    methods = await asyncio.gather(*[bounded(c) for c in copies])
+    result["methods"] = {m: methods.count(m) for m in set(methods) if m}
+    update_job(job_id, status="done", result=result)
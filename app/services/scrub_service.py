@@ -0,0 +1,174 @@
+"""
+Scrubber d'intégrité : re-vérifie la bibliothèque en continu, fichier par fichier,
+pour détecter la corruption silencieuse (bit-rot).
+
+- Chaque image est re-hachée tous les SCRUB_INTERVAL_DAYS jours (0 = désactivé)
+- La lecture est limitée à SCRUB_BYTES_PER_SEC pour ne pas dégrader le service
+- Le scrub se met en pause tant que plus de SCRUB_MAX_ACTIVE_STREAMS flux /files sont actifs,
+  tous workers confondus (serving.active_streams)
+- Un SHA256 différent de celui enregistré fait passer l'image au statut 'corrupt' ;
+  le manifeste de blocs permet d'indiquer les plages d'octets corrompues
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy import or_
+
+from app.config import (
+    MANIFEST_BLOCK_SIZE, SCRUB_INTERVAL_DAYS, SCRUB_BYTES_PER_SEC, SCRUB_MAX_ACTIVE_STREAMS,
+)
+from app.database import SessionLocal
+from app.models import ISO
+from app.services.cold_storage import image_exists
+from app.services.hash_service import block_digest
+from app.services.io_policy import ScanReader
+from app.services.manifest_service import corrupt_blocks, format_block_ranges, load_manifest, store_manifest
+from app.services.serving import active_streams
+from app.services.storage_service import path_for
+
+logger = logging.getLogger("scrub")
+
+IDLE_SLEEP = 60          # aucune image à vérifier
+LOAD_PAUSE_SLEEP = 5     # service trop chargé
+
+
+class _Throttle:
+    """Limite un débit moyen en octets/s en dormant entre deux lectures."""
+
+    def __init__(self, bytes_per_sec: int):
+        self.bytes_per_sec = bytes_per_sec
+        self._start = time.monotonic()
+        self._consumed = 0
+
+    async def consume(self, nbytes: int):
+        self._consumed += nbytes
+        if self.bytes_per_sec <= 0:
+            return
+        expected = self._consumed / self.bytes_per_sec
+        elapsed = time.monotonic() - self._start
+        if expected > elapsed:
+            await asyncio.sleep(expected - elapsed)
+
+    def reset(self):
+        self._start = time.monotonic()
+        self._consumed = 0
+
+
+async def _wait_for_low_load(throttle: _Throttle):
+    paused = False
+    while active_streams() > SCRUB_MAX_ACTIVE_STREAMS:
+        paused = True
+        await asyncio.sleep(LOAD_PAUSE_SLEEP)
+    if paused:
+        throttle.reset()  # ne pas « rattraper » le temps de pause en rafale
+
+
+async def throttled_sha256(filepath: str, block_size: int = MANIFEST_BLOCK_SIZE,
+                           bytes_per_sec: int = SCRUB_BYTES_PER_SEC) -> Tuple[str, bytes]:
+    """SHA256 et hachés de blocs (manifeste), lus au débit autorisé."""
+    h = hashlib.sha256()
+    leaves = bytearray()
+    throttle = _Throttle(bytes_per_sec)
+    with ScanReader(filepath) as f:
+        while True:
+            await _wait_for_low_load(throttle)
+            block = await asyncio.to_thread(f.read, block_size)
+            if not block:
+                break
+            leaves += await asyncio.to_thread(_update, h, block)
+            await throttle.consume(len(block))
+    return h.hexdigest(), bytes(leaves)
+
+
+def _update(h, block: bytes) -> bytes:
+    h.update(block)
+    return block_digest(block)
+
+
+def _next_due(db) -> Optional[ISO]:
+    cutoff = datetime.utcnow() - timedelta(days=SCRUB_INTERVAL_DAYS)
+    return db.query(ISO).filter(
+        ISO.status == "available",
+        ISO.sha256.isnot(None),
+        or_(ISO.last_verified_at.is_(None), ISO.last_verified_at < cutoff),
+    ).order_by(ISO.last_verified_at.is_not(None), ISO.last_verified_at).first()
+
+
+async def scrub_iso(iso_id: int) -> Optional[bool]:
+    """Re-vérifie une image. True = intègre, False = corrompue, None = non vérifiable."""
+    db = SessionLocal()
+    try:
+        iso = db.query(ISO).filter(ISO.id == iso_id).first()
+        if not iso or not iso.sha256:
+            return None
+        file_path = path_for(iso.filename)
+        if not image_exists(file_path):
+            return None  # le file watcher le passera en 'missing'
+        expected = iso.sha256.lower()
+        manifest = load_manifest(db, iso_id)
+        stored_leaves = manifest.leaves if manifest else None
+        block_size = manifest.block_size if manifest else MANIFEST_BLOCK_SIZE
+    finally:
+        db.close()
+
+    actual, leaves = await throttled_sha256(file_path, block_size)
+    ok = actual == expected
+
+    db = SessionLocal()
+    try:
+        values = {"last_verified_at": datetime.utcnow()}
+        if not ok:
+            message = f"SHA256 mismatch (scrub) : attendu {expected}, obtenu {actual}"
+            if stored_leaves is not None:
+                bad = corrupt_blocks(stored_leaves, leaves)
+                message += f" — {len(bad)} bloc(s) corrompu(s), octets {format_block_ranges(bad, block_size)}"
+            values.update({
+                "status": "corrupt",
+                "error_message": message,
+                "updated_at": datetime.utcnow(),
+            })
+        # Ne pas écraser un changement de statut survenu pendant le scrub
+        db.query(ISO).filter(ISO.id == iso_id, ISO.status == "available").update(values)
+        db.commit()
+    finally:
+        db.close()
+
+    if ok and stored_leaves is None:
+        store_manifest(iso_id, block_size, leaves)  # images ingérées avant les manifestes
+
+    if ok:
+        logger.info(f"Scrub OK : id={iso_id}")
+    else:
+        logger.error(f"Corruption détectée : id={iso_id} ({file_path})")
+    return ok
+
+
+async def scrub_loop():
+    if SCRUB_INTERVAL_DAYS <= 0:
+        return
+    logger.info(
+        f"Scrubber démarré (cycle : {SCRUB_INTERVAL_DAYS} j, budget : {SCRUB_BYTES_PER_SEC} o/s, "
+        f"pause au-delà de {SCRUB_MAX_ACTIVE_STREAMS} flux actifs)"
+    )
+    while True:
+        try:
+            db = SessionLocal()
+            try:
+                iso = _next_due(db)
+                iso_id = iso.id if iso else None
+            finally:
+                db.close()
+
+            if iso_id is None:
+                await asyncio.sleep(IDLE_SLEEP)
+                continue
+            await scrub_iso(iso_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Erreur scrubber : {e}")
+            await asyncio.sleep(IDLE_SLEEP)
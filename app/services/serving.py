@@ -0,0 +1,170 @@
+"""
+État du service de fichiers (/files) partagé avec les tâches de fond :
+- admission des flux : limites globale (FILES_MAX_STREAMS) et par client
+  (FILES_MAX_STREAMS_PER_CLIENT) ; au-delà, /files répond 503 + Retry-After.
+  Les limites valent pour tous les workers : chacun publie ses flux actifs dans
+  FILES_STREAMS_STATE_PATH (worker_state), lu à chaque admission. Sans fcntl, ou si
+  le fichier est inaccessible, les limites sont par worker
+- nombre de flux actifs de tous les workers, utilisé par le scrubber (qui ne tourne
+  que dans le leader) pour se mettre en pause
+- date du dernier service de chaque image (images « chaudes » à garder en cache)
+- octets servis par image (access_log), comptés en mémoire uniquement
+- pool de threads dédié aux lectures de fichiers : un afflux de flux n'épuise pas
+  le threadpool par défaut, qui reste disponible pour les routes de l'API
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple
+
+from app.config import FILE_IO_WORKERS, FILES_MAX_STREAMS, FILES_MAX_STREAMS_PER_CLIENT, FILES_STREAMS_STATE_PATH
+from app.services.access_log import record_bytes
+from app.services.worker_state import WorkerState
+
+_lock = threading.Lock()
+_active_streams = 0
+_per_client: Dict[str, int] = {}
+_last_served: Dict[str, float] = {}
+_rejected = 0
+
+file_io_pool = ThreadPoolExecutor(max_workers=FILE_IO_WORKERS, thread_name_prefix="file-io")
+
+_DONE = object()
+
+
+class SharedStreams:
+    """Flux actifs de chaque worker, {pid: {"active": n, "clients": {ip: n}}} (worker_state)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._state = WorkerState(path, "des flux /files")
+
+    def exchange(self, publish: Optional[dict] = None) -> Optional[Tuple[int, Dict[str, int]]]:
+        """
+        Sous verrou : publie l'état de ce worker (publish), puis retourne les flux des
+        autres workers vivants (total, par client). None si le fichier est inaccessible.
+        """
+        if publish is not None and not publish["active"]:
+            publish = {}
+        others = self._state.exchange(publish)
+        if others is None:
+            return None
+        clients: Dict[str, int] = {}
+        for record in others.values():
+            for client, n in record.get("clients", {}).items():
+                clients[client] = clients.get(client, 0) + n
+        return sum(r.get("active", 0) for r in others.values()), clients
+
+
+shared_streams = SharedStreams(FILES_STREAMS_STATE_PATH)
+
+
+def _publish() -> Optional[Tuple[int, Dict[str, int]]]:
+    """Publie les flux de ce worker (sous _lock) ; retourne ceux des autres."""
+    return shared_streams.exchange({"active": _active_streams, "clients": dict(_per_client)})
+
+
+def active_streams() -> int:
+    """Flux /files actifs, tous workers confondus (ce worker seul si le fichier partagé manque)."""
+    others = shared_streams.exchange()
+    return _active_streams + (others[0] if others else 0)
+
+
+def stream_stats() -> dict:
+    total = active_streams()
+    with _lock:
+        return {
+            "active": _active_streams,
+            "active_all_workers": total,
+            "max": FILES_MAX_STREAMS,
+            "max_per_client": FILES_MAX_STREAMS_PER_CLIENT,
+            "clients": len(_per_client),
+            "rejected": _rejected,
+            "io_workers": FILE_IO_WORKERS,
+        }
+
+
+class StreamTicket:
+    """Place de flux accordée à un client ; release() est idempotent."""
+
+    def __init__(self, client: str):
+        self.client = client
+        self._released = False
+
+    def release(self) -> None:
+        global _active_streams
+        with _lock:
+            if self._released:
+                return
+            self._released = True
+            _active_streams -= 1
+            remaining = _per_client.get(self.client, 1) - 1
+            if remaining > 0:
+                _per_client[self.client] = remaining
+            else:
+                _per_client.pop(self.client, None)
+            _publish()
+
+
+def admit(client: str) -> Optional[StreamTicket]:
+    """Réserve une place de flux pour client (tous workers confondus) ; None si une limite est atteinte."""
+    global _active_streams, _rejected
+    with _lock:
+        # l'état est publié d'avance puis corrigé : deux workers ne peuvent pas prendre la même place
+        _active_streams += 1
+        _per_client[client] = _per_client.get(client, 0) + 1
+        other_total, other_clients = _publish() or (0, {})
+        if (FILES_MAX_STREAMS > 0 and _active_streams + other_total > FILES_MAX_STREAMS) or (
+            FILES_MAX_STREAMS_PER_CLIENT > 0
+            and _per_client[client] + other_clients.get(client, 0) > FILES_MAX_STREAMS_PER_CLIENT
+        ):
+            _rejected += 1
+            _active_streams -= 1
+            _per_client[client] -= 1
+            if not _per_client[client]:
+                del _per_client[client]
+            _publish()
+            return None
+        return StreamTicket(client)
+
+
+def recently_served(path: str, window: float) -> bool:
+    """True si l'image a été servie dans les window dernières secondes."""
+    served_at = _last_served.get(os.path.realpath(path))
+    return served_at is not None and time.monotonic() - served_at < window
+
+
+def mark_served(path: str) -> None:
+    """Enregistre un service sans flux (réponse depuis le cache mémoire)."""
+    with _lock:
+        _last_served[os.path.realpath(path)] = time.monotonic()
+
+
+async def run_io(func, *args):
+    """Exécute une fonction bloquante de lecture de fichier dans le pool dédié."""
+    return await asyncio.get_running_loop().run_in_executor(file_io_pool, func, *args)
+
+
+async def tracked(iterator: Iterator[bytes], path: str, filename: str, full_size: Optional[int] = None):
+    """
+    Sert un générateur synchrone de blocs depuis le pool d'I/O dédié.
+    full_size : taille du fichier si le fichier entier est demandé (téléchargement complet).
+    La place du flux (ticket) est libérée par la réponse qui l'enveloppe, hors de la boucle
+    d'événements, y compris si le client se déconnecte avant la première itération.
+    """
+    mark_served(path)
+    sent = 0
+    try:
+        while True:
+            chunk = await run_io(next, iterator, _DONE)
+            if chunk is _DONE:
+                break
+            yield chunk
+            sent += len(chunk)
+    finally:
+        record_bytes(filename, sent, full_download=full_size is not None and sent == full_size)
+        # Pas de close() explicite : un next() annulé peut encore tourner dans le pool ;
+        # le générateur (et son fichier) est fermé dès qu'il n'est plus référencé.
+        mark_served(path)
@@ -0,0 +1,483 @@
+"""
+Racines de stockage multiples.
+
+ISO_STORAGE_PATH reste la racine principale ; ISO_STORAGE_EXTRA_PATHS ajoute d'autres
+disques. Un nom de fichier est unique sur l'ensemble des racines et locate() retrouve
+le disque qui le contient : service, watcher, browse et quota couvrent toutes les racines.
+
+Placement des nouvelles images (STORAGE_PLACEMENT) :
+- most_free   : racine avec le plus d'espace libre
+- round_robin : à tour de rôle
+- category    : racine épinglée par catégorie (STORAGE_CATEGORY_ROOTS), sinon most_free
+
+Les transferts en cours (uploads, téléchargements, décongélation, déplacements) réservent
+leur taille attendue : le registre compte ces octets pas encore écrits dans le quota
+(MAX_DISK_USAGE_PCT), et la destination est préallouée (fallocate) pour limiter la
+fragmentation. Une taille inconnue ou dépassée fait grandir la réservation au fil des
+écritures (grow, refusé au-delà du quota) ; elle est ramenée à la taille réelle en fin
+d'écriture (resize) puis libérée à la fin du transfert, réussi ou non. Le registre est
+partagé entre les workers (STORAGE_RESERVATIONS_STATE_PATH, worker_state) : chaque
+décision (reserve, grow, choix de racine) relit sous verrou fcntl les réservations des
+autres workers et publie les siennes ; sans état partagé, le quota est compté par worker.
+
+Le rééquilibrage déplace une image à la fois de la racine la plus pleine vers la plus
+libre : copie + contrôle SHA256, bascule, puis suppression de l'original — sans interruption.
+"""
+import asyncio
+import hashlib
+import itertools
+import logging
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import or_
+
+from app.config import (
+    MAX_DISK_USAGE_PCT, STORAGE_CATEGORY_ROOTS, STORAGE_PLACEMENT, STORAGE_REBALANCE_INTERVAL_MINUTES,
+    STORAGE_REBALANCE_THRESHOLD_PCT, STORAGE_RESERVATIONS_STATE_PATH, STORAGE_ROOTS,
+)
+from app.database import SessionLocal
+from app.models import ISO
+from app.services.cold_storage import LEGACY_COLD_SUFFIX, cold_path, is_seekable_zstd
+from app.services.io_policy import ScanReader, WriteBehind
+from app.services.worker_state import WorkerState
+
+logger = logging.getLogger("storage")
+
+_round_robin = itertools.count()
+
+_reservations_lock = threading.RLock()
+_reservations: Dict[int, "Reservation"] = {}
+_reservation_ids = itertools.count(1)
+_shared = WorkerState(STORAGE_RESERVATIONS_STATE_PATH, "des réservations d'espace")
+_ledger_depth = 0
+_foreign: List[dict] = []  # réservations des autres workers, relues à l'entrée de _ledger()
+
+COPY_CHUNK = 8 * 1024 * 1024
+RESERVATION_STEP = 256 * 1024 * 1024  # agrandissement d'une réservation dépassée
+
+
+def storage_roots() -> List[str]:
+    return list(STORAGE_ROOTS)
+
+
+def primary_root() -> str:
+    return STORAGE_ROOTS[0]
+
+
+def locate(filename: str) -> Optional[str]:
+    """Chemin (brut) d'un fichier dans la racine qui le contient, brut ou froid."""
+    name = os.path.basename(filename or "")
+    if not name:
+        return None
+    for root in STORAGE_ROOTS:
+        path = os.path.join(root, name)
+        if os.path.exists(path) or os.path.exists(cold_path(path)):
+            return path
+    return None
+
+
+def path_for(filename: str) -> str:
+    """locate(), ou le chemin dans la racine principale si le fichier n'existe nulle part."""
+    return locate(filename) or os.path.join(primary_root(), os.path.basename(filename))
+
+
+def root_of(path: str) -> Optional[str]:
+    """Racine contenant path (après résolution des liens), ou None si hors stockage."""
+    real = os.path.realpath(path)
+    for root in STORAGE_ROOTS:
+        real_root = os.path.realpath(root)
+        if real.startswith(real_root + os.sep):
+            return root
+    return None
+
+
+def _same_dir(a: str, b: str) -> bool:
+    """Même répertoire une fois les liens résolus (racine configurée avec / final, via un lien…)."""
+    return os.path.realpath(a) == os.path.realpath(b)
+
+
+def adopt_legacy_cold() -> int:
+    """
+    Renomme les versions froides des anciennes versions (<nom>.zst) en cold_path(<nom>).
+    Un <nom>.zst lui-même au catalogue est laissé en place (ambigu). Retourne le nombre renommé.
+    """
+    db = SessionLocal()
+    try:
+        rows = db.query(ISO.filename).filter(ISO.storage_mode == "zstd").all()
+        catalogued = {name for (name,) in db.query(ISO.filename).filter(
+            ISO.filename.in_([row.filename + LEGACY_COLD_SUFFIX for row in rows])
+        )} if rows else set()
+    finally:
+        db.close()
+    adopted = 0
+    for row in rows:
+        for root in STORAGE_ROOTS:
+            path = os.path.join(root, row.filename)
+            legacy = path + LEGACY_COLD_SUFFIX
+            if os.path.exists(path) or os.path.exists(cold_path(path)) or not os.path.isfile(legacy):
+                continue
+            if row.filename + LEGACY_COLD_SUFFIX in catalogued:
+                logger.warning(f"Stockage froid : {legacy} est aussi une image du catalogue, laissé en place")
+            elif is_seekable_zstd(legacy):
+                os.replace(legacy, cold_path(path))
+                adopted += 1
+    if adopted:
+        logger.info(f"Stockage froid : {adopted} version(s) froide(s) renommée(s) au nouveau format")
+    return adopted
+
+
+def filename_taken(filename: str) -> bool:
+    return locate(filename) is not None
+
+
+def iter_storage_files() -> Iterator[Tuple[str, str, str]]:
+    """(racine, nom, chemin complet) de chaque fichier régulier de toutes les racines."""
+    for root in STORAGE_ROOTS:
+        try:
+            names = sorted(os.listdir(root))
+        except FileNotFoundError:
+            continue
+        for name in names:
+            full = os.path.join(root, name)
+            if os.path.isfile(full):
+                yield root, name, full
+
+
+def root_usage(root: str) -> Optional[dict]:
+    try:
+        usage = shutil.disk_usage(root)
+    except OSError:
+        return None
+    return {
+        "path": root,
+        "total": usage.total,
+        "used": usage.used,
+        "free": usage.free,
+        "pct": round(usage.used / usage.total * 100, 1) if usage.total else 0,
+    }
+
+
+def _over_quota(usage: Optional[dict], extra_bytes: int = 0) -> bool:
+    if MAX_DISK_USAGE_PCT <= 0 or not usage or not usage["total"]:
+        return False
+    return (usage["used"] + usage.get("reserved", 0) + extra_bytes) / usage["total"] * 100 >= MAX_DISK_USAGE_PCT
+
+
+# ── RÉSERVATIONS ──────────────────────────────────────────────────
+
+class InsufficientStorage(Exception):
+    """Aucune racine ne peut accueillir la taille demandée sans dépasser le quota."""
+
+
+class Reservation:
+    """Octets réservés sur une racine pour un transfert en cours."""
+
+    def __init__(self, root: str, size: int):
+        self.id = next(_reservation_ids)
+        self.root = root
+        self.size = max(0, size)
+        self.path: Optional[str] = None
+
+    def _allocated(self) -> int:
+        return _allocated(self.path)
+
+    def pending(self) -> int:
+        """Octets réservés mais pas encore alloués sur le disque (déjà comptés par disk_usage)."""
+        return max(0, self.size - self._allocated())
+
+    def attach(self, f) -> None:
+        """Lie la réservation au fichier de destination ouvert et le préalloue."""
+        with _ledger():
+            self.path = f.name
+        preallocate(f, self.size)
+
+    def resize(self, size: int) -> None:
+        """Taille réelle connue (fin du transfert) : la réservation ne compte plus que celle-ci."""
+        with _ledger():
+            self.size = max(0, size)
+
+    def grow(self, written: int) -> None:
+        """
+        À appeler à chaque écriture : au-delà de la taille réservée (taille inconnue ou
+        sous-estimée), la réservation grandit par paliers de RESERVATION_STEP, ou juste
+        à written près du quota. InsufficientStorage si la racine n'a plus la place.
+        """
+        if written <= self.size:
+            return
+        with _ledger():
+            usage = _usage_with_reservations(self.root)
+            allocated = self._allocated()
+            if usage:
+                usage["reserved"] -= max(0, self.size - allocated)  # remplacé par la nouvelle taille
+            for size in (written + RESERVATION_STEP, written):
+                if not _over_quota(usage, max(0, size - allocated)):
+                    self.size = size
+                    return
+        raise InsufficientStorage(
+            f"Espace disque insuffisant : {written} octets écrits sur {self.root} (quota : {MAX_DISK_USAGE_PCT}%)"
+        )
+
+    def release(self) -> None:
+        with _ledger():
+            _reservations.pop(self.id, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _allocated(path: Optional[str]) -> int:
+    if path:
+        try:
+            return os.stat(path).st_blocks * 512
+        except OSError:
+            pass
+    return 0
+
+
+def _root_key(root: str):
+    try:
+        return os.stat(root).st_dev
+    except OSError:
+        return root
+
+
+@contextmanager
+def _ledger():
+    """
+    Section critique du registre, entre threads et entre workers : relit les réservations
+    des autres workers (_foreign) puis publie celles de ce worker à la sortie. Réentrante.
+    """
+    global _ledger_depth, _foreign
+    with _reservations_lock:
+        if _ledger_depth:
+            _ledger_depth += 1
+            try:
+                yield
+            finally:
+                _ledger_depth -= 1
+            return
+        with _shared.transaction() as tx:
+            _foreign = [r for records in tx.others.values() for r in records] if tx else []
+            _ledger_depth = 1
+            try:
+                yield
+            finally:
+                _ledger_depth = 0
+                if tx:
+                    tx.publish([{"dev": _root_key(r.root), "size": r.size, "path": r.path}
+                                for r in _reservations.values()])
+
+
+def reserved_bytes(root: str) -> int:
+    """Octets en attente d'écriture sur le système de fichiers de root, tous workers confondus."""
+    key = _root_key(root)
+    with _reservations_lock:
+        active = list(_reservations.values())
+        if _ledger_depth:
+            foreign = list(_foreign)
+        else:
+            others = _shared.exchange()
+            foreign = [r for records in (others or {}).values() for r in records]
+    own = sum(r.pending() for r in active if _root_key(r.root) == key)
+    return own + sum(max(0, r["size"] - _allocated(r["path"])) for r in foreign if r["dev"] == key)
+
+
+def _usage_with_reservations(root: str) -> Optional[dict]:
+    usage = root_usage(root)
+    if usage:
+        usage["reserved"] = reserved_bytes(root)
+    return usage
+
+
+def reserve(size: int, root: Optional[str] = None, category: Optional[str] = None) -> Reservation:
+    """
+    Réserve size octets sur root si elle a la place, sinon sur la racine choisie par
+    STORAGE_PLACEMENT. Lève InsufficientStorage si aucune racine ne convient.
+    """
+    with _ledger():
+        # Sous le verrou : deux transferts simultanés (même dans deux workers) ne peuvent pas
+        # réserver le même espace
+        if root is None or _over_quota(_usage_with_reservations(root), size):
+            root = _choose_root(category, size)
+            if root is None:
+                raise InsufficientStorage(
+                    f"Espace disque insuffisant pour {size} octets (quota : {MAX_DISK_USAGE_PCT}%)"
+                )
+        reservation = Reservation(root, size)
+        _reservations[reservation.id] = reservation
+    return reservation
+
+
+def preallocate(f, size: int) -> None:
+    """Préalloue size octets (extents contigus) ; sans effet si le système de fichiers ne le gère pas."""
+    if size <= 0 or not hasattr(os, "posix_fallocate"):
+        return
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except OSError:
+        pass
+
+
+def choose_root(category: Optional[str] = None, size_bytes: int = 0) -> Optional[str]:
+    """Racine pour une nouvelle image selon STORAGE_PLACEMENT ; None si toutes sont pleines."""
+    with _ledger():
+        return _choose_root(category, size_bytes)
+
+
+def _choose_root(category: Optional[str], size_bytes: int) -> Optional[str]:
+    usages = {root: _usage_with_reservations(root) for root in STORAGE_ROOTS}
+    candidates = [root for root in STORAGE_ROOTS if not _over_quota(usages[root], size_bytes)]
+    if not candidates:
+        return None
+
+    if STORAGE_PLACEMENT == "category" and category:
+        pinned = STORAGE_CATEGORY_ROOTS.get(category)
+        if pinned in candidates:
+            return pinned
+    if STORAGE_PLACEMENT == "round_robin":
+        return candidates[next(_round_robin) % len(candidates)]
+    return max(
+        candidates,
+        key=lambda root: usages[root]["free"] - usages[root]["reserved"] if usages[root] else 0,
+    )
+
+
+# ── REBALANCE ─────────────────────────────────────────────────────
+
+def _move_file(src: str, dst: str, expected_sha256: Optional[str], reservation: Reservation) -> None:
+    """Copie src vers dst (contrôle SHA256), bascule atomique, puis supprime src."""
+    tmp = os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}.rebalance-tmp")
+    h = hashlib.sha256()
+    written = 0
+    try:
+        with ScanReader(src) as fsrc, open(tmp, "wb") as fdst:
+            reservation.attach(fdst)
+            behind = WriteBehind(fdst)
+            for chunk in fsrc.chunks(COPY_CHUNK):
+                h.update(chunk)
+                fdst.write(chunk)
+                written += len(chunk)
+                if behind.due(written):
+                    behind.drop()
+            fdst.flush()
+            os.fsync(fdst.fileno())
+        if expected_sha256 and h.hexdigest() != expected_sha256.lower():
+            raise ValueError(f"SHA256 mismatch while moving {src}")
+        shutil.copystat(src, tmp)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    # Les deux copies existent brièvement : l'image reste servie pendant la bascule,
+    # et les flux déjà ouverts sur src continuent après sa suppression.
+    os.replace(tmp, dst)
+    os.remove(src)
+
+
+async def move_iso(iso_id: int, target_root: str) -> bool:
+    """Déplace une image (brute ou froide) vers target_root."""
+    db = SessionLocal()
+    try:
+        iso = db.query(ISO).filter(ISO.id == iso_id).first()
+        if not iso or iso.status != "available":
+            return False
+        src = locate(iso.filename)
+        if not src or _same_dir(os.path.dirname(src), target_root):
+            return False
+        cold = iso.storage_mode == "zstd"
+        physical = cold_path(src) if cold else src
+        if not os.path.exists(physical) or os.stat(physical).st_nlink > 1:
+            return False  # blob partagé (dédup) : on ne casse pas le partage
+        previous_mode = iso.storage_mode or "raw"
+        claimed = db.query(ISO).filter(
+            ISO.id == iso_id,
+            or_(ISO.storage_mode == previous_mode, ISO.storage_mode.is_(None)) if previous_mode == "raw"
+            else ISO.storage_mode == previous_mode,
+        ).update({"storage_mode": "moving"}, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            return False
+        sha256 = None if cold else iso.sha256
+        dst = os.path.join(target_root, os.path.basename(physical))
+        try:
+            with reserve(os.path.getsize(physical), target_root) as reservation:
+                if not _same_dir(reservation.root, target_root):
+                    raise InsufficientStorage(f"{target_root} cannot hold {iso.filename}")
+                await asyncio.to_thread(_move_file, physical, dst, sha256, reservation)
+        finally:
+            values = {"storage_mode": previous_mode}
+            if not os.path.exists(physical):
+                values.update({
+                    "file_path": os.path.join(target_root, iso.filename),
+                    "updated_at": datetime.utcnow(),
+                })
+            db.query(ISO).filter(ISO.id == iso_id).update(values, synchronize_session=False)
+            db.commit()
+        logger.info(f"Rééquilibrage : {iso.filename} → {target_root}")
+        return True
+    finally:
+        db.close()
+
+
+def _plan_move() -> Optional[Tuple[int, str]]:
+    """(iso_id, racine cible) du prochain déplacement, ou None si l'écart est sous le seuil."""
+    usages = [u for u in (_usage_with_reservations(root) for root in STORAGE_ROOTS) if u]
+    devices = {}
+    for u in usages:
+        devices.setdefault(os.stat(u["path"]).st_dev, u)
+    usages = list(devices.values())
+    if len(usages) < 2:
+        return None
+    fullest = max(usages, key=lambda u: u["pct"])
+    emptiest = min(usages, key=lambda u: u["pct"])
+    if fullest["pct"] - emptiest["pct"] < STORAGE_REBALANCE_THRESHOLD_PCT:
+        return None
+
+    # Assez gros pour réduire l'écart, sans faire passer la cible au-dessus de la source
+    gap_bytes = (fullest["pct"] - emptiest["pct"]) / 100 * min(fullest["total"], emptiest["total"]) / 2
+    db = SessionLocal()
+    try:
+        isos = db.query(ISO.id, ISO.filename, ISO.size_bytes).filter(
+            ISO.status == "available"
+        ).order_by(ISO.size_bytes.desc()).all()
+    finally:
+        db.close()
+    for iso in isos:
+        path = locate(iso.filename)
+        if not path or not _same_dir(os.path.dirname(path), fullest["path"]):
+            continue
+        if (iso.size_bytes or 0) <= gap_bytes and not _over_quota(emptiest, iso.size_bytes or 0):
+            return iso.id, emptiest["path"]
+    return None
+
+
+async def rebalance_once(max_moves: int = 10) -> int:
+    moves = 0
+    while moves < max_moves:
+        plan = await asyncio.to_thread(_plan_move)
+        if not plan or not await move_iso(*plan):
+            break
+        moves += 1
+    return moves
+
+
+async def rebalance_loop():
+    if STORAGE_REBALANCE_INTERVAL_MINUTES <= 0 or len(STORAGE_ROOTS) < 2:
+        return
+    logger.info(f"Rééquilibrage planifié (intervalle : {STORAGE_REBALANCE_INTERVAL_MINUTES} min)")
+    while True:
+        await asyncio.sleep(STORAGE_REBALANCE_INTERVAL_MINUTES * 60)
+        try:
+            moved = await rebalance_once()
+            if moved:
+                logger.info(f"Rééquilibrage terminé — {moved} image(s) déplacée(s)")
+        except Exception as e:
+            logger.error(f"Erreur rééquilibrage : {e}")
@@ -0,0 +1,62 @@
+"""
+Filtre et comptage par tag sur l'index iso_tags (models.ISOTag), tenu à jour par
+triggers depuis isos.tags. Comparaison exacte, sans tenir compte de la casse (ASCII,
+collation NOCASE de la colonne) : « lts » ne correspond plus à « ltsc ».
+"""
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, aliased
+
+from app.models import ISOTag
+
+TAG_MODES = ("all", "any")
+
+
+def parse_tags(value: Optional[str], mode: str = "all") -> List[str]:
+    """tags=a,b,c -> ['a', 'b', 'c'] (vides et doublons retirés) ; 400 pour un tag_mode inconnu."""
+    if mode not in TAG_MODES:
+        raise HTTPException(status_code=400, detail=f"tag_mode must be one of {', '.join(TAG_MODES)}")
+    tags = {}
+    for tag in (value or "").split(","):
+        tag = tag.strip()
+        if tag:
+            tags.setdefault(tag.lower(), tag)
+    return list(tags.values())
+
+
+def tagged_ids(db: Session, tags: List[str], mode: str = "all"):
+    """
+    Sous-requête des ids portant tous les tags (all) ou au moins l'un d'eux (any).
+    all : parcours des entrées du tag le plus rare, les autres vérifiés un par un sur la
+    clé primaire (tag, iso_id).
+    """
+    if mode == "any" or len(tags) == 1:
+        query = select(ISOTag.iso_id).where(ISOTag.tag.in_(tags))
+        return query.distinct() if len(tags) > 1 else query
+    tags = _rarest_first(db, tags)
+    first = aliased(ISOTag)
+    query = select(first.iso_id).where(first.tag == tags[0])
+    for tag in tags[1:]:
+        other = aliased(ISOTag)
+        query = query.where(select(other.iso_id).where(other.tag == tag, other.iso_id == first.iso_id).exists())
+    return query
+
+
+def _rarest_first(db: Session, tags: List[str]) -> List[str]:
+    """Compte par tag sur l'index seul, sans lire isos."""
+    counts = {tag.lower(): n for tag, n in db.query(ISOTag.tag, func.count()).filter(ISOTag.tag.in_(tags))
+              .group_by(ISOTag.tag)}
+    return sorted(tags, key=lambda t: counts.get(t.lower(), 0))
+
+
+def tag_counts(db: Session, prefix: Optional[str] = None, limit: int = 100) -> List[dict]:
+    """Nuage de tags : images par tag, les plus fréquents d'abord ; prefix pour l'autocomplétion."""
+    count = func.count().label("count")
+    query = db.query(ISOTag.tag, count)
+    if prefix:
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.filter(ISOTag.tag.like(f"{escaped}%", escape="\\"))
+    rows = query.group_by(ISOTag.tag).order_by(count.desc(), ISOTag.tag).limit(limit).all()
+    return [{"tag": tag, "count": n} for tag, n in rows]
@@ -3,20 +3,33 @@ Check whether a tracked ISO has an update available upstream.
 
 Security considerations implemented:
 - SSRF guard: blocks private/loopback IP ranges and non-HTTP(S) schemes
+  (async, cached resolution in dns_service)
 - Response size cap: checksum files are read up to MAX_CHECKSUM_BYTES only
 - Strict timeouts: 10 s connect, 30 s read
 - Max 5 redirects
+
+Bulk checks share one pooled client, run with bounded concurrency and fetch
+each mirror directory's checksum file once. Parsed checksum files are cached
+in the checksum_files table and revalidated with conditional GETs
+(If-None-Match / If-Modified-Since).
 """
 
-import ipaddress
-import os
+import asyncio
+import json
+import logging
 import re
-import socket
 from datetime import datetime
-from typing import Optional
-from urllib.parse import urlparse
+from typing import Dict, Iterable, List, Optional
 
 import httpx
+from sqlalchemy import func
+
+from app.config import UPDATE_CHECK_CONCURRENCY, UPDATE_CHECK_INTERVAL_HOURS
+from app.database import SessionLocal
+from app.models import ISO, ChecksumFile
+from app.services.dns_service import validate_url
+
+logger = logging.getLogger("update_check")
 
 MAX_CHECKSUM_BYTES = 1 * 1024 * 1024  # 1 MB cap on checksum file download
 
@@ -29,43 +42,13 @@ CHECKSUM_FILENAMES = [
     "checksums.txt",
 ]
 
-_PRIVATE_NETWORKS = [
-    ipaddress.ip_network("10.0.0.0/8"),
-    ipaddress.ip_network("172.16.0.0/12"),
-    ipaddress.ip_network("192.168.0.0/16"),
-    ipaddress.ip_network("127.0.0.0/8"),
-    ipaddress.ip_network("169.254.0.0/16"),   # link-local / AWS metadata
-    ipaddress.ip_network("::1/128"),
-    ipaddress.ip_network("fc00::/7"),
-]
-
-
-def _validate_url(url: str) -> None:
-    """Raise ValueError if the URL is unsafe (non-HTTP/S or SSRF risk)."""
-    parsed = urlparse(url)
-    if parsed.scheme not in ("http", "https"):
-        raise ValueError(f"Unsupported scheme: {parsed.scheme!r}")
 
-    hostname = parsed.hostname
-    if not hostname:
-        raise ValueError("URL has no hostname")
-
-    # Resolve to IP and check for private ranges
-    try:
-        addr = ipaddress.ip_address(socket.gethostbyname(hostname))
-    except (socket.gaierror, ValueError):
-        raise ValueError(f"Cannot resolve hostname: {hostname!r}")
-
-    for network in _PRIVATE_NETWORKS:
-        if addr in network:
-            raise ValueError(f"Blocked: {addr} is in a private/reserved range (SSRF guard)")
-
-
-def _make_client() -> httpx.AsyncClient:
+def _make_client(max_connections: int = 10) -> httpx.AsyncClient:
     return httpx.AsyncClient(
         follow_redirects=True,
         max_redirects=5,
         timeout=httpx.Timeout(connect=10.0, read=30.0, write=10.0, pool=5.0),
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
     )
 
 
@@ -74,38 +57,26 @@ def _base_url(url: str) -> str:
     return url.rsplit("/", 1)[0] + "/"
 
 
-async def _fetch_checksum_file(client: httpx.AsyncClient, base: str, iso_filename: str) -> Optional[str]:
-    """
-    Try to find a SHA256 for iso_filename in common checksum files next to it.
-    Returns the hex digest string or None.
-    """
-    for name in CHECKSUM_FILENAMES:
-        candidate = base + name
-        try:
-            _validate_url(candidate)
-            response = await client.get(candidate)
-            if response.status_code != 200:
-                continue
-
-            # Read up to MAX_CHECKSUM_BYTES to avoid RAM exhaustion
-            content = b""
-            async for chunk in response.aiter_bytes(4096):
-                content += chunk
-                if len(content) > MAX_CHECKSUM_BYTES:
-                    break  # file too large — skip
+def _parse_checksum_file(text: str) -> Dict[str, str]:
+    """Parse "<hash>  <filename>" / "<hash> *<filename>" lines into {filename: sha256}."""
+    digests = {}
+    for line in text.splitlines():
+        parts = line.strip().split()
+        if len(parts) >= 2:
+            digest, fname = parts[0], parts[-1].lstrip("*")
+            if re.fullmatch(r"[0-9a-fA-F]{64}", digest):
+                digests[fname] = digest.lower()
+    return digests
 
-            text = content.decode("utf-8", errors="ignore")
-            # Lines look like: "<hash>  <filename>" or "<hash> *<filename>"
-            for line in text.splitlines():
-                parts = line.strip().split()
-                if len(parts) >= 2:
-                    digest, fname = parts[0], parts[-1].lstrip("*")
-                    if fname == iso_filename and re.fullmatch(r"[0-9a-fA-F]{64}", digest):
-                        return digest.lower()
-        except Exception:
-            continue
 
-    return None
+async def _read_capped(response: httpx.Response) -> Optional[bytes]:
+    """Read up to MAX_CHECKSUM_BYTES to avoid RAM exhaustion; None if larger."""
+    content = bytearray()
+    async for chunk in response.aiter_bytes(65536):
+        content += chunk
+        if len(content) > MAX_CHECKSUM_BYTES:
+            return None
+    return bytes(content)
 
 
 async def _fetch_etag_info(client: httpx.AsyncClient, url: str) -> dict:
@@ -124,40 +95,105 @@ async def _fetch_etag_info(client: httpx.AsyncClient, url: str) -> dict:
         return {}
 
 
-async def check_for_update(
-    source_url: str,
-    local_sha256: Optional[str],
-    local_size_bytes: Optional[int],
-) -> dict:
+class UpdateChecker:
     """
-    Compare local ISO state against what is available at source_url.
-
-    Returns a dict with:
-      - update_available (bool | None): True = update detected, False = up to date,
-                                        None = could not determine
-      - upstream_sha256 (str | None): SHA256 found upstream if any
-      - method (str): how the check was performed
-      - error (str | None): error message if check failed
+    Shared state for one or many update checks: a pooled HTTP client, a
+    concurrency bound, and per-directory checksum files (fetched at most once
+    per checker, revalidated against the cached copy with conditional GETs).
     """
-    result = {
-        "update_available": None,
-        "upstream_sha256": None,
-        "method": "none",
-        "error": None,
-    }
 
-    try:
-        _validate_url(source_url)
-    except ValueError as e:
-        result["error"] = str(e)
-        return result
+    def __init__(self, client: httpx.AsyncClient, cached: Optional[Dict[str, ChecksumFile]] = None,
+                 concurrency: int = UPDATE_CHECK_CONCURRENCY):
+        self.client = client
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._cached = {
+            url: {
+                "etag": row.etag,
+                "last_modified": row.last_modified,
+                "digests": json.loads(row.digests or "{}"),
+            }
+            for url, row in (cached or {}).items()
+        }
+        self._directories: Dict[str, asyncio.Task] = {}
+        self.fetched: Dict[str, dict] = {}  # checksum files (re)downloaded — to persist
+        self.stats = {"directories": 0, "downloaded": 0, "not_modified": 0}
+
+    async def _fetch_candidate(self, url: str) -> Optional[Dict[str, str]]:
+        await validate_url(url)
+        cached = self._cached.get(url)
+        headers = {}
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        async with self.client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and cached:
+                self.stats["not_modified"] += 1
+                return cached["digests"]
+            if response.status_code != 200:
+                return None
+            content = await _read_capped(response)
+            if content is None:
+                return None  # file too large — skip
+            digests = _parse_checksum_file(content.decode("utf-8", errors="ignore"))
+            self.stats["downloaded"] += 1
+            self.fetched[url] = {
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+                "digests": digests,
+            }
+            return digests
+
+    async def _load_directory(self, base: str) -> Dict[str, str]:
+        self.stats["directories"] += 1
+        for name in CHECKSUM_FILENAMES:
+            try:
+                async with self._semaphore:
+                    digests = await self._fetch_candidate(base + name)
+            except Exception:
+                continue
+            if digests:
+                return digests
+        return {}
 
-    iso_filename = source_url.rsplit("/", 1)[-1].split("?")[0]
-    base = _base_url(source_url)
+    async def directory_digests(self, base: str) -> Dict[str, str]:
+        """Checksums published in a mirror directory; concurrent callers share one fetch."""
+        task = self._directories.get(base)
+        if task is None:
+            task = asyncio.ensure_future(self._load_directory(base))
+            self._directories[base] = task
+        return await task
+
+    async def check(self, source_url: str, local_sha256: Optional[str], local_size_bytes: Optional[int]) -> dict:
+        """
+        Compare local ISO state against what is available at source_url.
+
+        Returns a dict with:
+          - update_available (bool | None): True = update detected, False = up to date,
+                                            None = could not determine
+          - upstream_sha256 (str | None): SHA256 found upstream if any
+          - method (str): how the check was performed
+          - error (str | None): error message if check failed
+        """
+        result = {
+            "update_available": None,
+            "upstream_sha256": None,
+            "method": "none",
+            "error": None,
+        }
+
+        try:
+            await validate_url(source_url)
+        except ValueError as e:
+            result["error"] = str(e)
+            return result
+
+        iso_filename = source_url.rsplit("/", 1)[-1].split("?")[0]
 
-    async with _make_client() as client:
         # 1. Try to find a checksum file next to the ISO
-        upstream_sha256 = await _fetch_checksum_file(client, base, iso_filename)
+        upstream_sha256 = (await self.directory_digests(_base_url(source_url))).get(iso_filename)
 
         if upstream_sha256:
             result["upstream_sha256"] = upstream_sha256
@@ -169,7 +205,8 @@ async def check_for_update(
             return result
 
         # 2. Fallback: compare ETag / Content-Length via HEAD
-        meta = await _fetch_etag_info(client, source_url)
+        async with self._semaphore:
+            meta = await _fetch_etag_info(self.client, source_url)
         result["method"] = "http_meta"
 
         if not meta:
@@ -190,5 +227,108 @@ async def check_for_update(
         # report undetermined rather than a false positive
         result["update_available"] = None
         result["error"] = "No checksum file found; HTTP metadata insufficient for definitive comparison"
+        return result
+
+
+def _load_cached_checksum_files(db) -> Dict[str, ChecksumFile]:
+    return {row.url: row for row in db.query(ChecksumFile).all()}
+
+
+def _store_checksum_files(db, fetched: Dict[str, dict]) -> None:
+    now = datetime.utcnow()
+    for url, entry in fetched.items():
+        db.merge(ChecksumFile(
+            url=url,
+            etag=entry["etag"],
+            last_modified=entry["last_modified"],
+            digests=json.dumps(entry["digests"]),
+            fetched_at=now,
+        ))
+
+
+async def check_for_update(
+    source_url: str,
+    local_sha256: Optional[str],
+    local_size_bytes: Optional[int],
+) -> dict:
+    """Single-ISO check; see UpdateChecker.check for the result format."""
+    async with _make_client() as client:
+        return await UpdateChecker(client).check(source_url, local_sha256, local_size_bytes)
 
-    return result
+
+async def check_updates_bulk(iso_ids: Optional[Iterable[int]] = None) -> dict:
+    """
+    Check every ISO with a source_url (or only iso_ids) against upstream.
+    Results and refreshed checksum files are persisted in a single transaction.
+    """
+    db = SessionLocal()
+    try:
+        # Image décompressée à l'ingestion : l'amont publie le fichier compressé
+        query = db.query(
+            ISO.id, ISO.source_url,
+            func.coalesce(ISO.source_sha256, ISO.sha256).label("sha256"),
+            func.coalesce(ISO.source_size_bytes, ISO.size_bytes).label("size_bytes"),
+        ).filter(
+            ISO.source_url.isnot(None), ISO.status == "available"
+        )
+        if iso_ids is not None:
+            query = query.filter(ISO.id.in_(list(iso_ids)))
+        targets = query.all()
+        cached = _load_cached_checksum_files(db)
+    finally:
+        db.close()
+
+    async with _make_client(max_connections=UPDATE_CHECK_CONCURRENCY) as client:
+        checker = UpdateChecker(client, cached=cached)
+        results: List[dict] = await asyncio.gather(*[
+            checker.check(t.source_url, t.sha256, t.size_bytes) for t in targets
+        ])
+
+    now = datetime.utcnow()
+    mappings = [
+        {
+            "id": t.id,
+            "upstream_sha256": r["upstream_sha256"],
+            "update_available": r["update_available"],
+            "last_update_check": now,
+            "updated_at": now,
+        }
+        for t, r in zip(targets, results)
+    ]
+
+    db = SessionLocal()
+    try:
+        db.bulk_update_mappings(ISO, mappings)
+        _store_checksum_files(db, checker.fetched)
+        db.commit()
+    finally:
+        db.close()
+
+    return {
+        "checked": len(targets),
+        "updates_available": sum(1 for r in results if r["update_available"] is True),
+        "up_to_date": sum(1 for r in results if r["update_available"] is False),
+        "undetermined": sum(1 for r in results if r["update_available"] is None),
+        "results": [
+            {"id": t.id, **r} for t, r in zip(targets, results)
+        ],
+        **checker.stats,
+    }
+
+
+async def update_check_loop():
+    """Bulk update check every UPDATE_CHECK_INTERVAL_HOURS (disabled when 0)."""
+    if UPDATE_CHECK_INTERVAL_HOURS <= 0:
+        return
+    logger.info(f"Update check planifié (intervalle : {UPDATE_CHECK_INTERVAL_HOURS}h)")
+    while True:
+        await asyncio.sleep(UPDATE_CHECK_INTERVAL_HOURS * 3600)
+        try:
+            summary = await check_updates_bulk()
+            logger.info(
+                f"Update check terminé — {summary['checked']} ISO(s), "
+                f"{summary['updates_available']} mise(s) à jour, "
+                f"{summary['downloaded']} fichier(s) de checksums téléchargé(s)"
+            )
+        except Exception as e:
+            logger.error(f"Erreur update check : {e}")
@@ -0,0 +1,114 @@
+"""
+État partagé entre les workers uvicorn (--workers N) : chaque processus publie son
+enregistrement dans un fichier JSON {pid: enregistrement} verrouillé par fcntl, à côté du
+verrou du leader. Les enregistrements des processus morts sont ignorés puis purgés à la
+publication suivante.
+
+Sans fcntl (Windows), ou si le fichier est inaccessible, transaction() fournit None :
+l'appelant se limite alors à son propre processus (un avertissement une seule fois).
+"""
+import json
+import logging
+import os
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+logger = logging.getLogger("worker_state")
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Transaction:
+    """others : enregistrements des autres workers vivants ; publish() remplace le nôtre."""
+
+    def __init__(self, others: Dict[str, Any]):
+        self.others = others
+        self.record: Any = None
+        self.published = False
+
+    def publish(self, record: Any) -> None:
+        """record vide (0, {}, []) : l'enregistrement de ce worker est retiré."""
+        self.record = record
+        self.published = True
+
+
+class WorkerState:
+    def __init__(self, path: str, label: str):
+        self.path = path
+        self.label = label
+        self._warned = False
+
+    @contextmanager
+    def transaction(self, exclusive: bool = True) -> Iterator[Optional[Transaction]]:
+        """Sous verrou fcntl (exclusif pour publier) ; None si l'état partagé est indisponible."""
+        fd = self._open()
+        if fd is None:
+            yield None
+            return
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                raw = os.pread(fd, os.fstat(fd).st_size, 0)
+            except OSError as e:
+                self._warn(e)
+                yield None
+                return
+            try:
+                records = json.loads(raw) if raw else {}
+            except ValueError:
+                records = {}
+            me = str(os.getpid())
+            tx = Transaction({pid: r for pid, r in records.items() if pid != me and _alive(int(pid))})
+            try:
+                yield tx
+            finally:
+                if tx.published and exclusive:
+                    self._write(fd, tx)
+        finally:
+            os.close(fd)
+
+    def _write(self, fd: int, tx: Transaction) -> None:
+        records = dict(tx.others)
+        if tx.record:
+            records[str(os.getpid())] = tx.record
+        try:
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, json.dumps(records).encode(), 0)
+        except OSError as e:
+            self._warn(e)
+
+    def exchange(self, record: Any = None) -> Optional[Dict[str, Any]]:
+        """Publie record (si donné) et retourne les enregistrements des autres workers."""
+        with self.transaction(exclusive=record is not None) as tx:
+            if tx is None:
+                return None
+            if record is not None:
+                tx.publish(record)
+            return tx.others
+
+    def _open(self) -> Optional[int]:
+        if fcntl is None:
+            return None
+        try:
+            return os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as e:
+            self._warn(e)
+            return None
+
+    def _warn(self, e: OSError) -> None:
+        if not self._warned:
+            self._warned = True
+            logger.warning(f"État partagé {self.label} indisponible ({e}) : compté par worker")
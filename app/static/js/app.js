@@ -213,7 +213,7 @@ async function loadStats() {
 
 // ── SORT & GROUP ──────────────────────────────────────────────────
 
-const STATUS_ORDER = { downloading:0, uploading:1, verifying:2, available:3, missing:4, error:5 };
+const STATUS_ORDER = { downloading:0, uploading:1, verifying:2, available:3, missing:4, corrupt:5, error:6 };
 
 function sortISOs(items) {
   const arr = [...items];
@@ -386,6 +386,15 @@ function renderCard(iso) {
           <button class="card-btn-sec danger" onclick="confirmDelete(${iso.id},'${esc(iso.name)}')">${svg('trash',12)} Supprimer</button>
         </div>
       </div>`;
+  } else if (iso.status === 'corrupt') {
+    footer = `
+      <div class="card-footer">
+        <div class="card-missing-msg" title="${esc(iso.error_message||'')}">${svg('alert',13)} SHA256 différent de la référence</div>
+        <div class="card-btn-row">
+          <button class="card-btn-sec" onclick="event.stopPropagation();verifyISO(${iso.id})">${svg('shield',12)} Re-vérifier</button>
+          <button class="card-btn-sec danger" onclick="event.stopPropagation();confirmDelete(${iso.id},'${esc(iso.name)}')">${svg('trash',12)} Supprimer</button>
+        </div>
+      </div>`;
   } else if (iso.status === 'error') {
     footer = `
       <div class="card-footer">
@@ -485,7 +494,7 @@ function renderRow(iso) {
 }
 
 function renderBadge(s) {
-  const L = { available:'Disponible', downloading:'Téléchargement', uploading:'Upload', verifying:'Vérification', error:'Erreur', missing:'Fichier manquant' };
+  const L = { available:'Disponible', downloading:'Téléchargement', uploading:'Upload', verifying:'Vérification', error:'Erreur', missing:'Fichier manquant', corrupt:'Corrompu' };
   return `<span class="badge badge-${s}"><span class="badge-dot"></span>${L[s]||s}</span>`;
 }
 
@@ -701,34 +710,33 @@ async function importSelected() {
   const btn = document.getElementById('btnImport');
   btnLoading(btn, true);
 
-  let ok = 0, fail = 0;
-  for (const el of selectedEls) {
-    const idx = parseInt(el.id.replace('si-',''));
-    const file = scanFiles[idx];
-    if (!file) continue;
-    try {
-      const osInfo = detectOSInfo(file.filename);
-      const res = await fetch('/api/isos/import', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          filename:    file.filename,
-          category:    osInfo.category,
-          os_family:   osInfo.os_family,
-          edition:     detectEdition(file.filename),
-          file_format: detectFormat(file.filename),
-        }),
-      });
-      if (!res.ok) throw new Error();
-      ok++;
-    } catch { fail++; }
-  }
+  const files = selectedEls.map(el => scanFiles[parseInt(el.id.replace('si-',''))]).filter(Boolean).map(file => {
+    const osInfo = detectOSInfo(file.filename);
+    return {
+      filename:    file.filename,
+      category:    osInfo.category,
+      os_family:   osInfo.os_family,
+      edition:     detectEdition(file.filename),
+      file_format: detectFormat(file.filename),
+    };
+  });
 
-  btnLoading(btn, false);
-  closeAllModals();
-  loadISOs(); loadStats(); startPolling();
-  if (ok)   showToast(`${ok} fichier(s) importé(s) — calcul SHA256 en cours…`, 'success');
-  if (fail) showToast(`${fail} importation(s) échouée(s)`, 'error');
+  try {
+    const res = await fetch('/api/bulk/import', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ files }),
+    });
+    if (!res.ok) throw new Error((await res.json()).detail);
+    const job = await res.json();
+    closeAllModals();
+    showToast(`${files.length} fichier(s) en cours d'import — calcul SHA256 en cours…`, 'success');
+    setTimeout(() => { loadISOs(); loadStats(); startPolling(); }, 500);
+    const done = await waitJob(job.id);
+    loadISOs(); loadStats();
+    if (done.failed) showToast(`${done.failed} importation(s) échouée(s)`, 'error');
+  } catch (err) { showToast(`Erreur : ${err.message}`, 'error'); }
+  finally { btnLoading(btn, false); }
 }
 
 // ── ADD FROM URL ──────────────────────────────────────────────────
@@ -756,6 +764,7 @@ async function submitFromURL(e) {
         checksum_type:     form.checksum_type.value,
         description:       form.description.value.trim() || null,
         tags:              form.tags.value.trim() || null,
+        decompress:        form.decompress.checked,
       }),
     });
     if (!res.ok) throw new Error((await res.json()).detail);
@@ -793,6 +802,7 @@ async function submitUpload(e) {
     const v = form[f]?.value?.trim();
     if (v) fd.append(f, v);
   });
+  if (form.decompress.checked) fd.append('decompress', 'true');
 
   const wrap = document.getElementById('uploadProgressWrap');
   const bar  = document.getElementById('uploadProgressBar');
@@ -984,6 +994,24 @@ async function checkUpdate(id) {
   }
 }
 
+// ── DELTA UPDATE ──────────────────────────────────────────────────
+
+async function deltaUpdate(id) {
+  const iso = cachedISOs.find(i => i.id === id);
+  const url = prompt('URL de la nouvelle version :', iso?.source_url || '');
+  if (!url) return;
+  try {
+    const res = await fetch(`/api/isos/${id}/delta-update`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ url }),
+    });
+    if (!res.ok) throw new Error((await res.json()).detail);
+    showToast('Mise à jour lancée — seuls les blocs modifiés seront téléchargés', 'info');
+    await loadISOs();
+  } catch (err) { showToast(`Erreur : ${err.message}`, 'error'); }
+}
+
 // ── COPY URL ──────────────────────────────────────────────────────
 
 async function copyURL(id) {
@@ -1051,7 +1079,7 @@ function openDrawer(id) {
   document.getElementById('drawerTitle').textContent = iso.name;
 
   const statusLabel = { available:'Disponible', downloading:'Téléchargement', uploading:'Upload',
-    verifying:'Vérification', error:'Erreur', missing:'Fichier manquant' };
+    verifying:'Vérification', error:'Erreur', missing:'Fichier manquant', corrupt:'Corrompu' };
 
   const rows = [
     ['Fichier',     iso.filename || '—'],
@@ -1097,6 +1125,7 @@ function openDrawer(id) {
         <button class="btn btn-secondary" onclick="copyURL(${iso.id})">${svg('copy',13)} Copier URL</button>
         <button class="btn btn-secondary" onclick="closeDrawer();verifyISO(${iso.id})">${svg('shield',13)} Calculer Hash</button>
         ${iso.source_url ? `<button class="btn btn-secondary${iso.update_available===true?' btn-update-alert':''}" id="drawerCheckUpdateBtn-${iso.id}" onclick="checkUpdate(${iso.id})">${svg('refresh',13)} Vérifier MAJ</button>` : ''}
+        ${iso.source_url && iso.update_available===true ? `<button class="btn btn-secondary" onclick="closeDrawer();deltaUpdate(${iso.id})" title="Ne télécharge que les blocs modifiés (si l'amont publie un .zsync)">${svg('download',13)} Mettre à jour</button>` : ''}
         <button class="btn btn-secondary" onclick="closeDrawer();openEditModal(${iso.id})">${svg('edit',13)} Éditer</button>
       ` : ''}
       <button class="btn btn-ghost" onclick="closeDrawer();confirmDelete(${iso.id},'${esc(iso.name)}')" style="color:#c07070">${svg('trash',13)} Supprimer</button>
@@ -1232,16 +1261,14 @@ async function bulkVerify() {
   const available = cachedISOs.filter(i => ids.includes(i.id) && i.status === 'available');
   if (!available.length) { showToast('Aucun fichier disponible dans la sélection', 'error'); return; }
   showToast('Calcul hash en cours pour ' + available.length + ' fichier(s)…', 'info');
-  startPolling();
-  let ok = 0;
-  for (const iso of available) {
-    try {
-      await fetch('/api/isos/' + iso.id + '/verify', { method: 'POST' });
-      ok++;
-    } catch {}
-  }
-  await loadISOs();
-  showToast(ok + ' hash(es) calculé(s)', 'success');
+  try {
+    const job = await postJob('/api/bulk/verify', { ids: available.map(i => i.id) });
+    startPolling();
+    const done = await waitJob(job.id);
+    await loadISOs();
+    showToast(done.done + ' hash(es) calculé(s)', 'success');
+    if (done.failed) showToast(done.failed + ' vérification(s) échouée(s)', 'error');
+  } catch (err) { showToast(`Erreur : ${err.message}`, 'error'); }
 }
 
 async function bulkCopyURLs() {
@@ -1278,18 +1305,36 @@ async function bulkDelete() {
   if (!ids.length) return;
   const names = cachedISOs.filter(i => ids.includes(i.id)).map(i => i.name).join(', ');
   if (!confirm('Supprimer ' + ids.length + ' ISO(s) ?\n\n' + names)) return;
-  let ok = 0, fail = 0;
-  for (const id of ids) {
-    try {
-      const res = await fetch('/api/isos/' + id, { method: 'DELETE' });
-      if (res.ok) ok++; else fail++;
-    } catch { fail++; }
-  }
+  try {
+    const job = await postJob('/api/bulk/delete', { ids });
+    const done = await waitJob(job.id);
+    if (done.status === 'error') throw new Error(done.error_message);
+    if (done.done)   showToast(done.done + ' ISO(s) supprimée(s)', 'success');
+    if (done.failed) showToast(done.failed + ' suppression(s) échouée(s)', 'error');
+  } catch (err) { showToast(`Erreur : ${err.message}`, 'error'); }
   selectedIds.clear();
   exitSelectMode();
   loadISOs(); loadStats();
-  if (ok)   showToast(ok + ' ISO(s) supprimée(s)', 'success');
-  if (fail) showToast(fail + ' suppression(s) échouée(s)', 'error');
+}
+
+// ── JOBS ──────────────────────────────────────────────────────────
+
+async function postJob(url, body) {
+  const res = await fetch(url, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body),
+  });
+  if (!res.ok) throw new Error((await res.json()).detail);
+  return res.json();
+}
+
+async function waitJob(id, interval = 1000) {
+  for (;;) {
+    const job = await fetch(`/api/jobs/${id}`).then(r => r.json());
+    if (job.status === 'done' || job.status === 'error') return job;
+    await new Promise(r => setTimeout(r, interval));
+  }
 }
 
 // ── STATS DASHBOARD ────────────────────────────────────────────────
@@ -1300,7 +1345,7 @@ async function openStats() {
   try {
     const [stats, isos] = await Promise.all([
       fetch('/api/stats').then(r => r.json()),
-      fetch('/api/isos?per_page=500').then(r => r.json()),
+      fetch('/api/isos?per_page=500&fields=name,category,os_family,size_bytes,is_favorite').then(r => r.json()),
     ]);
     renderStatsModal(body, stats, isos.items || []);
   } catch {
@@ -1528,6 +1573,15 @@ async function _populateMaintSysInfo() {
     document.getElementById('maintStoragePath').textContent = d.iso_storage_path;
     document.getElementById('maintDbPath').textContent = d.db_path;
     document.getElementById('maintDbSize').textContent = fmtSize(d.db_size_bytes);
+    const m = d.db_maintenance;
+    if (m) {
+      const every = m.interval_hours > 0 ? `toutes les ${m.interval_hours} h` : 'désactivée';
+      const last = m.at ? ` · dernière : ${new Date(m.at + 'Z').toLocaleString()}` : '';
+      document.getElementById('maintOptimizeDesc').textContent =
+        `Automatique (${every}${last}) : PRAGMA optimize, vacuum incrémental, checkpoint WAL.` +
+        (m.auto_vacuum && m.auto_vacuum !== 'incremental'
+          ? ' Base à convertir : le lancement manuel fera un VACUUM complet unique (écritures bloquées).' : '');
+    }
     if (d.disk) {
       const fill = document.getElementById('maintDiskFill');
       const label = document.getElementById('maintDiskLabel');
@@ -1598,6 +1652,19 @@ async function maintReindex() {
   _setBtnLoading('cardReindex', false);
 }
 
+async function maintDedup() {
+  _setBtnLoading('cardDedup', true);
+  try {
+    const d = await fetch('/api/maintenance/dedup', { method: 'POST' }).then(r => r.json());
+    _maintLog(d.message, d.success);
+    if (d.success) {
+      _maintLog('  Économisé : ' + fmtSize(d.bytes_saved) + ' · ' + d.duplicate_groups.length + ' groupe(s) de doublons', null);
+      _populateMaintSysInfo();
+    }
+  } catch(e) { _maintLog('Erreur réseau: ' + e.message, false); }
+  _setBtnLoading('cardDedup', false);
+}
+
 async function maintCleanOrphans() {
   _setBtnLoading('cardOrphans', true);
   try {
@@ -0,0 +1,109 @@
+"""
+Banc d'essai du cache du catalogue (app/services/catalog_cache.py).
+
+Une base temporaire reçoit un catalogue synthétique (--images entrées), puis les routes
+de lecture sont appelées en boucle, en processus (ASGI, sans réseau), cache désactivé puis
+activé : requêtes/s par route. Une écriture (favori) est intercalée toutes les --write-every
+requêtes pour mesurer aussi le coût de l'invalidation.
+
+    python -m bench.catalog_cache --images 50000 --requests 300
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def populate(n: int) -> None:
+    from app.database import engine, init_db
+    from app.models import ISO
+
+    init_db()
+    rng = random.Random(1)
+    families = ["ubuntu", "debian", "fedora", "windows", "alpine", "rocky", "arch", "freebsd"]
+    now = datetime.utcnow()
+    rows = [
+        {
+            "name": f"{rng.choice(families)} {i}", "filename": f"image-{i}.iso",
+            "category": rng.choice(["linux", "windows", "other"]), "os_family": rng.choice(families),
+            "version": f"{rng.randint(1, 30)}.{rng.randint(0, 12)}", "architecture": rng.choice(["x86_64", "arm64"]),
+            "size_bytes": rng.randint(1, 8) * 2 ** 30, "sha256": f"{i:064x}", "description": "Image de test " * 4,
+            "tags": '["homelab", "lts"]', "add_method": "url", "status": "available", "download_progress": 100,
+            "file_path": f"/data/isos/image-{i}.iso", "http_url": f"http://localhost/files/image-{i}.iso",
+            "is_favorite": i % 50 == 0, "storage_mode": "raw",
+            "created_at": now - timedelta(minutes=i), "updated_at": now,
+        }
+        for i in range(n)
+    ]
+    with engine.begin() as conn:
+        conn.execute(ISO.__table__.insert(), rows)
+
+
+async def bench(client, path: str, requests: int, write_every: int) -> float:
+    await client.get(path)  # instantané / requête préparés hors mesure
+    t0 = time.perf_counter()
+    for i in range(requests):
+        if write_every and i and i % write_every == 0:
+            await client.post(f"/api/isos/{random.randint(1, 1000)}/favorite")
+        r = await client.get(path)
+        r.raise_for_status()
+    return requests / (time.perf_counter() - t0)
+
+
+async def run(args):
+    import httpx
+
+    from app.main import app
+    from app.services.catalog_cache import catalog_cache
+
+    routes = [
+        "/api/isos?page=1&per_page=20",
+        "/api/isos?page=50&per_page=50",
+        "/api/isos?q=debian&page=2",
+        "/api/isos/12345",
+        "/api/isos/12345/progress",
+        "/api/browse",
+    ]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        results = {}
+        for enabled in (False, True):
+            catalog_cache.enabled = enabled
+            for path in routes:
+                results[(path, enabled)] = await bench(client, path, args.requests, args.write_every)
+    print(f"{'route':<34} {'sans cache':>12} {'avec cache':>12} {'gain':>7}")
+    for path in routes:
+        off, on = results[(path, False)], results[(path, True)]
+        print(f"{path:<34} {off:>10.0f}/s {on:>10.0f}/s {on / off:>6.1f}x")
+    print(f"cache : {catalog_cache.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=50000)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--write-every", type=int, default=100, help="une écriture toutes les N requêtes (0 = aucune)")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="catalog-bench-")
+    os.environ.update({
+        "DB_PATH": os.path.join(directory, "bench.db"),
+        "ISO_STORAGE_PATH": os.path.join(directory, "isos"),
+        "AUTO_IMPORT_ENABLED": "false",
+        "UPDATE_CHECK_INTERVAL_HOURS": "0",
+        "DB_MAINTENANCE_INTERVAL_HOURS": "0",
+    })
+    if "app.config" in sys.modules:
+        sys.exit("bench.catalog_cache doit être lancé dans un processus neuf (configuration lue à l'import)")
+    t0 = time.perf_counter()
+    populate(args.images)
+    print(f"{args.images} images insérées en {time.perf_counter() - t0:.1f} s")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
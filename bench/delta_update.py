@@ -0,0 +1,117 @@
+"""
+Banc d'essai de la mise à jour différentielle (app/services/delta_update.py).
+
+Un serveur HTTP local (Range supporté) publie deux versions synthétiques d'une image :
+v2 = v1 avec quelques secteurs modifiés, un bloc inséré (tout ce qui suit est décalé d'un
+nombre d'octets non multiple d'un secteur) et une fin rallongée, plus le .zsync de v2. On
+reconstruit v2 depuis v1 et on mesure les octets téléchargés, les requêtes Range et le
+temps, contre un téléchargement complet.
+
+    python -m bench.delta_update --size-mb 256 --changed-pct 2
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from app.services.delta_update import assemble, fetch_control, make_zsync
+
+SECTOR = 2048
+
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    """SimpleHTTPRequestHandler + Range (une seule plage) ; compte les octets servis."""
+
+    served = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        range_header = self.headers.get("Range")
+        if not range_header or not os.path.isfile(path):
+            return super().do_GET()
+        size = os.path.getsize(path)
+        start, _, end = range_header.replace("bytes=", "").partition("-")
+        start, end = int(start), min(int(end or size - 1), size - 1)
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        RangeHandler.served += len(data)
+        self.wfile.write(data)
+
+
+def make_versions(directory: str, size_mb: int, changed_pct: float, seed: int = 1):
+    rng = random.Random(seed)
+    sectors = size_mb * 1024 * 1024 // SECTOR
+    v1 = bytearray()
+    for _ in range(size_mb):
+        v1 += rng.randbytes(1024 * 1024)
+    v2 = bytearray(v1)
+    for _ in range(int(sectors * changed_pct / 100)):
+        i = rng.randrange(sectors) * SECTOR
+        v2[i:i + SECTOR] = rng.randbytes(SECTOR)
+    insert_at = sectors // 3 * SECTOR
+    v2[insert_at:insert_at] = rng.randbytes(37 * SECTOR + 301)  # ajout non aligné : la suite est décalée
+    v2 += rng.randbytes(5 * SECTOR + 123)                  # fin rallongée, dernier bloc partiel
+    paths = {}
+    for name, data in (("v1.iso", v1), ("v2.iso", v2)):
+        paths[name] = os.path.join(directory, name)
+        with open(paths[name], "wb") as f:
+            f.write(data)
+    return paths
+
+
+async def run(size_mb: int, changed_pct: float):
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_versions(directory, size_mb, changed_pct)
+        t0 = time.perf_counter()
+        with open(paths["v2.iso"] + ".zsync", "wb") as f:
+            f.write(make_zsync(paths["v2.iso"], url="v2.iso"))
+        print(f"make_zsync : {time.perf_counter() - t0:.1f} s")
+
+        handler = lambda *a, **kw: RangeHandler(*a, directory=directory, **kw)  # noqa: E731
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}/"
+        try:
+            async with httpx.AsyncClient(timeout=60) as client:
+                control = await fetch_control(client, base + "v2.iso.zsync")
+                dest = os.path.join(directory, "rebuilt.iso")
+                t0 = time.perf_counter()
+                result = await assemble(control, paths["v1.iso"], base + "v2.iso", dest, client)
+                elapsed = time.perf_counter() - t0
+        finally:
+            server.shutdown()
+
+        with open(dest, "rb") as a, open(paths["v2.iso"], "rb") as b:
+            identical = hashlib.sha256(a.read()).digest() == hashlib.sha256(b.read()).digest()
+        print(f"v2 : {control.length / 2 ** 20:.1f} Mio, reconstruite à l'identique : {identical}")
+        print(f"réutilisé : {result['reused_bytes'] / 2 ** 20:.1f} Mio, "
+              f"téléchargé : {result['downloaded_bytes'] / 2 ** 20:.2f} Mio "
+              f"({result['range_requests']} requêtes Range, {RangeHandler.served / 2 ** 20:.2f} Mio servis)")
+        print(f"économisé : {result['saved_pct']} % en {elapsed:.1f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--changed-pct", type=float, default=2.0, help="secteurs modifiés (%%)")
+    args = parser.parse_args()
+    asyncio.run(run(args.size_mb, args.changed_pct))
+
+
+if __name__ == "__main__":
+    main()
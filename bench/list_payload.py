@@ -0,0 +1,87 @@
+"""
+Banc d'essai de la taille et de la latence de GET /api/isos (projection fields=,
+sérialisation orjson, compression gzip/br : app/services/json_response.py).
+
+Même catalogue synthétique que bench.catalog_cache ; chaque variante est appelée
+--requests fois en processus (ASGI, sans réseau), cache du catalogue désactivé puis activé :
+octets transmis par réponse et latence moyenne.
+
+    python -m bench.list_payload --images 20000 --per-page 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+GRID_FIELDS = "name,filename,category,os_family,version,architecture,size_bytes,status,download_progress,is_favorite"
+
+
+async def measure(client, path: str, encoding: str, requests: int):
+    headers = {"Accept-Encoding": encoding}
+    await client.get(path, headers=headers)
+    size = 0
+    t0 = time.perf_counter()
+    for _ in range(requests):
+        r = await client.get(path, headers=headers)
+        r.raise_for_status()
+        size = int(r.headers.get("content-length") or len(r.content))
+    return size, (time.perf_counter() - t0) / requests * 1000
+
+
+async def run(args):
+    import httpx
+
+    from app.main import app
+    from app.services import json_response
+    from app.services.catalog_cache import catalog_cache
+
+    base = f"/api/isos?page=3&per_page={args.per_page}"
+    variants = [
+        ("complet", base, "identity"),
+        ("complet gzip", base, "gzip"),
+        ("fields=grille", f"{base}&fields={GRID_FIELDS}", "identity"),
+        ("fields=grille gzip", f"{base}&fields={GRID_FIELDS}", "gzip"),
+    ]
+    if json_response.brotli is not None:
+        variants.append(("complet br", base, "br"))
+    print(f"encodeur : {'orjson' if json_response.orjson else 'json'}, "
+          f"brotli : {'oui' if json_response.brotli else 'non'}")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'variante':<22} {'octets':>10} {'sans cache':>12} {'avec cache':>12}")
+        for label, path, encoding in variants:
+            latencies = []
+            for enabled in (False, True):
+                catalog_cache.enabled = enabled
+                size, ms = await measure(client, path, encoding, args.requests)
+                latencies.append(ms)
+            print(f"{label:<22} {size:>10} {latencies[0]:>9.2f} ms {latencies[1]:>9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=20000)
+    parser.add_argument("--per-page", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=100)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="list-bench-")
+    os.environ.update({
+        "DB_PATH": os.path.join(directory, "bench.db"),
+        "ISO_STORAGE_PATH": os.path.join(directory, "isos"),
+        "AUTO_IMPORT_ENABLED": "false",
+        "UPDATE_CHECK_INTERVAL_HOURS": "0",
+        "DB_MAINTENANCE_INTERVAL_HOURS": "0",
+    })
+    if "app.config" in sys.modules:
+        sys.exit("bench.list_payload doit être lancé dans un processus neuf (configuration lue à l'import)")
+    from bench.catalog_cache import populate
+
+    populate(args.images)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
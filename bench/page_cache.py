@@ -0,0 +1,129 @@
+"""
+Banc d'essai de la politique d'I/O (app/services/io_policy.py).
+
+Scénario : une image « netboot » servie en continu est chaude dans le cache de pages,
+puis une grosse image est hachée (import). On mesure, avec et sans fadvise :
+- le taux de pages de l'image servie encore en cache (= taux de hit du prochain service)
+- l'empreinte laissée en cache par le hachage
+- le temps de re-service de l'image chaude
+
+L'éviction n'apparaît que si la grosse image dépasse la mémoire disponible pour le cache :
+choisir --big-mb en conséquence (ou lancer dans un cgroup mémoire limité).
+
+    python -m bench.page_cache --dir /data/isos/.bench --served-mb 256 --big-mb 8192
+
+Linux uniquement (mincore via ctypes).
+"""
+import argparse
+import ctypes
+import ctypes.util
+import mmap
+import os
+import time
+
+PAGE = mmap.PAGESIZE
+
+_libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+_libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_ubyte)]
+
+
+def resident_ratio(path: str) -> float:
+    """Fraction des pages du fichier présentes dans le cache de pages."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0.0
+    with open(path, "rb") as f:
+        # Mapping privé : rien n'est écrit, mais ctypes exige un tampon modifiable
+        mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_COPY)
+        try:
+            npages = (size + PAGE - 1) // PAGE
+            vec = (ctypes.c_ubyte * npages)()
+            buf = (ctypes.c_char * size).from_buffer(mm)
+            try:
+                if _libc.mincore(ctypes.c_void_p(ctypes.addressof(buf)), size, vec) != 0:
+                    raise OSError(ctypes.get_errno(), "mincore failed")
+            finally:
+                del buf
+            return sum(v & 1 for v in vec) / npages
+        finally:
+            mm.close()
+
+
+def evict(path: str) -> None:
+    with open(path, "rb+") as f:
+        os.fdatasync(f.fileno())
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def make_file(path: str, size_mb: int) -> None:
+    if os.path.exists(path) and os.path.getsize(path) == size_mb * 1024 * 1024:
+        return
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+
+
+def serve(path: str) -> float:
+    from app.services.io_policy import iter_stream
+    start = time.perf_counter()
+    for _ in iter_stream(path, 0, os.path.getsize(path)):
+        pass
+    return time.perf_counter() - start
+
+
+def run(served: str, big: str, fadvise: bool) -> dict:
+    from app.services import io_policy
+    from app.services.hash_service import _compute_sha256_and_blocks
+
+    io_policy.IO_FADVISE_ENABLED = fadvise
+    evict(served)
+    evict(big)
+    serve(served)  # réchauffe l'image servie
+    warm = resident_ratio(served)
+
+    start = time.perf_counter()
+    _compute_sha256_and_blocks(big, 4 * 1024 * 1024)
+    hash_time = time.perf_counter() - start
+
+    hit_rate = resident_ratio(served)
+    footprint = resident_ratio(big)
+    reserve_time = serve(served)
+    return {
+        "fadvise": fadvise,
+        "served_warm": warm,
+        "served_hit_rate": hit_rate,
+        "hash_footprint": footprint,
+        "hash_s": hash_time,
+        "reserve_s": reserve_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default="/tmp/isostack-bench")
+    parser.add_argument("--served-mb", type=int, default=256)
+    parser.add_argument("--big-mb", type=int, default=2048)
+    parser.add_argument("--keep", action="store_true", help="conserver les fichiers générés")
+    args = parser.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    served = os.path.join(args.dir, "netboot.img")
+    big = os.path.join(args.dir, "import.iso")
+    make_file(served, args.served_mb)
+    make_file(big, args.big_mb)
+
+    print(f"{'fadvise':>8} {'warm':>7} {'hit rate':>9} {'hash footprint':>15} {'hash s':>8} {'re-serve s':>11}")
+    try:
+        for fadvise in (False, True):
+            r = run(served, big, fadvise)
+            print(f"{str(r['fadvise']):>8} {r['served_warm']:>7.1%} {r['served_hit_rate']:>9.1%} "
+                  f"{r['hash_footprint']:>15.1%} {r['hash_s']:>8.2f} {r['reserve_s']:>11.2f}")
+    finally:
+        if not args.keep:
+            os.remove(served)
+            os.remove(big)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+"""
+Configuration lue à l'import (app/config.py) : base et stockage dans un répertoire
+temporaire, tâches de fond désactivées, avant tout import de app.
+"""
+import os
+import tempfile
+
+_directory = tempfile.mkdtemp(prefix="isos-tests-")
+os.environ.update({
+    "DB_PATH": os.path.join(_directory, "db.sqlite"),
+    "ISO_STORAGE_PATH": os.path.join(_directory, "isos"),
+    "AUTO_IMPORT_ENABLED": "false",
+    "UPDATE_CHECK_INTERVAL_HOURS": "0",
+    "DB_MAINTENANCE_INTERVAL_HOURS": "0",
+})
@@ -0,0 +1,81 @@
+"""Stockage froid : noms des versions froides, sans collision avec les images du catalogue."""
+import os
+
+import pytest
+
+from app.database import SessionLocal, init_db
+from app.models import ISO
+from app.services.cold_storage import (
+    cold_path, compress_to_cold, image_exists, image_size, is_cold_name, open_image,
+)
+from app.services.iso_service import remove_file
+from app.services.storage_service import adopt_legacy_cold, primary_root
+
+
+@pytest.fixture
+def root():
+    init_db()
+    root = primary_root()
+    os.makedirs(root, exist_ok=True)
+    yield root
+    for name in os.listdir(root):
+        os.remove(os.path.join(root, name))
+
+
+def _write(path: str, data: bytes) -> bytes:
+    with open(path, "wb") as f:
+        f.write(data)
+    return data
+
+
+def test_cold_copy_does_not_collide_with_an_uploaded_zst(root):
+    image = _write(os.path.join(root, "foo.img"), os.urandom(100_000))
+    upload = _write(os.path.join(root, "foo.img.zst"), b"not a seekable zstd file")
+
+    compress_to_cold(os.path.join(root, "foo.img"))
+
+    cold = cold_path(os.path.join(root, "foo.img"))
+    assert is_cold_name(os.path.basename(cold)) and os.path.isfile(cold)
+    with open_image(os.path.join(root, "foo.img")) as f:
+        assert f.read() == image
+    assert image_size(os.path.join(root, "foo.img.zst")) == len(upload)
+
+    remove_file("foo.img.zst", "raw")
+    assert os.path.isfile(cold)
+    remove_file("foo.img", "zstd")
+    assert not image_exists(os.path.join(root, "foo.img"))
+
+
+def test_raw_entry_never_removes_a_cold_copy(root):
+    _write(os.path.join(root, "bar.img"), os.urandom(10_000))
+    compress_to_cold(os.path.join(root, "bar.img"))
+    _write(os.path.join(root, "bar.img"), b"raw again")
+
+    remove_file("bar.img", "raw")
+    assert os.path.isfile(cold_path(os.path.join(root, "bar.img")))
+
+
+def test_freeze_refuses_an_existing_cold_copy(root):
+    _write(os.path.join(root, "baz.img"), os.urandom(10_000))
+    existing = _write(cold_path(os.path.join(root, "baz.img")), b"previous")
+
+    with pytest.raises(FileExistsError):
+        compress_to_cold(os.path.join(root, "baz.img"))
+    with open(cold_path(os.path.join(root, "baz.img")), "rb") as f:
+        assert f.read() == existing
+    assert os.path.isfile(os.path.join(root, "baz.img"))
+
+
+def test_legacy_cold_copies_are_renamed(root):
+    image = _write(os.path.join(root, "old.img"), os.urandom(50_000))
+    compress_to_cold(os.path.join(root, "old.img"))
+    os.replace(cold_path(os.path.join(root, "old.img")), os.path.join(root, "old.img.zst"))
+    db = SessionLocal()
+    db.add(ISO(name="old", filename="old.img", status="available", storage_mode="zstd"))
+    db.commit()
+    db.close()
+
+    assert adopt_legacy_cold() == 1
+    assert not os.path.exists(os.path.join(root, "old.img.zst"))
+    with open_image(os.path.join(root, "old.img")) as f:
+        assert f.read() == image
@@ -0,0 +1,79 @@
+"""Mise à jour différentielle contre un serveur HTTP local (Range) : app/services/delta_update.py."""
+import asyncio
+import functools
+import hashlib
+import random
+import threading
+from http.server import ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.services.delta_update import assemble, fetch_control, make_zsync, md4
+from bench.delta_update import RangeHandler
+
+SECTOR = 2048
+
+pytestmark = pytest.mark.skipif(md4 is None, reason="MD4 unavailable (hashlib / libcrypto)")
+
+
+@pytest.fixture
+def server(tmp_path):
+    handler = functools.partial(RangeHandler, directory=str(tmp_path))
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    RangeHandler.served = 0
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _publish(directory, v1: bytes, v2: bytes):
+    (directory / "v1.iso").write_bytes(v1)
+    (directory / "v2.iso").write_bytes(v2)
+    (directory / "v2.iso.zsync").write_bytes(make_zsync(str(directory / "v2.iso"), url="v2.iso"))
+
+
+async def _rebuild(base: str, directory) -> dict:
+    async with httpx.AsyncClient() as client:
+        control = await fetch_control(client, f"{base}/v2.iso.zsync")
+        return await assemble(control, str(directory / "v1.iso"), f"{base}/v2.iso",
+                              str(directory / "out.iso"), client)
+
+
+@pytest.mark.parametrize("shift", [37 * SECTOR, 5, 37 * SECTOR + 301])
+def test_rebuild_after_insertion(server, tmp_path, shift):
+    rng = random.Random(shift)
+    v1 = rng.randbytes(2 * 1024 * 1024)
+    insert_at = 300 * SECTOR + 17
+    v2 = v1[:insert_at] + rng.randbytes(shift) + v1[insert_at:]
+    _publish(tmp_path, v1, v2)
+
+    result = asyncio.run(_rebuild(server, tmp_path))
+
+    assert hashlib.sha1((tmp_path / "out.iso").read_bytes()).digest() == hashlib.sha1(v2).digest()
+    # bloc de l'insertion et ses voisins seulement, pas la suite décalée de l'image
+    assert result["downloaded_bytes"] <= shift + 4 * SECTOR
+    assert RangeHandler.served == result["downloaded_bytes"]
+    assert result["reused_bytes"] + result["downloaded_bytes"] == len(v2)
+
+
+def test_unrelated_image_is_fully_downloaded(server, tmp_path):
+    rng = random.Random(7)
+    v1, v2 = rng.randbytes(512 * 1024), rng.randbytes(512 * 1024 + 123)
+    _publish(tmp_path, v1, v2)
+
+    result = asyncio.run(_rebuild(server, tmp_path))
+
+    assert (tmp_path / "out.iso").read_bytes() == v2
+    assert result["reused_bytes"] == 0
+    assert result["downloaded_bytes"] == len(v2)
+
+
+def test_missing_zsync(server):
+    async def fetch():
+        async with httpx.AsyncClient() as client:
+            return await fetch_control(client, f"{server}/absent.iso.zsync")
+
+    assert asyncio.run(fetch()) is None
@@ -0,0 +1,110 @@
+"""Résolveur du garde-fou SSRF : app/services/dns_service.py."""
+import asyncio
+
+import pytest
+
+from app.services import dns_service
+from app.services.dns_service import AsyncResolver
+
+
+class StubDNS:
+    """Résolution locale comptant les requêtes ; delay pour garder une requête en cours."""
+
+    def __init__(self, records, delay: float = 0):
+        self.records, self.delay, self.calls = records, delay, []
+
+    async def __call__(self, hostname):
+        self.calls.append(hostname)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if hostname not in self.records:
+            raise OSError("not found")
+        return self.records[hostname]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(dns_service.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_cached_until_ttl_expires(clock):
+    dns = StubDNS({"mirror.example": ["93.184.216.34"]})
+    resolver = AsyncResolver(dns, ttl=60)
+
+    async def lookups():
+        first = await resolver.resolve("Mirror.Example.")
+        clock[0] += 59
+        await resolver.resolve("mirror.example")
+        assert len(dns.calls) == 1
+        clock[0] += 2
+        dns.records["mirror.example"] = ["93.184.216.35"]
+        return first, await resolver.resolve("mirror.example")
+
+    first, renewed = asyncio.run(lookups())
+    assert [str(a) for a in first] == ["93.184.216.34"]
+    assert [str(a) for a in renewed] == ["93.184.216.35"]
+    assert len(dns.calls) == 2
+
+
+def test_concurrent_lookups_share_one_query():
+    dns = StubDNS({"mirror.example": ["93.184.216.34"]}, delay=0.05)
+    resolver = AsyncResolver(dns, ttl=60)
+
+    async def lookups():
+        return await asyncio.gather(*(resolver.resolve("mirror.example") for _ in range(10)))
+
+    results = asyncio.run(lookups())
+    assert dns.calls == ["mirror.example"]
+    assert all(r == results[0] for r in results)
+    assert not resolver._inflight
+
+
+def test_failed_lookup_is_shared_and_not_cached():
+    dns = StubDNS({}, delay=0.05)
+    resolver = AsyncResolver(dns, ttl=60)
+
+    async def lookups():
+        return await asyncio.gather(*(resolver.resolve("nowhere.example") for _ in range(3)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(lookups())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert len(dns.calls) == 1
+    asyncio.run(lookups())
+    assert len(dns.calls) == 2
+
+
+def test_cache_is_bounded(clock):
+    dns = StubDNS({f"h{i}.example": ["93.184.216.34"] for i in range(10)})
+    resolver = AsyncResolver(dns, ttl=60, max_entries=3)
+
+    async def lookups():
+        for i in range(3):
+            await resolver.resolve(f"h{i}.example")
+        await resolver.resolve("h0.example")      # plus récent : h1 sera évincé
+        await resolver.resolve("h3.example")
+
+    asyncio.run(lookups())
+    assert list(resolver._cache) == ["h2.example", "h0.example", "h3.example"]
+
+    clock[0] += 61                                  # tout expire : balayé à l'insertion suivante
+    asyncio.run(resolver.resolve("h4.example"))
+    assert list(resolver._cache) == ["h4.example"]
+
+
+def test_validate_url_blocks_private_records():
+    previous = dns_service.get_resolver()
+    dns_service.set_resolver(AsyncResolver(StubDNS({
+        "internal.example": ["93.184.216.34", "10.0.0.5"],
+        "public.example": ["93.184.216.34", "2606:2800:220:1::1"],
+    })))
+    try:
+        with pytest.raises(ValueError, match="SSRF"):
+            asyncio.run(dns_service.validate_url("http://internal.example/x.iso"))
+        asyncio.run(dns_service.validate_url("https://public.example/x.iso"))
+        with pytest.raises(ValueError, match="Unsupported scheme"):
+            asyncio.run(dns_service.validate_url("file:///etc/passwd"))
+    finally:
+        dns_service.set_resolver(previous)
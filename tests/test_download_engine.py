@@ -0,0 +1,74 @@
+"""Chien de garde de débit du moteur de téléchargement : app/services/download_engine.py."""
+import asyncio
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.database import init_db
+from app.services import download_engine
+from app.services.download_engine import Stalled, Transfer
+from app.services.storage_service import primary_root
+
+FAST_SECONDS = 1.2
+TOTAL = 256 * 1024 * 1024
+
+
+class SlowsDown(BaseHTTPRequestHandler):
+    """~30 Mio/s pendant FAST_SECONDS, puis 512 octets toutes les 50 ms (~10 Kio/s)."""
+
+    dropped_at = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(TOTAL))
+        self.end_headers()
+        try:
+            start = time.monotonic()
+            while time.monotonic() - start < FAST_SECONDS:
+                self.wfile.write(b"\0" * 32768)
+                time.sleep(0.001)
+            SlowsDown.dropped_at = time.monotonic()
+            while time.monotonic() - start < 30:
+                self.wfile.write(b"\0" * 512)
+                self.wfile.flush()
+                time.sleep(0.05)
+        except OSError:
+            pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), SlowsDown)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/x.iso"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_stall_detected_after_a_fast_phase(server, monkeypatch):
+    init_db()
+    monkeypatch.setattr(download_engine, "DOWNLOAD_STALL_WINDOW", 0.5)
+    monkeypatch.setattr(download_engine, "DOWNLOAD_MIN_SPEED", 256 * 1024)
+    transfer = Transfer(0, os.path.join(primary_root(), "stall-test.iso"), primary_root(), None)
+
+    async def fetch():
+        async with httpx.AsyncClient(timeout=10) as client:
+            await transfer.fetch(client, server)
+
+    try:
+        with pytest.raises(Stalled):
+            asyncio.run(fetch())
+        # lecture déjà à READ_CHUNK_MAX : le ralentissement est vu en une ou deux fenêtres
+        assert time.monotonic() - SlowsDown.dropped_at < 5
+        assert transfer.throughput > 8 * 1024 * 1024
+    finally:
+        transfer.close()
+        transfer.reservation.release()
+        os.remove(transfer.dest_path)
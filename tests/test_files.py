@@ -0,0 +1,59 @@
+"""Service /files : images brutes et froides, Range, admission des flux."""
+import asyncio
+import os
+
+import httpx
+import pytest
+
+from app.main import app
+from app.services import serving
+from app.services.cold_storage import compress_to_cold
+from app.services.file_cache import file_cache
+from app.services.storage_service import primary_root
+from app.services.worker_state import WorkerState
+
+
+@pytest.fixture
+def images(tmp_path, monkeypatch):
+    monkeypatch.setattr(serving.shared_streams, "_state", WorkerState(str(tmp_path / "streams"), "test"))
+    monkeypatch.setattr(file_cache, "max_file_bytes", 0)
+    root = primary_root()
+    os.makedirs(root, exist_ok=True)
+    data = os.urandom(300_000)
+    for name in ("raw.img", "cold.img"):
+        with open(os.path.join(root, name), "wb") as f:
+            f.write(data)
+    compress_to_cold(os.path.join(root, "cold.img"))
+    yield data
+    for name in os.listdir(root):
+        os.remove(os.path.join(root, name))
+
+
+async def _get(path, headers=None):
+    transport = httpx.ASGITransport(app=app, client=("10.0.0.1", 1234))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get(path, headers=headers)
+
+
+@pytest.mark.parametrize("name", ["raw.img", "cold.img"])
+def test_serves_raw_and_cold_images(images, name):
+    full = asyncio.run(_get(f"/files/{name}"))
+    assert full.status_code == 200 and full.content == images
+    part = asyncio.run(_get(f"/files/{name}", {"Range": "bytes=1000-1999"}))
+    assert part.status_code == 206 and part.content == images[1000:2000]
+    assert serving.stream_stats()["active_all_workers"] == 0
+
+
+def test_missing_image(images):
+    assert asyncio.run(_get("/files/absent.img")).status_code == 404
+
+
+def test_rejected_when_the_limit_is_reached(images, monkeypatch):
+    monkeypatch.setattr(serving, "FILES_MAX_STREAMS", 1)
+    ticket = serving.admit("10.0.0.2")
+    try:
+        response = asyncio.run(_get("/files/raw.img"))
+        assert response.status_code == 503 and "Retry-After" in response.headers
+    finally:
+        ticket.release()
+    assert asyncio.run(_get("/files/raw.img")).status_code == 200
@@ -0,0 +1,79 @@
+"""Admission des flux /files partagée entre workers : app/services/serving.py."""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app.services import serving
+
+
+@pytest.fixture
+def workers(tmp_path, monkeypatch):
+    """Fichier d'état propre ; write({pid: (actifs, {client: n})}) simule les autres workers."""
+    monkeypatch.setattr(serving, "shared_streams", serving.SharedStreams(str(tmp_path / "streams")))
+    monkeypatch.setattr(serving, "_active_streams", 0)
+    monkeypatch.setattr(serving, "_per_client", {})
+
+    def write(records):
+        with open(serving.shared_streams.path, "w") as f:
+            json.dump({str(pid): {"active": active, "clients": clients}
+                       for pid, (active, clients) in records.items()}, f)
+
+    return write
+
+
+def _limits(monkeypatch, total, per_client):
+    monkeypatch.setattr(serving, "FILES_MAX_STREAMS", total)
+    monkeypatch.setattr(serving, "FILES_MAX_STREAMS_PER_CLIENT", per_client)
+
+
+def test_global_limit_counts_other_workers(workers, monkeypatch):
+    _limits(monkeypatch, 3, 0)
+    workers({os.getppid(): (2, {"10.0.0.1": 2})})
+
+    ticket = serving.admit("10.0.0.2")
+    assert ticket is not None
+    assert serving.admit("10.0.0.2") is None
+    assert serving.stream_stats()["active_all_workers"] == 3
+
+    ticket.release()
+    with open(serving.shared_streams.path) as f:
+        assert str(os.getpid()) not in json.load(f)
+    assert serving.admit("10.0.0.3") is not None
+
+
+def test_per_client_limit_counts_other_workers(workers, monkeypatch):
+    _limits(monkeypatch, 0, 2)
+    workers({os.getppid(): (1, {"10.0.0.1": 1})})
+
+    ticket = serving.admit("10.0.0.1")
+    assert ticket is not None
+    assert serving.admit("10.0.0.1") is None
+    assert serving.admit("10.0.0.9") is not None
+    ticket.release()
+
+
+def test_dead_workers_are_ignored(workers, monkeypatch):
+    _limits(monkeypatch, 1, 0)
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    workers({dead.pid: (5, {"10.0.0.1": 5})})
+
+    ticket = serving.admit("10.0.0.1")
+    assert ticket is not None
+    with open(serving.shared_streams.path) as f:
+        assert list(json.load(f)) == [str(os.getpid())]
+    ticket.release()
+
+
+def test_active_streams_seen_by_the_scrubber(workers, monkeypatch):
+    _limits(monkeypatch, 0, 0)
+    workers({os.getppid(): (3, {"10.0.0.1": 3})})
+    assert serving.active_streams() == 3
+
+    ticket = serving.admit("10.0.0.2")
+    assert serving.active_streams() == 4
+    ticket.release()
+    assert serving.active_streams() == 3
@@ -0,0 +1,60 @@
+"""Réservations d'espace partagées entre workers : app/services/storage_service.py."""
+import json
+import os
+import shutil
+
+import pytest
+
+from app.services import storage_service
+from app.services.storage_service import InsufficientStorage, primary_root, reserve, reserved_bytes
+from app.services.worker_state import WorkerState
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    """Registre propre ; write(records) simule les réservations d'un autre worker vivant."""
+    os.makedirs(primary_root(), exist_ok=True)
+    monkeypatch.setattr(storage_service, "_shared", WorkerState(str(tmp_path / "reservations"), "test"))
+    monkeypatch.setattr(storage_service, "_reservations", {})
+    monkeypatch.setattr(storage_service, "MAX_DISK_USAGE_PCT", 99)
+
+    def write(records):
+        with open(storage_service._shared.path, "w") as f:
+            json.dump({str(os.getppid()): records}, f)
+
+    return write
+
+
+def _read(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def test_reservations_are_published_and_withdrawn(ledger):
+    with reserve(1024 * 1024, primary_root()) as reservation:
+        records = _read(storage_service._shared.path)[str(os.getpid())]
+        assert records == [{"dev": os.stat(primary_root()).st_dev, "size": reservation.size, "path": None}]
+    assert str(os.getpid()) not in _read(storage_service._shared.path)
+
+
+def test_other_workers_reservations_count_against_the_quota(ledger):
+    dev = os.stat(primary_root()).st_dev
+    total = shutil.disk_usage(primary_root()).total
+    ledger([{"dev": dev, "size": total, "path": None}])
+
+    assert reserved_bytes(primary_root()) >= total
+    with pytest.raises(InsufficientStorage):
+        reserve(1024 * 1024, primary_root())
+
+
+def test_other_workers_written_bytes_are_not_counted_twice(ledger):
+    dev = os.stat(primary_root()).st_dev
+    written = os.path.join(primary_root(), "other-worker.iso")
+    with open(written, "wb") as f:
+        f.write(os.urandom(256 * 1024))
+    try:
+        ledger([{"dev": dev, "size": 1024 * 1024, "path": written}])
+        pending = reserved_bytes(primary_root())
+        assert 0 < pending <= 1024 * 1024 - 256 * 1024
+    finally:
+        os.remove(written)